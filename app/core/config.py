@@ -36,7 +36,29 @@ class Settings(BaseSettings):
     TRIPAY_MERCHANT_CODE: str
     TRIPAY_API_KEY: str
     TRIPAY_PRIVATE_KEY: str
-    
+
+    # Nearby Cache Configuration
+    NEARBY_CACHE_ENABLED: bool = True
+    NEARBY_CACHE_TTL_SECONDS: int = 30
+    NEARBY_CACHE_MAXSIZE: int = 2048
+    NEARBY_CACHE_GEOHASH_PRECISION: int = 7  # ~150m x 150m per tile
+
+    # In-memory Spatial Index Configuration
+    SPATIAL_INDEX_ENABLED: bool = False
+    SPATIAL_INDEX_RESYNC_SECONDS: int = 300
+    SPATIAL_INDEX_CELL_DEGREES: float = 0.01  # ~1.1km per sel grid
+
+    # View Counter Configuration
+    VIEW_COUNTER_ENABLED: bool = True
+    VIEW_COUNTER_FLUSH_SECONDS: int = 10
+
+    # Listing Archive Configuration
+    LISTING_ARCHIVE_AFTER_DAYS: int = 90  # Lapak inactive yang tidak berubah selama ini dipindah ke arsip
+
+    # Borongan Events (SSE) Configuration
+    BORONGAN_EVENTS_KEEPALIVE_SECONDS: int = 15
+    BORONGAN_EVENTS_MAX_STREAM_SECONDS: int = 600  # Stream ditutup lalu EventSource klien menyambung ulang
+
     class Config:
         env_file = ".env"
 
@@ -1,6 +1,7 @@
 # app/core/dependencies.py
 
 from fastapi import Depends, HTTPException, status
+from typing import Optional
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from supabase import Client
 import jwt
@@ -10,6 +11,8 @@ from .config import settings
 
 # Gunakan skema HTTPBearer yang lebih sederhana
 bearer_scheme = HTTPBearer()
+# Versi opsional: tidak melempar 403 jika header Authorization tidak ada
+optional_bearer_scheme = HTTPBearer(auto_error=False)
 
 def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme)):
     """
@@ -59,4 +62,19 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(bearer_
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
-        ) 
\ No newline at end of file
+        )
+
+def get_optional_user(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_bearer_scheme)
+):
+    """
+    Seperti get_current_user, tetapi mengembalikan None untuk request tanpa
+    token atau dengan token tidak valid. Untuk endpoint publik yang
+    perilakunya sedikit berbeda bagi user yang login.
+    """
+    if credentials is None:
+        return None
+    try:
+        return get_current_user(credentials)
+    except HTTPException:
+        return None
@@ -0,0 +1,38 @@
+# app/core/etag.py
+
+from datetime import datetime
+from typing import Optional
+
+from fastapi import Response
+
+
+def make_etag(*parts) -> str:
+    """
+    Membuat strong ETag dari penanda versi sebuah resource
+    (mis. updated_at lapak atau kolom version borongan).
+    """
+    values = []
+    for part in parts:
+        if isinstance(part, datetime):
+            # Mikrodetik sejak epoch agar tidak bergantung pada format zona waktu
+            part = int(part.timestamp() * 1_000_000)
+        values.append(str(part))
+    return '"' + "-".join(values) + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Mengecek header If-None-Match terhadap ETag saat ini.
+    Sesuai RFC 9110, If-None-Match memakai perbandingan lemah (prefix W/ diabaikan).
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (candidate.strip() for candidate in if_none_match.split(","))
+    return any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+
+def not_modified(etag: str) -> Response:
+    """Respons 304 tanpa body untuk conditional GET yang cocok."""
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
@@ -0,0 +1,452 @@
+# app/core/migrations.py
+
+import logging
+from typing import List, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Migrasi skema yang dijalankan berurutan saat startup, setelah create_all.
+# create_all hanya membuat tabel baru, jadi perubahan pada tabel yang sudah ada
+# (kolom baru, index, extension, trigger) didefinisikan di sini.
+# Setiap statement harus idempotent (IF NOT EXISTS / OR REPLACE) karena
+# database baru sudah memiliki kolom-kolom dari model.
+MIGRATIONS: List[Tuple[str, List[str]]] = [
+    ("0001_listings_search", [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        """
+        ALTER TABLE listings ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('indonesian'::regconfig, coalesce(title, '')), 'A') ||
+            setweight(to_tsvector('indonesian'::regconfig, coalesce(description, '')), 'B')
+        ) STORED
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_listings_search_vector ON listings USING gin (search_vector)",
+        "CREATE INDEX IF NOT EXISTS ix_listings_title_trgm ON listings USING gin (title gin_trgm_ops)",
+    ]),
+    ("0002_listings_filter_indexes", [
+        # Feed nearby hampir selalu memfilter status='available'; index parsial ini
+        # lebih kecil dari index GiST penuh dan tidak memuat lapak yang sudah habis
+        """
+        CREATE INDEX IF NOT EXISTS ix_listings_available_location
+        ON listings USING gist (location) WHERE status = 'available'
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_listings_status_price ON listings (status, price)",
+        "CREATE INDEX IF NOT EXISTS ix_listings_status_unit_price ON listings (status, unit, price)",
+    ]),
+    ("0003_coordinate_columns", [
+        # Salinan longitude/latitude dari kolom location agar endpoint baca tidak perlu
+        # cast geography -> geometry + ST_X/ST_Y per baris. Diisi oleh trigger di bawah,
+        # sehingga tulisan langsung ke kolom ini ikut ditimpa (dipersempit oleh 0015).
+        "ALTER TABLE listings ADD COLUMN IF NOT EXISTS longitude DOUBLE PRECISION",
+        "ALTER TABLE listings ADD COLUMN IF NOT EXISTS latitude DOUBLE PRECISION",
+        "ALTER TABLE profiles ADD COLUMN IF NOT EXISTS longitude DOUBLE PRECISION",
+        "ALTER TABLE profiles ADD COLUMN IF NOT EXISTS latitude DOUBLE PRECISION",
+        """
+        CREATE OR REPLACE FUNCTION set_coordinates_from_location() RETURNS trigger AS $$
+        BEGIN
+            NEW.longitude := ST_X(NEW.location::geometry);
+            NEW.latitude := ST_Y(NEW.location::geometry);
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        "DROP TRIGGER IF EXISTS trg_listings_coordinates ON listings",
+        """
+        CREATE TRIGGER trg_listings_coordinates BEFORE INSERT OR UPDATE ON listings
+        FOR EACH ROW EXECUTE FUNCTION set_coordinates_from_location()
+        """,
+        "DROP TRIGGER IF EXISTS trg_profiles_coordinates ON profiles",
+        """
+        CREATE TRIGGER trg_profiles_coordinates BEFORE INSERT OR UPDATE ON profiles
+        FOR EACH ROW EXECUTE FUNCTION set_coordinates_from_location()
+        """,
+    ]),
+    ("0004_group_buys_version", [
+        # Penanda versi untuk ETag detail borongan. Dinaikkan oleh trigger agar
+        # UPDATE dari mana pun (ORM, SQL mentah, job) selalu mengubah ETag.
+        "ALTER TABLE group_buys ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1",
+        """
+        CREATE OR REPLACE FUNCTION bump_row_version() RETURNS trigger AS $$
+        BEGIN
+            NEW.version := OLD.version + 1;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        "DROP TRIGGER IF EXISTS trg_group_buys_version ON group_buys",
+        """
+        CREATE TRIGGER trg_group_buys_version BEFORE UPDATE ON group_buys
+        FOR EACH ROW EXECUTE FUNCTION bump_row_version()
+        """,
+    ]),
+    ("0005_listings_seller_indexes", [
+        # /lapak/my (filter status) dan /lapak/my/summary (group by status)
+        "CREATE INDEX IF NOT EXISTS ix_listings_seller_status_created ON listings (seller_id, status, created_at, id)",
+        # /lapak/my tanpa filter status, keyset pada (created_at, id)
+        "CREATE INDEX IF NOT EXISTS ix_listings_seller_created ON listings (seller_id, created_at, id)",
+    ]),
+    ("0006_maintenance_checkpoints", [
+        # Progres job maintenance bertahap (app/services/maintenance.py) agar bisa dilanjutkan
+        """
+        CREATE TABLE IF NOT EXISTS maintenance_checkpoints (
+            job_name VARCHAR(100) PRIMARY KEY,
+            phase VARCHAR(50) NOT NULL,
+            last_id UUID NOT NULL,
+            scanned BIGINT NOT NULL DEFAULT 0,
+            updated BIGINT NOT NULL DEFAULT 0,
+            status VARCHAR(20) NOT NULL,
+            default_lat DOUBLE PRECISION,
+            default_lon DOUBLE PRECISION,
+            started_at TIMESTAMPTZ,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            finished_at TIMESTAMPTZ
+        )
+        """,
+    ]),
+    ("0007_listings_rank_score", [
+        # Skor feed /lapak/nearby?sort=ranked: kebaruan (meluruh dengan konstanta 7 hari),
+        # stok (log, jenuh di 50 unit) dan reputasi penjual (jenuh di 100).
+        # STABLE karena memakai now(); skor diperbarui berkala oleh job decay.
+        "ALTER TABLE listings ADD COLUMN IF NOT EXISTS rank_score DOUBLE PRECISION",
+        """
+        CREATE OR REPLACE FUNCTION listing_rank_score(
+            created_at TIMESTAMPTZ, stock_quantity INTEGER, reputation_score INTEGER
+        ) RETURNS DOUBLE PRECISION AS $$
+            SELECT
+                0.5 * exp(-greatest(extract(epoch FROM now() - coalesce(created_at, now())), 0) / 604800.0)
+                + 0.2 * least(ln(1 + greatest(coalesce(stock_quantity, 0), 0)) / ln(51), 1)
+                + 0.3 * least(greatest(coalesce(reputation_score, 0), 0), 100) / 100.0
+        $$ LANGUAGE sql STABLE
+        """,
+        """
+        CREATE OR REPLACE FUNCTION set_listing_rank_score() RETURNS trigger AS $$
+        BEGIN
+            NEW.rank_score := listing_rank_score(
+                NEW.created_at,
+                NEW.stock_quantity,
+                (SELECT reputation_score FROM profiles WHERE id = NEW.seller_id)
+            );
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        "DROP TRIGGER IF EXISTS trg_listings_rank_score ON listings",
+        """
+        CREATE TRIGGER trg_listings_rank_score
+        BEFORE INSERT OR UPDATE OF created_at, stock_quantity, seller_id, status ON listings
+        FOR EACH ROW EXECUTE FUNCTION set_listing_rank_score()
+        """,
+        """
+        CREATE OR REPLACE FUNCTION refresh_seller_rank_scores() RETURNS trigger AS $$
+        BEGIN
+            UPDATE listings
+            SET rank_score = listing_rank_score(created_at, stock_quantity, NEW.reputation_score)
+            WHERE seller_id = NEW.id;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        "DROP TRIGGER IF EXISTS trg_profiles_rank_score ON profiles",
+        """
+        CREATE TRIGGER trg_profiles_rank_score
+        AFTER UPDATE OF reputation_score ON profiles
+        FOR EACH ROW WHEN (OLD.reputation_score IS DISTINCT FROM NEW.reputation_score)
+        EXECUTE FUNCTION refresh_seller_rank_scores()
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS ix_listings_available_rank
+        ON listings (rank_score DESC, id DESC) WHERE status = 'available'
+        """,
+    ]),
+    ("0008_listing_views", [
+        # Total view ditulis berkala oleh app/services/view_counter.py (write-behind)
+        "ALTER TABLE listings ADD COLUMN IF NOT EXISTS view_count BIGINT NOT NULL DEFAULT 0",
+        # Sketch HyperLogLog viewer unik per lapak per hari. Tanpa foreign key agar
+        # statistik tetap ada dan flush tidak gagal jika lapak dipindah/dihapus.
+        """
+        CREATE TABLE IF NOT EXISTS listing_view_sketches (
+            listing_id UUID NOT NULL,
+            day DATE NOT NULL,
+            registers BYTEA NOT NULL,
+            PRIMARY KEY (listing_id, day)
+        )
+        """,
+        # Gabungan dua sketch = nilai maksimum per register
+        """
+        CREATE OR REPLACE FUNCTION hll_merge(a BYTEA, b BYTEA) RETURNS BYTEA AS $$
+        DECLARE
+            result BYTEA := a;
+        BEGIN
+            IF a IS NULL THEN
+                RETURN b;
+            END IF;
+            FOR i IN 0 .. length(a) - 1 LOOP
+                IF get_byte(b, i) > get_byte(result, i) THEN
+                    result := set_byte(result, i, get_byte(b, i));
+                END IF;
+            END LOOP;
+            RETURN result;
+        END;
+        $$ LANGUAGE plpgsql IMMUTABLE
+        """,
+    ]),
+    ("0009_listings_archive", [
+        # Tabel listings_archive dibuat oleh create_all (model ListingArchive).
+        # Index ini dipakai job arsip untuk menemukan lapak yang sudah tidak dijual
+        # dan lama tidak berubah, tanpa memindai lapak 'available'.
+        """
+        CREATE INDEX IF NOT EXISTS ix_listings_unavailable_touched_at
+        ON listings ((coalesce(updated_at, created_at))) WHERE status <> 'available'
+        """,
+    ]),
+    ("0010_group_buys_participant_totals", [
+        # Diisi untuk baris lama oleh backfill 0010 di bawah, lalu dijaga oleh
+        # join_borongan dan webhook pembayaran (lihat model GroupBuy)
+        "ALTER TABLE group_buys ADD COLUMN IF NOT EXISTS participants_count INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE group_buys ADD COLUMN IF NOT EXISTS paid_quantity INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE group_buys ADD COLUMN IF NOT EXISTS pending_quantity INTEGER NOT NULL DEFAULT 0",
+    ]),
+    ("0011_group_buys_active_indexes", [
+        # GET /borongan/ hanya membaca borongan 'active'; satu index parsial per
+        # pilihan sort, dengan id sebagai tie-breaker keyset pagination
+        """
+        CREATE INDEX IF NOT EXISTS ix_group_buys_active_deadline
+        ON group_buys (deadline, id) WHERE status = 'active'
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS ix_group_buys_active_created
+        ON group_buys (created_at DESC, id DESC) WHERE status = 'active'
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS ix_group_buys_active_remaining
+        ON group_buys ((target_quantity - current_quantity), id) WHERE status = 'active'
+        """,
+    ]),
+    ("0012_group_buys_pickup_location", [
+        # Diisi untuk baris lama dari lokasi profil supplier oleh backfill 0012
+        "ALTER TABLE group_buys ADD COLUMN IF NOT EXISTS pickup_location geography(POINT, 4326)",
+        # /borongan/nearby hanya mencari borongan 'active'
+        """
+        CREATE INDEX IF NOT EXISTS ix_group_buys_active_pickup_location
+        ON group_buys USING gist (pickup_location) WHERE status = 'active'
+        """,
+    ]),
+    ("0013_group_buys_progress_notify", [
+        # Event progress untuk /borongan/{id}/events. NOTIFY baru terkirim saat
+        # transaksi commit, jadi join yang di-rollback tidak pernah muncul di stream.
+        # Dipicu dari mana pun group_buys diubah (join, webhook, job deadline, repair).
+        """
+        CREATE OR REPLACE FUNCTION notify_group_buy_progress() RETURNS trigger AS $$
+        BEGIN
+            IF NEW.current_quantity IS DISTINCT FROM OLD.current_quantity
+               OR NEW.participants_count IS DISTINCT FROM OLD.participants_count
+               OR NEW.status IS DISTINCT FROM OLD.status THEN
+                PERFORM pg_notify('borongan_events', json_build_object(
+                    'id', NEW.id,
+                    'current_quantity', NEW.current_quantity,
+                    'target_quantity', NEW.target_quantity,
+                    'participants_count', NEW.participants_count,
+                    'status', NEW.status,
+                    'version', NEW.version
+                )::text);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        "DROP TRIGGER IF EXISTS trg_group_buys_progress_notify ON group_buys",
+        """
+        CREATE TRIGGER trg_group_buys_progress_notify AFTER UPDATE ON group_buys
+        FOR EACH ROW EXECUTE FUNCTION notify_group_buy_progress()
+        """,
+    ]),
+    ("0014_listings_archive_inactive_only", [
+        # Job arsip hanya memindahkan lapak 'inactive'; lapak sold_out tetap di
+        # listings agar penjual bisa menambah stok kembali
+        """
+        CREATE INDEX IF NOT EXISTS ix_listings_inactive_touched_at
+        ON listings ((coalesce(updated_at, created_at))) WHERE status = 'inactive'
+        """,
+        "DROP INDEX IF EXISTS ix_listings_unavailable_touched_at",
+    ]),
+    ("0015_coordinate_triggers_on_location_only", [
+        # Trigger 0003 berjalan pada setiap UPDATE (status, stok, view_count, rank_score)
+        # dan menghitung ulang ST_X/ST_Y tanpa perlu. Cukup saat location berubah,
+        # atau saat longitude/latitude ditulis langsung agar tetap ditimpa dari location.
+        "DROP TRIGGER IF EXISTS trg_listings_coordinates ON listings",
+        """
+        CREATE TRIGGER trg_listings_coordinates
+        BEFORE INSERT OR UPDATE OF location, longitude, latitude ON listings
+        FOR EACH ROW EXECUTE FUNCTION set_coordinates_from_location()
+        """,
+        "DROP TRIGGER IF EXISTS trg_profiles_coordinates ON profiles",
+        """
+        CREATE TRIGGER trg_profiles_coordinates
+        BEFORE INSERT OR UPDATE OF location, longitude, latitude ON profiles
+        FOR EACH ROW EXECUTE FUNCTION set_coordinates_from_location()
+        """,
+    ]),
+]
+
+# Backfill data untuk baris lama, dijalankan setelah MIGRATIONS. Setiap batch
+# berjalan di transaksi sendiri sehingga tabel besar tidak terkunci lama dan
+# instance lain (SKIP LOCKED) bisa ikut mengerjakan batch berikutnya.
+# Statement diulang sampai tidak ada baris yang berubah, lalu dicatat di
+# schema_migrations agar tidak dipindai ulang pada startup berikutnya.
+BACKFILL_BATCH_SIZE = 5000
+
+BACKFILLS: List[Tuple[str, str]] = [
+    ("0003_backfill_listing_coordinates", """
+        UPDATE listings SET
+            longitude = ST_X(location::geometry),
+            latitude = ST_Y(location::geometry)
+        WHERE id IN (
+            SELECT id FROM listings
+            WHERE longitude IS NULL AND location IS NOT NULL
+            LIMIT :batch_size
+            FOR UPDATE SKIP LOCKED
+        )
+    """),
+    ("0003_backfill_profile_coordinates", """
+        UPDATE profiles SET
+            longitude = ST_X(location::geometry),
+            latitude = ST_Y(location::geometry)
+        WHERE id IN (
+            SELECT id FROM profiles
+            WHERE longitude IS NULL AND location IS NOT NULL
+            LIMIT :batch_size
+            FOR UPDATE SKIP LOCKED
+        )
+    """),
+    ("0007_backfill_listing_rank_scores", """
+        UPDATE listings l SET
+            rank_score = listing_rank_score(l.created_at, l.stock_quantity, p.reputation_score)
+        FROM profiles p
+        WHERE p.id = l.seller_id
+        AND l.id IN (
+            SELECT id FROM listings
+            WHERE rank_score IS NULL
+            LIMIT :batch_size
+            FOR UPDATE SKIP LOCKED
+        )
+    """),
+    ("0010_backfill_group_buy_totals", """
+        WITH batch AS (
+            SELECT g.id FROM group_buys g
+            WHERE g.participants_count = 0
+            AND EXISTS (
+                SELECT 1 FROM group_buy_participants p
+                WHERE p.group_buy_id = g.id AND p.payment_status IN ('pending', 'paid')
+            )
+            LIMIT :batch_size
+            FOR UPDATE SKIP LOCKED
+        ), totals AS (
+            SELECT
+                p.group_buy_id,
+                count(*) FILTER (WHERE p.payment_status IN ('pending', 'paid')) AS participants_count,
+                coalesce(sum(p.quantity_ordered) FILTER (WHERE p.payment_status = 'paid'), 0) AS paid_quantity,
+                coalesce(sum(p.quantity_ordered) FILTER (WHERE p.payment_status = 'pending'), 0) AS pending_quantity
+            FROM group_buy_participants p
+            JOIN batch ON batch.id = p.group_buy_id
+            GROUP BY p.group_buy_id
+        )
+        UPDATE group_buys g SET
+            participants_count = t.participants_count,
+            paid_quantity = t.paid_quantity,
+            pending_quantity = t.pending_quantity
+        FROM totals t
+        WHERE g.id = t.group_buy_id
+    """),
+    ("0012_backfill_group_buy_pickup_locations", """
+        UPDATE group_buys g SET pickup_location = p.location
+        FROM profiles p
+        WHERE p.id = g.supplier_id
+        AND g.id IN (
+            SELECT g2.id FROM group_buys g2
+            JOIN profiles p2 ON p2.id = g2.supplier_id
+            WHERE g2.pickup_location IS NULL AND p2.location IS NOT NULL
+            LIMIT :batch_size
+            FOR UPDATE OF g2 SKIP LOCKED
+        )
+    """),
+    # Lapak sold_out yang sempat diarsipkan sebelum 0014 dikembalikan ke listings
+    # agar penjual bisa menambah stoknya lagi (kolom sama dengan ARCHIVE_COLUMNS;
+    # rank_score dan search_vector diisi ulang oleh trigger dan kolom generated)
+    ("0014_backfill_restore_sold_out_listings", """
+        WITH moved AS (
+            DELETE FROM listings_archive
+            WHERE id IN (
+                SELECT id FROM listings_archive
+                WHERE status = 'sold_out'
+                LIMIT :batch_size
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id, seller_id, title, description, price, unit, stock_quantity,
+                      image_urls, status, location, longitude, latitude, view_count,
+                      created_at, updated_at
+        )
+        INSERT INTO listings (id, seller_id, title, description, price, unit, stock_quantity,
+                              image_urls, status, location, longitude, latitude, view_count,
+                              created_at, updated_at)
+        SELECT id, seller_id, title, description, price, unit, stock_quantity,
+               image_urls, status, location, longitude, latitude, view_count,
+               created_at, updated_at
+        FROM moved
+    """),
+]
+
+
+def run_migrations(engine: Engine) -> None:
+    """
+    Menjalankan migrasi dan backfill yang belum tercatat di tabel schema_migrations.
+    Advisory lock mencegah beberapa instance menjalankan migrasi yang sama bersamaan.
+    """
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "name VARCHAR(100) PRIMARY KEY, "
+            "applied_at TIMESTAMPTZ NOT NULL DEFAULT now())"
+        ))
+
+    for name, statements in MIGRATIONS:
+        with engine.begin() as conn:
+            conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('schema_migrations'))"))
+            already_applied = conn.execute(
+                text("SELECT 1 FROM schema_migrations WHERE name = :name"),
+                {"name": name}
+            ).first()
+            if already_applied:
+                continue
+
+            for statement in statements:
+                conn.execute(text(statement))
+            conn.execute(text("INSERT INTO schema_migrations (name) VALUES (:name)"), {"name": name})
+            logger.info(f"✅ Applied migration {name}")
+
+    for name, statement in BACKFILLS:
+        with engine.begin() as conn:
+            already_applied = conn.execute(
+                text("SELECT 1 FROM schema_migrations WHERE name = :name"),
+                {"name": name}
+            ).first()
+        if already_applied:
+            continue
+
+        total_updated = 0
+        while True:
+            with engine.begin() as conn:
+                updated = conn.execute(text(statement), {"batch_size": BACKFILL_BATCH_SIZE}).rowcount
+            total_updated += updated
+            if not updated:
+                break
+            logger.info(f"⏳ Backfill {name}: {total_updated} rows updated")
+
+        with engine.begin() as conn:
+            conn.execute(
+                text("INSERT INTO schema_migrations (name) VALUES (:name) ON CONFLICT (name) DO NOTHING"),
+                {"name": name}
+            )
+        logger.info(f"✅ Applied backfill {name} ({total_updated} rows)")
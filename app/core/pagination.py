@@ -0,0 +1,33 @@
+# app/core/pagination.py
+
+import base64
+import binascii
+import json
+from typing import Any, List
+
+from fastapi import HTTPException
+
+
+def encode_cursor(values: List[Any]) -> str:
+    """
+    Mengubah nilai kunci urutan dari baris terakhir menjadi cursor opaque
+    (base64 url-safe dari JSON) untuk keyset pagination.
+    """
+    raw = json.dumps(values, default=str, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    """
+    Kebalikan dari encode_cursor. Melempar HTTPException 400 jika cursor
+    rusak atau jumlah nilainya tidak sesuai dengan yang diharapkan.
+    """
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, binascii.Error, UnicodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
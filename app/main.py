@@ -29,13 +29,18 @@ try:
             
         # Import models to register them with SQLAlchemy Base
         from .models.profile import Profile
-        from .models.listing import Listing
+        from .models.listing import Listing, ListingArchive
         from .models.group_buy import GroupBuy
         from .models.group_buy_participant import GroupBuyParticipant
         
         # Create tables if database is available
         Base.metadata.create_all(bind=engine)
         logger.info("✅ Database tables created/verified")
+
+        # Terapkan perubahan skema untuk tabel yang sudah ada (kolom, index, extension)
+        from .core.migrations import run_migrations
+        run_migrations(engine)
+        logger.info("✅ Database migrations applied")
     else:
         logger.info("ℹ️ Database initialization skipped (SKIP_DB_INIT=true)")
         
@@ -43,6 +48,18 @@ except Exception as e:
     logger.warning(f"⚠️ Database not available: {e}")
     DB_AVAILABLE = False
 
+# Bulk load index spasial in-memory untuk /lapak/nearby?engine=memory
+if DB_AVAILABLE:
+    try:
+        from .core.config import settings
+        if settings.SPATIAL_INDEX_ENABLED:
+            from .services.spatial_index import spatial_index
+            with SessionLocal() as db:
+                loaded_count = spatial_index.sync_from_db(db)
+            logger.info(f"✅ Spatial index loaded with {loaded_count} listings")
+    except Exception as e:
+        logger.warning(f"⚠️ Spatial index not loaded, will retry on first use: {e}")
+
 # Create FastAPI instance
 app = FastAPI(
     title="Warung Warga API",
@@ -64,6 +81,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Tulis sisa view counter yang masih di buffer dan hentikan listener event borongan
+@app.on_event("shutdown")
+def stop_background_workers():
+    if DB_AVAILABLE:
+        from .services.view_counter import view_counter
+        view_counter.stop()
+        from .services.borongan_events import borongan_events
+        borongan_events.stop()
+
 # Create custom database dependency that handles unavailable database
 def get_db_safe():
     """Database dependency that handles unavailable database gracefully"""
@@ -168,8 +194,8 @@ async def api_info():
         "/", "/health", "/db-status", "/info", "/docs",
         "/auth/register", "/auth/login",
         "/users/users/me",
-        "/lapak/analyze", "/lapak", "/lapak/nearby", "/lapak/{listing_id}",
-        "/borongan/", "/borongan/{borongan_id}", "/borongan/{group_buy_id}/join",
+        "/lapak/analyze", "/lapak", "/lapak/bulk", "/lapak/bulk/csv", "/lapak/nearby", "/lapak/nearby/stream", "/lapak/clusters", "/lapak/search", "/lapak/batch", "/lapak/my", "/lapak/my/summary", "/lapak/{listing_id}", "/lapak/{listing_id}/reserve", "/lapak/{listing_id}/stats",
+        "/borongan/", "/borongan/nearby", "/borongan/{borongan_id}", "/borongan/{borongan_id}/events", "/borongan/{group_buy_id}/join",
         "/payments/tripay/webhook", "/payments/tripay/status/{participant_id}",
         "/payments/methods", "/payments/status/{participant_id}"
     ]
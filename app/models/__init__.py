@@ -1,4 +1,4 @@
 # This file makes the models directory a Python package 
 
 from .profile import Profile
-from .listing import Listing 
\ No newline at end of file
+from .listing import Listing, ListingArchive 
\ No newline at end of file
@@ -1,6 +1,7 @@
 import uuid
-from sqlalchemy import Column, String, Integer, DateTime, func, Text, ForeignKey, DECIMAL
+from sqlalchemy import Column, String, Integer, DateTime, func, Text, ForeignKey, DECIMAL, FetchedValue, text
 from sqlalchemy.dialects.postgresql import UUID
+from geoalchemy2 import Geography
 from sqlalchemy.orm import relationship
 
 from ..core.database import Base
@@ -20,12 +21,27 @@ class GroupBuy(Base):
     
     target_quantity = Column(Integer, nullable=False)
     current_quantity = Column(Integer, nullable=False, default=0)
+
+    # Ringkasan partisipan aktif (pending + paid), diperbarui dalam transaksi yang sama
+    # dengan join dan perubahan status pembayaran, sehingga daftar dan detail borongan
+    # tidak perlu menghitung ulang dari group_buy_participants.
+    # current_quantity = paid_quantity + pending_quantity
+    participants_count = Column(Integer, nullable=False, default=0)
+    paid_quantity = Column(Integer, nullable=False, default=0)
+    pending_quantity = Column(Integer, nullable=False, default=0)
     
     deadline = Column(DateTime(timezone=True), nullable=False)
     status = Column(String(20), nullable=False, default='active')  # active, successful, failed, completed
     pickup_point_address = Column(Text, nullable=False)
+    # Titik pengambilan untuk /borongan/nearby. Default dari lokasi profil supplier;
+    # index GiST parsial (hanya borongan 'active') dibuat di app/core/migrations.py
+    pickup_location = Column(Geography(geometry_type='POINT', srid=4326, spatial_index=False), nullable=True)
     
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+    # Dinaikkan oleh trigger database pada setiap UPDATE (lihat app/core/migrations.py).
+    # Dipakai sebagai ETag detail borongan.
+    version = Column(Integer, nullable=False, server_default=text("1"), server_onupdate=FetchedValue())
+
     supplier = relationship("Profile")
     participants = relationship("GroupBuyParticipant", back_populates="group_buy") 
\ No newline at end of file
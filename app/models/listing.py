@@ -1,10 +1,10 @@
 # app/models/listing.py
 
 import uuid
-from sqlalchemy import Column, String, Integer, DateTime, func, Text, ForeignKey, DECIMAL, ARRAY
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, String, Integer, BigInteger, DateTime, func, Text, ForeignKey, DECIMAL, ARRAY, Computed, Double, FetchedValue, text
+from sqlalchemy.dialects.postgresql import UUID, TSVECTOR
 from geoalchemy2 import Geography
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, deferred
 
 from ..core.database import Base
 
@@ -25,9 +25,63 @@ class Listing(Base):
     
     status = Column(String(20), nullable=False, default='available') # 'available', 'sold_out'
     location = Column(Geography(geometry_type='POINT', srid=4326), nullable=False, index=True)
+
+    # Salinan koordinat dari location, diisi trigger database (lihat app/core/migrations.py)
+    longitude = Column(Double, nullable=True, server_default=FetchedValue(), server_onupdate=FetchedValue())
+    latitude = Column(Double, nullable=True, server_default=FetchedValue(), server_onupdate=FetchedValue())
     
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), default=func.now(), onupdate=func.now())
 
+    # Skor feed nearby?sort=ranked, dihitung trigger database dan diluruhkan berkala
+    # (lihat app/core/migrations.py dan app/services/maintenance.py)
+    rank_score = Column(Double, nullable=True, server_default=FetchedValue(), server_onupdate=FetchedValue())
+
+    # Total view, ditulis berkala oleh app/services/view_counter.py (bukan per request)
+    view_count = Column(BigInteger, nullable=False, server_default=text("0"))
+
+    # Vektor full-text (konfigurasi 'indonesian') untuk /lapak/search, diisi otomatis oleh Postgres.
+    # Index GIN dan trigram-nya dibuat di app/core/migrations.py
+    # Deferred agar tidak ikut terbaca setiap kali objek Listing dimuat.
+    search_vector = deferred(Column(
+        TSVECTOR,
+        Computed(
+            "setweight(to_tsvector('indonesian'::regconfig, coalesce(title, '')), 'A') || "
+            "setweight(to_tsvector('indonesian'::regconfig, coalesce(description, '')), 'B')",
+            persisted=True
+        ),
+        nullable=True
+    ))
+
     # Membuat relasi agar kita bisa mengakses profil penjual dari objek listing
+    seller = relationship("Profile")
+
+class ListingArchive(Base):
+    """
+    Lapak inactive yang sudah lama tidak berubah, dipindahkan dari
+    tabel listings oleh app/services/maintenance.py (archive_stale_listings).
+    Hanya dibaca oleh detail lapak, jadi tanpa index spasial dan search_vector.
+    Kolom harus mengikuti ARCHIVE_COLUMNS di maintenance.py.
+    """
+    __tablename__ = "listings_archive"
+
+    id = Column(UUID(as_uuid=True), primary_key=True)
+    seller_id = Column(UUID(as_uuid=True), ForeignKey("profiles.id"), nullable=False, index=True)
+
+    title = Column(String(255), nullable=False)
+    description = Column(Text, nullable=True)
+    price = Column(DECIMAL(10, 2), nullable=False)
+    unit = Column(String(20), nullable=False)
+    stock_quantity = Column(Integer, nullable=False)
+    image_urls = Column(ARRAY(Text), nullable=True)
+    status = Column(String(20), nullable=False)
+    location = Column(Geography(geometry_type='POINT', srid=4326, spatial_index=False), nullable=False)
+    longitude = Column(Double, nullable=True)
+    latitude = Column(Double, nullable=True)
+    view_count = Column(BigInteger, nullable=False, server_default=text("0"))
+
+    created_at = Column(DateTime(timezone=True))
+    updated_at = Column(DateTime(timezone=True))
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+
     seller = relationship("Profile") 
\ No newline at end of file
@@ -1,5 +1,5 @@
 import uuid
-from sqlalchemy import Column, String, Integer, DateTime, func, Text
+from sqlalchemy import Column, String, Integer, DateTime, func, Text, Double, FetchedValue
 from sqlalchemy.dialects.postgresql import UUID
 from geoalchemy2 import Geography
 
@@ -15,6 +15,9 @@ class Profile(Base):
     profile_picture_url = Column(Text, nullable=True)
     address_text = Column(Text, nullable=True)
     location = Column(Geography(geometry_type='POINT', srid=4326), nullable=True, index=True)
+    # Salinan koordinat dari location, diisi trigger database (lihat app/core/migrations.py)
+    longitude = Column(Double, nullable=True, server_default=FetchedValue(), server_onupdate=FetchedValue())
+    latitude = Column(Double, nullable=True, server_default=FetchedValue(), server_onupdate=FetchedValue())
     reputation_score = Column(Integer, default=0)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), default=func.now(), onupdate=func.now()) 
\ No newline at end of file
@@ -1,67 +1,169 @@
 # app/routers/borongan.py
 
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, Header, Response, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import List
+from sqlalchemy import func, tuple_
+from geoalchemy2 import WKTElement
+from typing import AsyncIterator, List, Optional
 from datetime import datetime, timezone
 from decimal import Decimal
+import asyncio
 import uuid
 
-from ..core.database import get_db
+from ..core.config import settings
+from ..core.database import get_db, SessionLocal, engine
+from ..core.etag import make_etag, etag_matches, not_modified
+from ..core.pagination import encode_cursor, decode_cursor
 from ..models.group_buy import GroupBuy
 from ..models.group_buy_participant import GroupBuyParticipant
 from ..models.profile import Profile
 from ..schemas.borongan import (
-    BoronganSummarySchema, 
     BoronganListResponse, 
+    BoronganNearbyListResponse,
     BoronganDetailSchema,
     BoronganCreate,
-    ParticipantSchema,
     BoronganJoin,
     BoronganJoinResponse
 )
 from ..core.dependencies import get_current_user
 from ..services import tripay as tripay_service
+from ..services import maintenance
+from ..services.group_buy_totals import adjust_group_buy_totals, ACTIVE_PAYMENT_STATUSES
+from ..services.borongan_events import borongan_events, format_sse, TERMINAL_STATUSES
 
 router = APIRouter()
 
+# Kolom GroupBuy yang dibutuhkan BoronganSummarySchema. Jumlah peserta dan
+# kuantitas dibaca dari kolom ringkasan (lihat model GroupBuy), sehingga daftar
+# borongan tidak menyentuh tabel group_buy_participants.
+BORONGAN_SUMMARY_COLUMNS = (
+    GroupBuy.id,
+    GroupBuy.supplier_id,
+    GroupBuy.title,
+    GroupBuy.description,
+    GroupBuy.image_url,
+    GroupBuy.price_per_unit,
+    GroupBuy.unit,
+    GroupBuy.target_quantity,
+    GroupBuy.current_quantity,
+    GroupBuy.paid_quantity,
+    GroupBuy.pending_quantity,
+    GroupBuy.participants_count,
+    GroupBuy.deadline,
+    GroupBuy.pickup_point_address,
+    GroupBuy.status,
+    GroupBuy.created_at,
+)
+
+def _borongan_summary_query(db: Session):
+    """Query ringkasan borongan (BORONGAN_SUMMARY_COLUMNS) dalam satu SELECT."""
+    return db.query(*BORONGAN_SUMMARY_COLUMNS)
+
+def _borongan_row_to_summary(row) -> dict:
+    """Memetakan satu baris hasil _borongan_summary_query ke bentuk BoronganSummarySchema."""
+    return {
+        "id": row.id,
+        "supplier_id": row.supplier_id,
+        "title": row.title,
+        "description": row.description,
+        "image_url": row.image_url,
+        "price_per_unit": row.price_per_unit,
+        "unit": row.unit,
+        "target_quantity": row.target_quantity,
+        "current_quantity": row.current_quantity,
+        "paid_quantity": row.paid_quantity,
+        "pending_quantity": row.pending_quantity,
+        "participants_count": row.participants_count,
+        "deadline": row.deadline,
+        "pickup_point_address": row.pickup_point_address,
+        "status": row.status,
+        "created_at": row.created_at
+    }
+
+# Kunci urutan GET /borongan/ per pilihan sort: (ekspresi, arah). Setiap kunci
+# dibantu index parsial borongan 'active' (migrasi 0011).
+BORONGAN_SORT_KEYS = {
+    "deadline": (GroupBuy.deadline, "asc"),  # deadline terdekat lebih dulu
+    "newest": (GroupBuy.created_at, "desc"),
+    "closest": (GroupBuy.target_quantity - GroupBuy.current_quantity, "asc"),  # sisa kuota terkecil
+}
+
 @router.get("/", response_model=BoronganListResponse)
-def get_active_borongan(db: Session = Depends(get_db)):
-    """Get all active group buying sessions"""
-    active_borongan = db.query(GroupBuy).filter(
+def get_active_borongan(
+    limit: int = Query(20, description="Items per page", gt=0, le=50),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from next_cursor of the previous page"),
+    sort: str = Query("deadline", description="deadline (soonest first), newest, or closest to target", pattern="^(deadline|newest|closest)$"),
+    unit: Optional[str] = Query(None, description="Filter by unit, e.g. kg, ikat, buah", max_length=20),
+    price_min: Optional[Decimal] = Query(None, description="Minimum price per unit", ge=0),
+    price_max: Optional[Decimal] = Query(None, description="Maximum price per unit", ge=0),
+    db: Session = Depends(get_db)
+):
+    """
+    Get active group buying sessions, one page at a time.
+
+    Halaman berikutnya diambil dengan keyset pagination berdasarkan kunci sort
+    dan id (`next_cursor`), sehingga biaya setiap halaman tetap sama berapa pun
+    jumlah borongan. Cursor hanya berlaku untuk sort yang sama.
+    """
+    if price_min is not None and price_max is not None and price_min > price_max:
+        raise HTTPException(status_code=400, detail="price_min cannot be greater than price_max")
+
+    sort_key, direction = BORONGAN_SORT_KEYS[sort]
+    query = _borongan_summary_query(db).add_columns(sort_key.label("sort_key")).filter(
         GroupBuy.status == 'active',
         GroupBuy.deadline > datetime.now(timezone.utc)
-    ).all()
-    
-    borongan_list = []
-    for borongan in active_borongan:
-        participants_count = db.query(GroupBuyParticipant).filter(
-            GroupBuyParticipant.group_buy_id == borongan.id
-        ).count()
-        
-        total_ordered = db.query(GroupBuyParticipant).filter(
-            GroupBuyParticipant.group_buy_id == borongan.id
-        ).with_entities(func.sum(GroupBuyParticipant.quantity_ordered)).scalar() or 0
-        
-        borongan_summary = BoronganSummarySchema(
-            id=borongan.id,
-            supplier_id=borongan.supplier_id,
-            title=borongan.title,
-            description=borongan.description,
-            price_per_unit=borongan.price_per_unit,
-            unit=borongan.unit,
-            target_quantity=borongan.target_quantity,
-            current_quantity=total_ordered,
-            participants_count=participants_count,
-            deadline=borongan.deadline,
-            pickup_point_address=borongan.pickup_point_address,
-            status=borongan.status,
-            created_at=borongan.created_at
-        )
-        borongan_list.append(borongan_summary)
-    
-    return BoronganListResponse(borongan=borongan_list)
+    )
+    if unit:
+        query = query.filter(GroupBuy.unit == unit)
+    if price_min is not None:
+        query = query.filter(GroupBuy.price_per_unit >= price_min)
+    if price_max is not None:
+        query = query.filter(GroupBuy.price_per_unit <= price_max)
+
+    # id sebagai tie-breaker agar urutan stabil untuk cursor
+    if direction == "asc":
+        query = query.order_by(sort_key.asc(), GroupBuy.id.asc())
+    else:
+        query = query.order_by(sort_key.desc(), GroupBuy.id.desc())
+    if cursor:
+        last_key, last_id = _decode_borongan_cursor(cursor, sort)
+        if direction == "asc":
+            query = query.filter(tuple_(sort_key, GroupBuy.id) > tuple_(last_key, last_id))
+        else:
+            query = query.filter(tuple_(sort_key, GroupBuy.id) < tuple_(last_key, last_id))
+
+    # Ambil satu baris ekstra untuk mengetahui apakah masih ada halaman berikutnya
+    results = query.limit(limit + 1).all()
+    has_more = len(results) > limit
+    results = results[:limit]
+
+    next_cursor = None
+    if has_more and results:
+        last_key = results[-1].sort_key
+        if isinstance(last_key, datetime):
+            last_key = last_key.isoformat()
+        next_cursor = encode_cursor([sort, last_key, str(results[-1].id)])
+
+    return {
+        "borongan": [_borongan_row_to_summary(row) for row in results],
+        "has_more": has_more,
+        "limit": limit,
+        "next_cursor": next_cursor
+    }
+
+def _decode_borongan_cursor(cursor: str, sort: str):
+    """Mengubah cursor GET /borongan/ menjadi (kunci sort, group buy id)."""
+    cursor_sort, last_key, last_id = decode_cursor(cursor, 3)
+    if cursor_sort != sort:
+        raise HTTPException(status_code=400, detail="Cursor does not match the requested sort")
+    try:
+        if sort == "closest":
+            return int(last_key), uuid.UUID(str(last_id))
+        return datetime.fromisoformat(str(last_key)), uuid.UUID(str(last_id))
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
 @router.post("/", response_model=BoronganDetailSchema)
 def create_borongan(
@@ -72,6 +174,14 @@ def create_borongan(
     """Create a new group buying session"""
     # Convert current_user.id string to UUID
     current_user_uuid = uuid.UUID(current_user.id) if isinstance(current_user.id, str) else current_user.id
+
+    # Titik pengambilan: koordinat dari frontend jika lengkap, selain itu lokasi profil supplier
+    if borongan_data.pickup_latitude is not None and borongan_data.pickup_longitude is not None:
+        pickup_location = WKTElement(
+            f'POINT({borongan_data.pickup_longitude} {borongan_data.pickup_latitude})', srid=4326
+        )
+    else:
+        pickup_location = db.query(Profile.location).filter(Profile.id == current_user_uuid).scalar()
     
     new_borongan = GroupBuy(
         title=borongan_data.title,
@@ -81,6 +191,7 @@ def create_borongan(
         target_quantity=borongan_data.target_quantity,
         deadline=borongan_data.deadline,
         pickup_point_address=borongan_data.pickup_point_address,
+        pickup_location=pickup_location,
         supplier_id=current_user_uuid,
         status='active'
     )
@@ -117,82 +228,249 @@ def get_my_borongan(
     current_user_uuid = uuid.UUID(current_user.id) if isinstance(current_user.id, str) else current_user.id
     
     # Query borongan created by current user, ordered by creation date (newest first)
-    my_borongan = db.query(GroupBuy).filter(
+    my_borongan = _borongan_summary_query(db).filter(
         GroupBuy.supplier_id == current_user_uuid
     ).order_by(GroupBuy.created_at.desc()).all()
-    
-    borongan_list = []
-    for borongan in my_borongan:
-        participants_count = db.query(GroupBuyParticipant).filter(
-            GroupBuyParticipant.group_buy_id == borongan.id
-        ).count()
-        
-        total_ordered = db.query(GroupBuyParticipant).filter(
-            GroupBuyParticipant.group_buy_id == borongan.id
-        ).with_entities(func.sum(GroupBuyParticipant.quantity_ordered)).scalar() or 0
-        
-        borongan_summary = BoronganSummarySchema(
-            id=borongan.id,
-            supplier_id=borongan.supplier_id,
-            title=borongan.title,
-            description=borongan.description,
-            price_per_unit=borongan.price_per_unit,
-            unit=borongan.unit,
-            target_quantity=borongan.target_quantity,
-            current_quantity=total_ordered,
-            participants_count=participants_count,
-            deadline=borongan.deadline,
-            pickup_point_address=borongan.pickup_point_address,
-            status=borongan.status,
-            created_at=borongan.created_at
-        )
-        borongan_list.append(borongan_summary)
-    
-    return BoronganListResponse(borongan=borongan_list)
+
+    return {"borongan": [_borongan_row_to_summary(row) for row in my_borongan]}
+
+@router.get("/nearby", response_model=BoronganNearbyListResponse)
+def get_borongan_nearby(
+    lat: float = Query(..., description="Latitude of the user's location"),
+    lon: float = Query(..., description="Longitude of the user's location"),
+    radius: int = Query(5000, description="Radius in meters", gt=0),  # Default 5km
+    limit: int = Query(20, description="Items per page", gt=0, le=50),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from next_cursor of the previous page"),
+    unit: Optional[str] = Query(None, description="Filter by unit, e.g. kg, ikat, buah", max_length=20),
+    price_min: Optional[Decimal] = Query(None, description="Minimum price per unit", ge=0),
+    price_max: Optional[Decimal] = Query(None, description="Maximum price per unit", ge=0),
+    db: Session = Depends(get_db)
+):
+    """
+    Menemukan borongan aktif dengan titik pengambilan dalam radius tertentu,
+    diurutkan dari yang terdekat. Sama seperti /lapak/nearby: ST_DWithin
+    memakai index GiST parsial pickup_location, dan halaman berikutnya diambil
+    dengan keyset pagination berdasarkan (distance, id).
+    Borongan tanpa pickup_location tidak ikut ditampilkan.
+    """
+    if price_min is not None and price_max is not None and price_min > price_max:
+        raise HTTPException(status_code=400, detail="price_min cannot be greater than price_max")
+    after = _decode_borongan_nearby_cursor(cursor) if cursor else None
+
+    user_location = WKTElement(f'POINT({lon} {lat})', srid=4326)
+    distance = func.ST_Distance(GroupBuy.pickup_location, user_location)
+    query = _borongan_summary_query(db).add_columns(distance.label("distance")).filter(
+        GroupBuy.status == 'active',
+        GroupBuy.deadline > datetime.now(timezone.utc),
+        func.ST_DWithin(GroupBuy.pickup_location, user_location, radius)
+    )
+    if unit:
+        query = query.filter(GroupBuy.unit == unit)
+    if price_min is not None:
+        query = query.filter(GroupBuy.price_per_unit >= price_min)
+    if price_max is not None:
+        query = query.filter(GroupBuy.price_per_unit <= price_max)
+    if after:
+        query = query.filter(tuple_(distance, GroupBuy.id) > tuple_(*after))
+
+    # id sebagai tie-breaker agar urutan stabil untuk cursor
+    results = query.order_by(distance, GroupBuy.id).limit(limit + 1).all()
+    has_more = len(results) > limit
+    results = results[:limit]
+
+    next_cursor = None
+    if has_more and results:
+        next_cursor = encode_cursor([results[-1].distance, str(results[-1].id)])
+
+    return {
+        "borongan": [
+            {**_borongan_row_to_summary(row), "distance": row.distance}
+            for row in results
+        ],
+        "has_more": has_more,
+        "limit": limit,
+        "next_cursor": next_cursor
+    }
+
+def _decode_borongan_nearby_cursor(cursor: str):
+    """Mengubah cursor /borongan/nearby menjadi (distance, group buy id)."""
+    last_distance, last_id = decode_cursor(cursor, 2)
+    try:
+        return float(last_distance), uuid.UUID(str(last_id))
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
 @router.get("/{borongan_id}", response_model=BoronganDetailSchema)
-def get_borongan_detail(borongan_id: str, db: Session = Depends(get_db)):
-    """Get detailed information about a specific group buying session"""
-    borongan = db.query(GroupBuy).filter(GroupBuy.id == borongan_id).first()
+def get_borongan_detail(
+    borongan_id: str,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """
+    Get detailed information about a specific group buying session.
+
+    ETag diambil dari kolom version borongan. If-None-Match yang cocok
+    dijawab 304 dengan satu query versi, tanpa memuat partisipan.
+
+    Jumlah dan kuantitas dibaca dari kolom ringkasan borongan; daftar partisipan
+    aktif (pending/paid) beserta namanya diambil dengan satu query join.
+    """
+    if if_none_match:
+        version = db.query(GroupBuy.version).filter(GroupBuy.id == borongan_id).scalar()
+        if version is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Group buying session not found"
+            )
+        etag = make_etag(version)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+
+    borongan = _borongan_summary_query(db).add_columns(GroupBuy.version).filter(
+        GroupBuy.id == borongan_id
+    ).first()
     
     if not borongan:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Group buying session not found"
         )
-    
-    participants = db.query(GroupBuyParticipant).filter(
-        GroupBuyParticipant.group_buy_id == borongan_id
-    ).all()
-    
-    participants_list = []
-    total_ordered = 0
-    
-    for participant in participants:
-        participants_list.append(ParticipantSchema(
-            user_id=participant.user_id,
-            full_name=participant.full_name,
-            quantity_ordered=participant.quantity_ordered
-        ))
-        total_ordered += participant.quantity_ordered
-    
-    return BoronganDetailSchema(
-        id=borongan.id,
-        supplier_id=borongan.supplier_id,
-        title=borongan.title,
-        description=borongan.description,
-        price_per_unit=borongan.price_per_unit,
-        unit=borongan.unit,
-        target_quantity=borongan.target_quantity,
-        current_quantity=total_ordered,
-        participants_count=len(participants_list),
-        participants=participants_list,
-        deadline=borongan.deadline,
-        pickup_point_address=borongan.pickup_point_address,
-        status=borongan.status,
-        created_at=borongan.created_at
+
+    response.headers["ETag"] = make_etag(borongan.version)
+    response.headers["Cache-Control"] = "no-cache"
+
+    participants = (
+        db.query(
+            GroupBuyParticipant.user_id,
+            Profile.full_name,
+            GroupBuyParticipant.quantity_ordered
+        )
+        .join(Profile, Profile.id == GroupBuyParticipant.user_id)
+        .filter(
+            GroupBuyParticipant.group_buy_id == borongan_id,
+            GroupBuyParticipant.payment_status.in_(ACTIVE_PAYMENT_STATUSES)
+        )
+        .order_by(GroupBuyParticipant.created_at)
+        .all()
     )
 
+    return {
+        **_borongan_row_to_summary(borongan),
+        "participants": [
+            {
+                "user_id": participant.user_id,
+                "full_name": participant.full_name,
+                "quantity_ordered": participant.quantity_ordered
+            }
+            for participant in participants
+        ]
+    }
+
+@router.get("/{borongan_id}/events")
+async def stream_borongan_events(
+    borongan_id: uuid.UUID,
+    request: Request,
+    db: Session = Depends(get_db)
+):
+    """
+    Stream Server-Sent Events progress borongan (current_quantity,
+    participants_count, status) sebagai pengganti polling detail borongan.
+
+    Event pertama adalah kondisi saat ini; event berikutnya dikirim setiap
+    kali borongan berubah (NOTIFY dari database, lihat app/services/borongan_events.py).
+    `id` setiap event adalah version borongan. Stream ditutup setelah status
+    akhir (failed/completed) atau BORONGAN_EVENTS_MAX_STREAM_SECONDS;
+    EventSource di browser akan menyambung ulang otomatis.
+    """
+    # LISTEN harus sudah aktif dan stream sudah berlangganan sebelum snapshot dibaca,
+    # agar perubahan yang di-commit setelah snapshot pasti diterima
+    borongan_events.start(engine, _borongan_progress_snapshots)
+    if not await run_in_threadpool(borongan_events.wait_until_listening):
+        # Tetap dilayani: snapshot dikirim ulang ke stream ini begitu LISTEN aktif
+        print(f"Borongan events listener not ready, streaming {borongan_id} without waiting")
+    queue = borongan_events.subscribe(borongan_id)
+    try:
+        snapshot = await run_in_threadpool(_borongan_progress, db, borongan_id)
+    except Exception:
+        borongan_events.unsubscribe(borongan_id, queue)
+        raise
+    finally:
+        # Koneksi database tidak perlu ditahan selama stream berlangsung
+        db.close()
+    if snapshot is None:
+        borongan_events.unsubscribe(borongan_id, queue)
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Group buying session not found"
+        )
+
+    async def event_stream() -> AsyncIterator[str]:
+        loop = asyncio.get_running_loop()
+        stream_deadline = loop.time() + settings.BORONGAN_EVENTS_MAX_STREAM_SECONDS
+        last_version = snapshot["version"]
+        try:
+            yield "retry: 5000\n\n" + format_sse(snapshot)
+            if snapshot["status"] in TERMINAL_STATUSES:
+                return
+            while loop.time() < stream_deadline:
+                if await request.is_disconnected():
+                    break
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=settings.BORONGAN_EVENTS_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    # Komentar SSE agar proxy tidak menutup koneksi yang diam
+                    yield ": keep-alive\n\n"
+                    continue
+                # Event yang sudah tercakup snapshot atau datang tidak berurutan dilewati
+                if event["version"] <= last_version:
+                    continue
+                last_version = event["version"]
+                yield format_sse(event)
+                if event["status"] in TERMINAL_STATUSES:
+                    break
+        finally:
+            borongan_events.unsubscribe(borongan_id, queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Kolom progress borongan, sama dengan payload NOTIFY dari migrasi 0013
+BORONGAN_PROGRESS_COLUMNS = (
+    GroupBuy.id,
+    GroupBuy.current_quantity,
+    GroupBuy.target_quantity,
+    GroupBuy.participants_count,
+    GroupBuy.status,
+    GroupBuy.version,
+)
+
+def _borongan_progress(db: Session, borongan_id: uuid.UUID) -> Optional[dict]:
+    """Snapshot progress borongan dengan bentuk yang sama seperti payload NOTIFY."""
+    row = db.query(*BORONGAN_PROGRESS_COLUMNS).filter(GroupBuy.id == borongan_id).first()
+    if row is None:
+        return None
+    return _borongan_progress_row_to_event(row)
+
+def _borongan_progress_snapshots(group_buy_ids: List[uuid.UUID]) -> List[dict]:
+    """Snapshot progress beberapa borongan sekaligus, untuk dikirim ulang oleh listener setelah reconnect."""
+    with SessionLocal() as db:
+        rows = db.query(*BORONGAN_PROGRESS_COLUMNS).filter(GroupBuy.id.in_(group_buy_ids)).all()
+    return [_borongan_progress_row_to_event(row) for row in rows]
+
+def _borongan_progress_row_to_event(row) -> dict:
+    return {
+        "id": str(row.id),
+        "current_quantity": row.current_quantity,
+        "target_quantity": row.target_quantity,
+        "participants_count": row.participants_count,
+        "status": row.status,
+        "version": row.version
+    }
+
 @router.post("/{group_buy_id}/join", response_model=BoronganJoinResponse)
 def join_borongan(
     group_buy_id: uuid.UUID,
@@ -250,12 +528,9 @@ def join_borongan(
         payment_status='pending'  # Status pending sampai payment dikonfirmasi
     )
     
-    # 3. Update kuantitas saat ini di borongan
-    borongan.current_quantity += join_data.quantity_ordered
-
-    # 4. Cek apakah target tercapai
-    if borongan.current_quantity >= borongan.target_quantity:
-        borongan.status = 'successful'  # Ubah status jika target tercapai
+    # 3. Update kuantitas dan ringkasan partisipan di borongan (pending sampai dibayar)
+    # 4. Status berubah menjadi 'successful' jika target tercapai
+    adjust_group_buy_totals(borongan, join_data.quantity_ordered, None, new_participant.payment_status)
 
     # 5. Simpan partisipan dan borongan ke database terlebih dahulu
     try:
@@ -285,11 +560,7 @@ def join_borongan(
         # Cek apakah Tripay response sukses
         if not tripay_response.get("success", True):  # Default True jika tidak ada key 'success'
             # Jika gagal membuat transaksi, rollback partisipasi
-            db.delete(new_participant)
-            borongan.current_quantity -= join_data.quantity_ordered
-            if borongan.current_quantity < borongan.target_quantity:
-                borongan.status = 'active'
-            db.commit()
+            _undo_join(db, group_buy_id, new_participant)
             
             error_message = tripay_response.get('message', 'Unknown error from payment gateway')
             raise HTTPException(
@@ -323,11 +594,7 @@ def join_borongan(
         
         # Rollback partisipasi jika ada error setelah commit
         try:
-            db.delete(new_participant)
-            borongan.current_quantity -= join_data.quantity_ordered
-            if borongan.current_quantity < borongan.target_quantity:
-                borongan.status = 'active'
-            db.commit()
+            _undo_join(db, group_buy_id, new_participant)
         except Exception as rollback_error:
             print(f"Error during rollback: {rollback_error}")
         
@@ -336,6 +603,23 @@ def join_borongan(
             detail="An error occurred during payment processing. Please try again."
         ) 
 
+def _undo_join(db: Session, group_buy_id: uuid.UUID, participant: GroupBuyParticipant) -> None:
+    """
+    Menghapus partisipan yang transaksi pembayarannya gagal dibuat dan
+    mengurangi ringkasan borongannya. Kunci dari join sudah dilepas oleh
+    commit, jadi baris group_buy dikunci dan dibaca ulang terlebih dahulu.
+    """
+    borongan = (
+        db.query(GroupBuy)
+        .filter(GroupBuy.id == group_buy_id)
+        .with_for_update()
+        .populate_existing()
+        .first()
+    )
+    db.delete(participant)
+    adjust_group_buy_totals(borongan, participant.quantity_ordered, participant.payment_status, None)
+    db.commit()
+
 # --- Background Task Functions ---
 
 def process_expired_borongan(db: Session):
@@ -392,4 +676,17 @@ def trigger_deadline_check(background_tasks: BackgroundTasks, db: Session = Depe
     return {
         "message": "Deadline check has been triggered in the background.",
         "timestamp": datetime.now(timezone.utc).isoformat()
+    }
+
+@router.post("/internal/repair-totals", include_in_schema=False)
+def trigger_totals_repair(background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    """
+    Endpoint internal untuk menghitung ulang ringkasan partisipan semua borongan
+    (participants_count, paid_quantity, pending_quantity, current_quantity)
+    dari tabel group_buy_participants.
+    """
+    background_tasks.add_task(maintenance.repair_group_buy_totals, SessionLocal)
+    return {
+        "message": "Group buy totals repair has been triggered in the background.",
+        "timestamp": datetime.now(timezone.utc).isoformat()
     } 
\ No newline at end of file
@@ -1,18 +1,49 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query, File, UploadFile, Form
+from fastapi import APIRouter, Depends, HTTPException, status, Query, File, UploadFile, Form, Header, Response, BackgroundTasks, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session, selectinload
-from sqlalchemy import func, cast, String
+from sqlalchemy import func, cast, String, tuple_, or_, select, true, update, case, insert, text
+from sqlalchemy.dialects.postgresql import JSON
 from geoalchemy2 import WKTElement
-from geoalchemy2.types import Geometry
-from typing import List, Optional
+from geoalchemy2.types import Geography
+from typing import Dict, Iterator, List, Optional
 from decimal import Decimal
+from datetime import datetime, timedelta, timezone
+import numpy as np
+from pydantic import TypeAdapter, ValidationError
+from pydantic_core import to_json
+import csv
+import io
+import math
 import uuid
 
-from ..core.database import get_db
-from ..core.dependencies import get_current_user
-from ..models.listing import Listing
+from ..core.config import settings
+from ..core.database import get_db, SessionLocal
+from ..core.dependencies import get_current_user, get_optional_user
+from ..core.etag import make_etag, etag_matches, not_modified
+from ..core.geo import haversine_m
+from ..core.pagination import encode_cursor, decode_cursor
+from ..models.listing import Listing, ListingArchive
 from ..models.profile import Profile
-from ..schemas.lapak import LapakCreate, LapakSchema, LapakListResponse, LapakUpdate
-from ..services import azure_storage
+from ..schemas.lapak import (
+    LapakCreate,
+    LapakSchema,
+    LapakListResponse,
+    LapakBatchResponse,
+    LapakSellerSummary,
+    LapakViewStats,
+    LapakUpdate,
+    LapakReserve,
+    LapakImportRow,
+    LapakImportRequest,
+    LapakImportResponse,
+    LapakReserveResponse,
+    LapakClusterSchema,
+    LapakClusterResponse
+)
+from ..services import azure_storage, maintenance
+from ..services.nearby_cache import nearby_cache
+from ..services.spatial_index import spatial_index
+from ..services.view_counter import view_counter, HyperLogLog
 from ..services.gemini import (
     analyze_image_from_file, 
     analyze_photo_comprehensive,
@@ -23,6 +54,126 @@ from ..services.gemini import (
 
 router = APIRouter()
 
+# Batas atas penghitungan total untuk count_mode=capped pada /nearby
+NEARBY_COUNT_CAP = 1000
+
+# Jalur yang melayani /nearby, dicatat di cursor. Jarak dihitung berbeda per jalur
+# (ST_Distance geography vs haversine), jadi cursor hanya dilanjutkan di jalur yang sama.
+NEARBY_PATH_SQL = "sql"
+NEARBY_PATH_TILES = "tiles"
+NEARBY_PATH_MEMORY = "memory"
+
+# Batas jumlah kandidat per entry cache /nearby; area yang lebih padat
+# langsung memakai query SQL biasa
+NEARBY_CACHE_MAX_CANDIDATES = 2000
+# Penanda di cache bahwa area tile melebihi NEARBY_CACHE_MAX_CANDIDATES
+_NEARBY_TOO_MANY_CANDIDATES = "too_many"
+
+# Jumlah sel cluster per sisi tile peta 256px (~64px per sel)
+CLUSTER_CELLS_PER_TILE = 4
+# Batas sel grid per viewport /clusters (layar 4K penuh kurang dari ~2000 sel)
+CLUSTER_MAX_CELLS = 2500
+
+# Jumlah bucket histogram harga pada facet /nearby dan lebar langkah harga terkecil
+FACET_PRICE_BUCKETS = 5
+FACET_PRICE_STEP = Decimal("0.01")
+
+# Bobot kemiripan trigram terhadap skor full-text pada /search
+SEARCH_TRIGRAM_WEIGHT = 0.5
+# Jarak (meter) di mana skor relevansi /search berkurang setengahnya
+SEARCH_DISTANCE_HALF_SCORE_M = 1000
+
+# Jumlah maksimum id per permintaan /batch
+BATCH_MAX_IDS = 100
+
+# Jumlah baris yang diambil per fetch dari server-side cursor pada /nearby/stream
+NEARBY_STREAM_CHUNK_SIZE = 500
+
+# Batas impor massal: jumlah baris per request dan per statement INSERT
+IMPORT_MAX_ROWS = 5000
+IMPORT_BATCH_SIZE = 1000
+# Pemisah beberapa URL gambar dalam satu kolom CSV
+IMPORT_CSV_IMAGE_SEPARATOR = "|"
+
+_import_rows_adapter = TypeAdapter(List[LapakImportRow])
+
+# Titik awal keyset untuk laporan debug (lebih kecil dari semua UUID)
+DEBUG_NIL_UUID = uuid.UUID(int=0)
+
+# Rentang maksimum statistik view untuk pemilik lapak
+VIEW_STATS_MAX_DAYS = 90
+
+# Kolom yang dibutuhkan LapakSchema. Endpoint baca memilih kolom ini langsung
+# (tanpa memuat objek Listing/Profile lewat ORM) lalu memetakannya ke dict.
+LAPAK_COLUMNS = (
+    Listing.id,
+    Listing.seller_id,
+    Listing.title,
+    Listing.description,
+    Listing.price,
+    Listing.unit,
+    Listing.stock_quantity,
+    Listing.image_urls,
+    Listing.status,
+    Listing.created_at,
+    Listing.updated_at,
+    Listing.longitude,
+    Listing.latitude,
+    Profile.full_name.label('seller_full_name'),
+)
+
+def _lapak_query(db: Session, *extra_columns):
+    """Query baris lapak (LAPAK_COLUMNS + kolom tambahan) beserta nama penjual dalam satu SELECT."""
+    return (
+        db.query(*LAPAK_COLUMNS, *extra_columns)
+        .join(Profile, Profile.id == Listing.seller_id)
+    )
+
+# Kolom yang sama untuk lapak yang sudah dipindah ke listings_archive
+ARCHIVED_LAPAK_COLUMNS = (
+    ListingArchive.id,
+    ListingArchive.seller_id,
+    ListingArchive.title,
+    ListingArchive.description,
+    ListingArchive.price,
+    ListingArchive.unit,
+    ListingArchive.stock_quantity,
+    ListingArchive.image_urls,
+    ListingArchive.status,
+    ListingArchive.created_at,
+    ListingArchive.updated_at,
+    ListingArchive.longitude,
+    ListingArchive.latitude,
+    Profile.full_name.label('seller_full_name'),
+)
+
+def _archived_lapak_query(db: Session):
+    """Seperti _lapak_query, tetapi membaca dari listings_archive."""
+    return (
+        db.query(*ARCHIVED_LAPAK_COLUMNS)
+        .join(Profile, Profile.id == ListingArchive.seller_id)
+    )
+
+def _lapak_row_to_dict(row, distance: Optional[float] = None) -> dict:
+    """Memetakan satu baris hasil _lapak_query ke bentuk LapakSchema."""
+    return {
+        "id": row.id,
+        "seller_id": row.seller_id,
+        "title": row.title,
+        "description": row.description,
+        "price": row.price,
+        "unit": row.unit,
+        "stock_quantity": row.stock_quantity,
+        "image_urls": row.image_urls,
+        "status": row.status,
+        "latitude": row.latitude,
+        "longitude": row.longitude,
+        "distance": distance,
+        "created_at": row.created_at,
+        "updated_at": row.updated_at,
+        "seller": {"id": row.seller_id, "full_name": row.seller_full_name}
+    }
+
 @router.post("/analyze", response_model=EnhancedAnalysisResult, tags=["AI"])
 def analyze_images(
     images: List[UploadFile] = File(...),
@@ -142,11 +293,138 @@ def create_lapak(
     db.refresh(new_listing)
 
     # Manually query the full object to return with all derived fields
-    created_lapak = get_lapak_detail(new_listing.id, db)
+    created_lapak = _lapak_row_to_dict(_lapak_query(db).filter(Listing.id == new_listing.id).one())
+
+    # Buang cache nearby untuk tile-tile di sekitar lokasi lapak baru
+    nearby_cache.invalidate_point(created_lapak["latitude"], created_lapak["longitude"])
+    spatial_index.upsert(new_listing.id, created_lapak["latitude"], created_lapak["longitude"], new_listing.price)
 
     print(f"Lapak created with ID: {new_listing.id}")
     return created_lapak
 
+@router.post("/bulk", status_code=status.HTTP_201_CREATED, response_model=LapakImportResponse)
+def import_lapak_json(
+    import_data: LapakImportRequest,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """
+    Impor massal lapak dari JSON untuk supplier/koperasi.
+
+    Setiap baris memuat koordinat (opsional, default lokasi profil) dan URL
+    gambar yang sudah diunggah. Baris yang valid disimpan dengan INSERT
+    multi-baris per IMPORT_BATCH_SIZE; baris yang tidak valid dilaporkan
+    di `errors` beserta nomor barisnya. Jika tidak ada baris yang valid,
+    respons 422 memuat daftar error yang sama.
+    """
+    return _import_lapak_rows(db, current_user, import_data.rows)
+
+@router.post("/bulk/csv", status_code=status.HTTP_201_CREATED, response_model=LapakImportResponse)
+def import_lapak_csv(
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """
+    Impor massal lapak dari file CSV dengan header:
+    title, description, price, unit, stock_quantity, latitude, longitude, image_urls.
+    Beberapa URL gambar dalam satu sel dipisahkan dengan "|".
+    """
+    try:
+        content = file.file.read().decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="CSV file must be UTF-8 encoded")
+
+    raw_rows = []
+    for record in csv.DictReader(io.StringIO(content)):
+        # Sel kosong dianggap tidak diisi agar field opsional bernilai None
+        row = {key.strip(): value.strip() for key, value in record.items() if key and value and value.strip()}
+        if "image_urls" in row:
+            row["image_urls"] = [url.strip() for url in row["image_urls"].split(IMPORT_CSV_IMAGE_SEPARATOR) if url.strip()]
+        raw_rows.append(row)
+
+    return _import_lapak_rows(db, current_user, raw_rows)
+
+def _import_lapak_rows(db: Session, current_user, raw_rows: List[dict]) -> dict:
+    """Validasi dan simpan baris impor massal milik user yang sedang login."""
+    if not raw_rows:
+        raise HTTPException(status_code=400, detail="No rows to import")
+    if len(raw_rows) > IMPORT_MAX_ROWS:
+        raise HTTPException(status_code=400, detail=f"A maximum of {IMPORT_MAX_ROWS} rows per import is allowed")
+
+    current_user_uuid = uuid.UUID(current_user.id) if isinstance(current_user.id, str) else current_user.id
+    seller_profile = (
+        db.query(Profile.id, Profile.latitude, Profile.longitude)
+        .filter(Profile.id == current_user_uuid)
+        .first()
+    )
+    if not seller_profile:
+        raise HTTPException(status_code=404, detail="Seller profile not found.")
+
+    # Validasi seluruh baris sekaligus; jika ada yang gagal, kelompokkan error per baris
+    # lalu validasi ulang hanya baris yang lolos
+    row_errors: Dict[int, List[str]] = {}
+    try:
+        valid_rows = list(enumerate(_import_rows_adapter.validate_python(raw_rows)))
+    except ValidationError as e:
+        for error in e.errors():
+            index = error["loc"][0]
+            field = ".".join(str(part) for part in error["loc"][1:])
+            row_errors.setdefault(index, []).append(f"{field}: {error['msg']}" if field else error["msg"])
+        valid_indexes = [index for index in range(len(raw_rows)) if index not in row_errors]
+        validated = _import_rows_adapter.validate_python([raw_rows[index] for index in valid_indexes])
+        valid_rows = list(zip(valid_indexes, validated))
+
+    values = []
+    coordinates = []
+    for index, row in valid_rows:
+        latitude, longitude = row.latitude, row.longitude
+        if latitude is None or longitude is None:
+            latitude, longitude = seller_profile.latitude, seller_profile.longitude
+        if latitude is None or longitude is None:
+            row_errors.setdefault(index, []).append(
+                "location: provide latitude and longitude or set your location in your profile"
+            )
+            continue
+        values.append({
+            "id": uuid.uuid4(),
+            "seller_id": current_user_uuid,
+            "title": row.title,
+            "description": row.description,
+            "price": row.price,
+            "unit": row.unit,
+            "stock_quantity": row.stock_quantity,
+            "image_urls": row.image_urls,
+            "status": 'available',
+            "location": f"SRID=4326;POINT({longitude} {latitude})"
+        })
+        coordinates.append((latitude, longitude))
+
+    errors = [
+        {"row": index + 1, "errors": messages}
+        for index, messages in sorted(row_errors.items())
+    ]
+    if not values:
+        # Tidak ada baris yang valid: kembalikan sebagai error, bukan 201 dengan created=0
+        raise HTTPException(status_code=422, detail={"message": "No valid rows to import", "errors": errors})
+
+    # executemany dengan insertmanyvalues: SQLAlchemy menggabungkan baris menjadi INSERT multi-baris
+    for start in range(0, len(values), IMPORT_BATCH_SIZE):
+        db.execute(insert(Listing), values[start:start + IMPORT_BATCH_SIZE])
+    db.commit()
+    print(f"Imported {len(values)} lapak for seller {current_user_uuid}, rejected {len(row_errors)} row(s)")
+
+    # Banyak titik sekaligus; lebih murah mengosongkan cache daripada invalidasi per tile
+    nearby_cache.clear()
+    for value, (latitude, longitude) in zip(values, coordinates):
+        spatial_index.upsert(value["id"], latitude, longitude, value["price"])
+
+    return {
+        "created": len(values),
+        "created_ids": [value["id"] for value in values],
+        "errors": errors
+    }
+
 @router.get("/nearby", response_model=LapakListResponse)
 def get_lapak_nearby(
     lat: float = Query(..., description="Latitude of the user's location"),
@@ -154,120 +432,924 @@ def get_lapak_nearby(
     radius: int = Query(5000, description="Radius in meters", gt=0),  # Default 5km
     page: int = Query(1, description="Page number", gt=0),
     limit: int = Query(12, description="Items per page", gt=0, le=50),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from next_cursor of the previous page"),
+    count_mode: str = Query(
+        "capped",
+        description="How to compute total: exact, capped (stop at NEARBY_COUNT_CAP) or none (only has_more)",
+        pattern="^(exact|capped|none)$"
+    ),
+    engine: str = Query(
+        "postgis",
+        description="Search engine: postgis, or memory to use the in-process spatial index when enabled",
+        pattern="^(postgis|memory)$"
+    ),
+    price_min: Optional[Decimal] = Query(None, description="Minimum price", ge=0),
+    price_max: Optional[Decimal] = Query(None, description="Maximum price", ge=0),
+    unit: Optional[str] = Query(None, description="Filter by unit, e.g. kg, ikat, buah", max_length=20),
+    status: str = Query("available", description="Filter by status", pattern="^(available|sold_out|inactive)$"),
+    include_facets: bool = Query(False, description="Include unit counts and price histogram of all matches"),
+    mode: str = Query("radius", description="radius (default) or knn for the k nearest listings", pattern="^(radius|knn)$"),
+    k: int = Query(20, description="Number of listings for mode=knn", gt=0, le=100),
+    max_distance: Optional[int] = Query(None, description="Optional maximum distance in meters for mode=knn", gt=0),
+    sort: str = Query("distance", description="distance (default) or ranked by precomputed rank_score", pattern="^(distance|ranked)$"),
     db: Session = Depends(get_db)
 ):
     """
     Menemukan "Lapak Warga" yang tersedia di sekitar lokasi tertentu.
     Ini adalah endpoint utama untuk penemuan produk.
+
+    Jika `cursor` diberikan, halaman berikutnya diambil dengan keyset pagination
+    berdasarkan (distance, id) sehingga biaya setiap halaman tetap sama.
+    Parameter `page` tetap didukung untuk klien lama.
+
+    `count_mode` menentukan biaya penghitungan total: `exact` menghitung semua baris,
+    `capped` (default) berhenti di NEARBY_COUNT_CAP dan menandai `total_capped`,
+    `none` tidak menghitung sama sekali dan hanya mengisi `has_more`.
+
+    Kandidat lapak di-cache per geohash tile, radius bucket dan filter
+    (mode radius tanpa facet). Setiap request menyaring ulang kandidat terhadap
+    `lat`/`lon`/`radius` asli dan menghitung jaraknya sendiri; detail lapak
+    halaman tersebut diambil berdasarkan primary key. Cursor mencatat jalur
+    yang menerbitkannya (SQL, cache tile atau index memory) dan hanya bisa
+    dilanjutkan di jalur yang sama; jika tidak, respons 400 meminta klien
+    memulai lagi dari halaman pertama.
+
+    `engine=memory` memakai index spasial in-memory (jika SPATIAL_INDEX_ENABLED)
+    untuk filter dan urutan jarak, sehingga database hanya dipakai untuk
+    mengambil detail lapak di halaman tersebut berdasarkan primary key.
+
+    Filter `price_min`, `price_max`, `unit` dan `status` dapat digabungkan.
+    Dengan `include_facets=true`, jumlah per unit dan histogram harga dari semua
+    hasil dihitung dalam query yang sama dengan halaman (total menjadi exact).
+
+    `mode=knn` mengembalikan `k` lapak terdekat tanpa radius tetap (opsional
+    dibatasi `max_distance`), diurutkan dengan operator KNN `<->` yang dibantu
+    index GiST. Cocok untuk area jarang lapak: satu query selalu mengisi
+    halaman pertama. Mode ini tidak mendukung cursor, count_mode dan facet.
+
+    `sort=ranked` mengurutkan lapak dalam radius berdasarkan `rank_score`
+    (kebaruan, stok dan reputasi penjual) yang sudah dihitung sebelumnya,
+    dengan cursor berdasarkan (rank_score, id).
     """
+    after, cursor_path = _decode_nearby_cursor(cursor) if cursor else (None, None)
+    # Index in-memory hanya menyimpan lapak 'available' beserta harganya
+    use_index = (
+        engine == "memory"
+        and sort == "distance"
+        and settings.SPATIAL_INDEX_ENABLED
+        and status == "available"
+        and unit is None
+        and not include_facets
+    )
+
+    path = NEARBY_PATH_MEMORY if use_index else NEARBY_PATH_SQL
+    candidates = None
+    if (
+        settings.NEARBY_CACHE_ENABLED and mode == "radius" and not use_index and not include_facets
+        and cursor_path in (None, NEARBY_PATH_TILES)
+    ):
+        candidates = _nearby_cached_candidates(
+            db, lat, lon, radius, status=status, unit=unit, price_min=price_min, price_max=price_max
+        )
+        if candidates is not None:
+            path = NEARBY_PATH_TILES
+    if cursor_path is not None and cursor_path != path:
+        # Melanjutkan di jalur lain bisa melewati atau mengulang lapak di batas halaman
+        raise HTTPException(status_code=400, detail="Cursor does not match the current search; start from the first page")
+
+    if candidates is not None:
+        return _nearby_from_candidates(
+            db, candidates, lat, lon, radius, page, limit, after, count_mode, status=status, sort=sort
+        )
+
+    if mode == "knn":
+        return _nearby_knn(
+            db, lat, lon, k, max_distance,
+            status=status, unit=unit, price_min=price_min, price_max=price_max
+        )
+
+    if use_index:
+        return _nearby_from_index(
+            db, lat, lon, radius, page, limit, after, count_mode,
+            price_min=float(price_min) if price_min is not None else None,
+            price_max=float(price_max) if price_max is not None else None
+        )
+
     user_location = WKTElement(f'POINT({lon} {lat})', srid=4326)
+    distance = func.ST_Distance(Listing.location, user_location)
+    filters = nearby_filters(user_location, radius, status=status, unit=unit, price_min=price_min, price_max=price_max)
+
+    if include_facets:
+        # Filter dijalankan sekali di CTE; halaman dan facet sama-sama membaca dari CTE tersebut
+        matched = (
+            db.query(
+                Listing.id.label('id'),
+                Listing.unit.label('unit'),
+                Listing.price.label('price'),
+                distance.label('distance')
+            )
+            .filter(*filters)
+            .cte('matched')
+        )
+        page_distance = matched.c.distance
+        facets_column = _nearby_facets_column(matched)
+        base_query = (
+            _lapak_query(db, page_distance.label('distance'), Listing.rank_score, facets_column)
+            .join(matched, matched.c.id == Listing.id)
+        )
+    else:
+        page_distance = distance
+        base_query = _lapak_query(db, distance.label('distance'), Listing.rank_score).filter(*filters)
+
+    total = None
+    total_capped = False
+    if include_facets:
+        pass  # Total dihitung dari facet di bawah
+    elif count_mode == "exact":
+        total = db.query(func.count(Listing.id)).filter(*filters).scalar()
+    elif count_mode == "capped":
+        # Hitung paling banyak CAP + 1 baris; sisanya tidak perlu dipindai
+        capped_ids = db.query(Listing.id).filter(*filters).limit(NEARBY_COUNT_CAP + 1).subquery()
+        total = db.query(func.count()).select_from(capped_ids).scalar()
+        if total > NEARBY_COUNT_CAP:
+            total = NEARBY_COUNT_CAP
+            total_capped = True
+
+    # Urutkan dengan id sebagai tie-breaker agar urutan stabil untuk cursor
+    # rank_score NULL (belum dihitung trigger/job) diurutkan sebagai 0 agar bisa dipakai di cursor
+    rank_key = func.coalesce(Listing.rank_score, 0)
+    if sort == "ranked":
+        page_query = base_query.order_by(rank_key.desc(), Listing.id.desc())
+    else:
+        page_query = base_query.order_by(page_distance, Listing.id)
+    if after:
+        last_key, last_id = after
+        if sort == "ranked":
+            page_query = page_query.filter(tuple_(rank_key, Listing.id) < tuple_(last_key, last_id))
+        else:
+            page_query = page_query.filter(tuple_(page_distance, Listing.id) > tuple_(last_key, last_id))
+    else:
+        page_query = page_query.offset((page - 1) * limit)
+
+    # Ambil satu baris ekstra untuk mengetahui apakah masih ada halaman berikutnya
+    results = page_query.limit(limit + 1).all()
+    has_more = len(results) > limit
+    results = results[:limit]
+
+    lapak_list = [_lapak_row_to_dict(row, distance=row.distance) for row in results]
 
-    # Modify query to explicitly get lat/lon and distance
-    base_query = (
+    facets = None
+    if include_facets:
+        if results:
+            facets = _build_nearby_facets(results[0].facets)
+        elif not after and page == 1:
+            facets = _build_nearby_facets(None)
+        else:
+            # Halaman setelah hasil terakhir: facet tetap mencakup semua hasil
+            facets = _build_nearby_facets(db.query(facets_column).scalar())
+        total = sum(facets["units"].values())
+
+    next_cursor = None
+    if has_more and results:
+        last_key = (results[-1].rank_score or 0) if sort == "ranked" else results[-1].distance
+        next_cursor = encode_cursor([last_key, str(results[-1].id), NEARBY_PATH_SQL])
+
+    return {
+        "lapak": lapak_list,
+        "total": total,
+        "total_capped": total_capped,
+        "has_more": has_more,
+        "page": page,
+        "limit": limit,
+        "next_cursor": next_cursor,
+        "facets": facets
+    }
+
+@router.get("/nearby/stream")
+def stream_lapak_nearby(
+    lat: float = Query(..., description="Latitude of the user's location"),
+    lon: float = Query(..., description="Longitude of the user's location"),
+    radius: int = Query(5000, description="Radius in meters", gt=0),
+    price_min: Optional[Decimal] = Query(None, description="Minimum price", ge=0),
+    price_max: Optional[Decimal] = Query(None, description="Maximum price", ge=0),
+    unit: Optional[str] = Query(None, description="Filter by unit, e.g. kg, ikat, buah", max_length=20),
+    status: str = Query("available", description="Filter by status", pattern="^(available|sold_out|inactive)$"),
+    db: Session = Depends(get_db)  # Hanya untuk respons 503 jika database tidak tersedia
+):
+    """
+    Ekspor semua lapak dalam radius sebagai NDJSON (satu lapak per baris),
+    untuk analitik dan integrasi partner yang membutuhkan seluruh hasil.
+
+    Baris dibaca dari server-side cursor per NEARBY_STREAM_CHUNK_SIZE dan
+    langsung ditulis ke respons, sehingga memori tetap datar berapa pun
+    jumlah hasilnya. Hasil tidak diurutkan; gunakan field `distance`.
+    """
+    def generate_lines() -> Iterator[bytes]:
+        # Session sendiri karena session dari dependency sudah ditutup saat respons di-stream
+        stream_db = SessionLocal()
+        try:
+            user_location = WKTElement(f'POINT({lon} {lat})', srid=4326)
+            distance = func.ST_Distance(Listing.location, user_location)
+            rows = (
+                _lapak_query(stream_db, distance.label('distance'))
+                .filter(*nearby_filters(
+                    user_location, radius, status=status, unit=unit, price_min=price_min, price_max=price_max
+                ))
+                .execution_options(yield_per=NEARBY_STREAM_CHUNK_SIZE)
+            )
+            for row in rows:
+                yield to_json(_lapak_row_to_dict(row, distance=row.distance)) + b"\n"
+        finally:
+            stream_db.close()
+
+    print(f"Streaming nearby export: lat={lat}, lon={lon}, radius={radius}")
+    return StreamingResponse(generate_lines(), media_type="application/x-ndjson")
+
+def nearby_filters(
+    user_location,
+    radius: int,
+    status: str = 'available',
+    unit: Optional[str] = None,
+    price_min: Optional[Decimal] = None,
+    price_max: Optional[Decimal] = None
+) -> list:
+    """
+    Kondisi WHERE untuk pencarian nearby. Dipakai juga oleh benchmarks/nearby_explain.py
+    untuk memastikan kombinasi filter tetap memakai index.
+    """
+    filters = [
+        Listing.status == status,
+        func.ST_DWithin(Listing.location, user_location, radius)
+    ]
+    if unit:
+        filters.append(Listing.unit == unit)
+    if price_min is not None:
+        filters.append(Listing.price >= price_min)
+    if price_max is not None:
+        filters.append(Listing.price <= price_max)
+    return filters
+
+def _nearby_knn(
+    db: Session,
+    lat: float,
+    lon: float,
+    k: int,
+    max_distance: Optional[int] = None,
+    status: str = 'available',
+    unit: Optional[str] = None,
+    price_min: Optional[Decimal] = None,
+    price_max: Optional[Decimal] = None
+):
+    """
+    Jalur /nearby?mode=knn: k lapak terdekat dalam satu query.
+    ORDER BY `location <-> titik` dapat dipenuhi langsung oleh index GiST
+    (index scan berurutan jarak), sehingga Postgres berhenti setelah k baris
+    tanpa perlu radius. Jarak yang dikembalikan tetap dihitung dengan ST_Distance.
+    """
+    user_location = WKTElement(f'POINT({lon} {lat})', srid=4326)
+    filters = [Listing.status == status]
+    if max_distance:
+        filters.append(func.ST_DWithin(Listing.location, user_location, max_distance))
+    if unit:
+        filters.append(Listing.unit == unit)
+    if price_min is not None:
+        filters.append(Listing.price >= price_min)
+    if price_max is not None:
+        filters.append(Listing.price <= price_max)
+
+    # Hanya <-> di ORDER BY; tie-breaker tambahan akan mencegah urutan langsung dari index
+    results = (
+        _lapak_query(db, func.ST_Distance(Listing.location, user_location).label('distance'))
+        .filter(*filters)
+        .order_by(Listing.location.op('<->')(user_location))
+        .limit(k)
+        .all()
+    )
+
+    return {
+        "lapak": [_lapak_row_to_dict(row, distance=row.distance) for row in results],
+        "total": None,
+        "has_more": False,
+        "page": 1,
+        "limit": k
+    }
+
+def _nearby_facets_column(matched):
+    """
+    Scalar subquery JSON berisi jumlah per unit dan histogram harga dari CTE `matched`.
+    Karena tidak berkorelasi dengan baris halaman, Postgres menghitungnya sekali (InitPlan).
+    """
+    unit_counts = (
+        select(matched.c.unit, func.count().label('count'))
+        .group_by(matched.c.unit)
+        .subquery()
+    )
+    bounds = (
+        select(func.min(matched.c.price).label('low'), func.max(matched.c.price).label('high'))
+        .subquery()
+    )
+    # high + step agar harga tertinggi tetap masuk bucket terakhir (dan low != high)
+    bucketed = (
+        select(
+            func.width_bucket(
+                matched.c.price, bounds.c.low, bounds.c.high + FACET_PRICE_STEP, FACET_PRICE_BUCKETS
+            ).label('bucket')
+        )
+        .select_from(matched.join(bounds, true()))
+        .subquery()
+    )
+    histogram = (
+        select(bucketed.c.bucket, func.count().label('count'))
+        .group_by(bucketed.c.bucket)
+        .subquery()
+    )
+    return func.json_build_object(
+        'units', select(func.json_object_agg(unit_counts.c.unit, unit_counts.c.count)).scalar_subquery(),
+        'low', select(bounds.c.low).scalar_subquery(),
+        'high', select(bounds.c.high).scalar_subquery(),
+        'histogram', select(
+            func.json_agg(func.json_build_array(histogram.c.bucket, histogram.c.count))
+        ).scalar_subquery(),
+        type_=JSON
+    ).label('facets')
+
+def _build_nearby_facets(raw: dict) -> dict:
+    """Mengubah JSON facet dari database menjadi bentuk LapakFacetsSchema."""
+    if not raw or raw.get('low') is None:
+        return {"units": {}, "price_histogram": []}
+
+    low = Decimal(str(raw['low']))
+    high = Decimal(str(raw['high']))
+    width = (high + FACET_PRICE_STEP - low) / FACET_PRICE_BUCKETS
+    cent = Decimal("0.01")
+
+    price_histogram = []
+    for bucket, count in sorted(raw.get('histogram') or []):
+        price_histogram.append({
+            "lower": (low + (bucket - 1) * width).quantize(cent),
+            "upper": (low + bucket * width).quantize(cent),
+            "count": count
+        })
+
+    return {
+        "units": raw.get('units') or {},
+        "price_histogram": price_histogram
+    }
+
+def _decode_nearby_cursor(cursor: str):
+    """Mengubah cursor /nearby menjadi ((distance atau rank_score, listing id), jalur penerbit cursor)."""
+    last_distance, last_id, path = decode_cursor(cursor, 3)
+    if path not in (NEARBY_PATH_SQL, NEARBY_PATH_TILES, NEARBY_PATH_MEMORY):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    try:
+        return (float(last_distance), uuid.UUID(str(last_id))), path
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _decode_my_cursor(cursor: str):
+    """Mengubah cursor /my menjadi (created_at, listing id)."""
+    last_created_at, last_id = decode_cursor(cursor, 2)
+    try:
+        return datetime.fromisoformat(str(last_created_at)), uuid.UUID(str(last_id))
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _nearby_from_index(
+    db: Session,
+    lat: float,
+    lon: float,
+    radius: int,
+    page: int,
+    limit: int,
+    after,
+    count_mode: str,
+    price_min: Optional[float] = None,
+    price_max: Optional[float] = None
+):
+    """
+    Jalur /nearby dengan index spasial in-memory. Filter radius dan urutan
+    (distance, id) dihitung di NumPy; database hanya mengambil baris halaman.
+    """
+    spatial_index.sync_if_stale(db, SessionLocal)
+    ids, distances = spatial_index.query(lat, lon, radius, price_min=price_min, price_max=price_max)
+
+    if after:
+        last_distance, last_id = after
+        last_key = (last_distance, str(last_id))
+        start = int(np.searchsorted(distances, last_distance, side="left"))
+        while start < len(ids) and (float(distances[start]), str(ids[start])) <= last_key:
+            start += 1
+    else:
+        start = (page - 1) * limit
+
+    page_ids = ids[start:start + limit]
+    page_distances = distances[start:start + limit]
+    has_more = start + limit < len(ids)
+
+    rows_by_id = _lapak_rows_by_id(db, page_ids, 'available')
+
+    lapak_list = []
+    for listing_id, dist in zip(page_ids, page_distances):
+        row = rows_by_id.get(listing_id)
+        if row is None:
+            # Sudah tidak tersedia di database; akan hilang dari index saat re-sync
+            continue
+        lapak_list.append(_lapak_row_to_dict(row, distance=float(dist)))
+
+    total = None
+    total_capped = False
+    if count_mode == "exact":
+        total = len(ids)
+    elif count_mode == "capped":
+        total = min(len(ids), NEARBY_COUNT_CAP)
+        total_capped = len(ids) > NEARBY_COUNT_CAP
+
+    next_cursor = None
+    if has_more and page_ids:
+        next_cursor = encode_cursor([float(page_distances[-1]), str(page_ids[-1]), NEARBY_PATH_MEMORY])
+
+    return {
+        "lapak": lapak_list,
+        "total": total,
+        "total_capped": total_capped,
+        "has_more": has_more,
+        "page": page,
+        "limit": limit,
+        "next_cursor": next_cursor
+    }
+
+def _lapak_rows_by_id(db: Session, listing_ids: list, status: str) -> dict:
+    """Baris _lapak_query untuk id yang diberikan (status masih `status`), di-key dengan id."""
+    if not listing_ids:
+        return {}
+    rows = _lapak_query(db).filter(Listing.id.in_(listing_ids), Listing.status == status).all()
+    return {row.id: row for row in rows}
+
+def _nearby_cached_candidates(
+    db: Session,
+    lat: float,
+    lon: float,
+    radius: int,
+    status: str = 'available',
+    unit: Optional[str] = None,
+    price_min: Optional[Decimal] = None,
+    price_max: Optional[Decimal] = None
+):
+    """
+    Kandidat (id, latitude, longitude, rank_score) di area pencarian tile milik
+    titik ini, dari cache atau database. None jika area terlalu padat untuk di-cache.
+    """
+    tile, bucket = nearby_cache.tile_key(lat, lon, radius)
+    cache_key = (tile, bucket, status, unit, price_min, price_max)
+    candidates = nearby_cache.get(cache_key)
+    if candidates is None:
+        center_lat, center_lon, search_radius = nearby_cache.search_area(tile, bucket)
+        center = WKTElement(f'POINT({center_lon} {center_lat})', srid=4326)
+        rows = (
+            db.query(Listing.id, Listing.latitude, Listing.longitude, Listing.rank_score)
+            .filter(*nearby_filters(
+                center, search_radius, status=status, unit=unit, price_min=price_min, price_max=price_max
+            ))
+            .limit(NEARBY_CACHE_MAX_CANDIDATES + 1)
+            .all()
+        )
+        if len(rows) > NEARBY_CACHE_MAX_CANDIDATES:
+            candidates = _NEARBY_TOO_MANY_CANDIDATES
+        else:
+            candidates = tuple((row.id, row.latitude, row.longitude, row.rank_score) for row in rows)
+        nearby_cache.set(cache_key, candidates)
+
+    if candidates == _NEARBY_TOO_MANY_CANDIDATES:
+        return None
+    return candidates
+
+def _nearby_from_candidates(
+    db: Session,
+    candidates,
+    lat: float,
+    lon: float,
+    radius: int,
+    page: int,
+    limit: int,
+    after,
+    count_mode: str,
+    status: str = 'available',
+    sort: str = 'distance'
+):
+    """
+    Jalur /nearby dari kandidat cache: radius, urutan dan cursor dihitung ulang
+    terhadap titik asli pengguna dengan urutan yang sama seperti query SQL;
+    database hanya mengambil baris halaman.
+    """
+    matches = []
+    for listing_id, listing_lat, listing_lon, rank_score in candidates:
+        if listing_lat is None or listing_lon is None:
+            continue
+        dist = haversine_m(lat, lon, listing_lat, listing_lon)
+        if dist <= radius:
+            matches.append((dist, rank_score, listing_id))
+    matched_count = len(matches)
+
+    if sort == "ranked":
+        # Sama seperti ORDER BY coalesce(rank_score, 0) DESC, id DESC
+        matches = [(dist, rank_score or 0, listing_id) for dist, rank_score, listing_id in matches]
+        matches.sort(key=lambda m: (m[1], str(m[2])), reverse=True)
+        if after:
+            last_key = (after[0], str(after[1]))
+            matches = [m for m in matches if (m[1], str(m[2])) < last_key]
+    else:
+        matches.sort(key=lambda m: (m[0], str(m[2])))
+        if after:
+            last_key = (after[0], str(after[1]))
+            matches = [m for m in matches if (m[0], str(m[2])) > last_key]
+
+    start = 0 if after else (page - 1) * limit
+    page_matches = matches[start:start + limit]
+    has_more = start + limit < len(matches)
+
+    rows_by_id = _lapak_rows_by_id(db, [m[2] for m in page_matches], status)
+    lapak_list = []
+    for dist, _, listing_id in page_matches:
+        row = rows_by_id.get(listing_id)
+        if row is None:
+            # Berubah sejak kandidat di-cache; entry akan diganti setelah invalidasi atau TTL
+            continue
+        lapak_list.append(_lapak_row_to_dict(row, distance=dist))
+
+    total = None
+    total_capped = False
+    if count_mode == "exact":
+        total = matched_count
+    elif count_mode == "capped":
+        total = min(matched_count, NEARBY_COUNT_CAP)
+        total_capped = matched_count > NEARBY_COUNT_CAP
+
+    next_cursor = None
+    if has_more and page_matches:
+        dist, rank_score, listing_id = page_matches[-1]
+        next_cursor = encode_cursor([rank_score if sort == "ranked" else dist, str(listing_id), NEARBY_PATH_TILES])
+
+    return {
+        "lapak": lapak_list,
+        "total": total,
+        "total_capped": total_capped,
+        "has_more": has_more,
+        "page": page,
+        "limit": limit,
+        "next_cursor": next_cursor,
+        "facets": None
+    }
+
+@router.get("/clusters", response_model=LapakClusterResponse)
+def get_lapak_clusters(
+    bbox: str = Query(..., description="Viewport as min_lon,min_lat,max_lon,max_lat"),
+    zoom: int = Query(..., description="Map zoom level", ge=0, le=22),
+    db: Session = Depends(get_db)
+):
+    """
+    Mengelompokkan lapak yang tersedia di dalam viewport peta menjadi cluster.
+    Cluster dihitung di server dengan grid per level zoom dalam satu query
+    agregat, sehingga satu viewport cukup dimuat dengan satu respons kecil.
+    Kombinasi bbox dan zoom yang mencakup lebih dari CLUSTER_MAX_CELLS sel
+    ditolak dengan 400 agar jumlah cluster tetap terbatas.
+    """
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(value) for value in bbox.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bbox must be min_lon,min_lat,max_lon,max_lat")
+    if not (-180 <= min_lon < max_lon <= 180 and -90 <= min_lat < max_lat <= 90):
+        raise HTTPException(status_code=400, detail="Invalid bbox bounds")
+
+    # Lebar satu tile pada zoom ini (derajat) dibagi jumlah sel per tile
+    cell_size = 360.0 / (2 ** zoom) / CLUSTER_CELLS_PER_TILE
+    cells = (
+        (math.floor(max_lon / cell_size) - math.floor(min_lon / cell_size) + 1)
+        * (math.floor(max_lat / cell_size) - math.floor(min_lat / cell_size) + 1)
+    )
+    if cells > CLUSTER_MAX_CELLS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"bbox is too large for zoom {zoom}: {cells} cells exceed the limit of {CLUSTER_MAX_CELLS}"
+        )
+
+    cell_x = func.floor(Listing.longitude / cell_size)
+    cell_y = func.floor(Listing.latitude / cell_size)
+    viewport = func.ST_MakeEnvelope(min_lon, min_lat, max_lon, max_lat, 4326).cast(Geography(srid=4326))
+
+    rows = (
         db.query(
-            Listing,
-            func.ST_X(Listing.location.cast(Geometry)).label('longitude'),
-            func.ST_Y(Listing.location.cast(Geometry)).label('latitude'),
-            func.ST_Distance(Listing.location, user_location).label('distance')
+            func.count(Listing.id).label('count'),
+            func.avg(Listing.latitude).label('latitude'),
+            func.avg(Listing.longitude).label('longitude'),
+            func.min(Listing.price).label('min_price'),
+            func.max(Listing.price).label('max_price'),
+            func.min(cast(Listing.id, String)).label('any_id')
         )
-        .options(selectinload(Listing.seller))
+        .filter(Listing.status == 'available')
+        .filter(Listing.location.op('&&')(viewport))
+        .group_by(cell_x, cell_y)
+        .limit(CLUSTER_MAX_CELLS)
+        .all()
+    )
+
+    clusters = [
+        LapakClusterSchema(
+            latitude=row.latitude,
+            longitude=row.longitude,
+            count=row.count,
+            min_price=row.min_price,
+            max_price=row.max_price,
+            listing_id=row.any_id if row.count == 1 else None
+        )
+        for row in rows
+    ]
+
+    return LapakClusterResponse(clusters=clusters, zoom=zoom, cell_size=cell_size)
+
+@router.get("/search", response_model=LapakListResponse)
+def search_lapak(
+    q: str = Query(..., description="Search keywords", min_length=2, max_length=100),
+    lat: float = Query(..., description="Latitude of the user's location"),
+    lon: float = Query(..., description="Longitude of the user's location"),
+    radius: int = Query(5000, description="Radius in meters", gt=0),
+    page: int = Query(1, description="Page number", gt=0),
+    limit: int = Query(12, description="Items per page", gt=0, le=50),
+    db: Session = Depends(get_db)
+):
+    """
+    Mencari "Lapak Warga" berdasarkan kata kunci di sekitar lokasi tertentu.
+
+    Kata kunci dicocokkan dengan full-text search (konfigurasi 'indonesian')
+    pada judul dan deskripsi, ditambah kemiripan trigram pada judul agar
+    salah ketik tetap ditemukan. Hasil diurutkan berdasarkan gabungan
+    relevansi dan jarak.
+    """
+    user_location = WKTElement(f'POINT({lon} {lat})', srid=4326)
+    distance = func.ST_Distance(Listing.location, user_location)
+    ts_query = func.websearch_to_tsquery('indonesian', q)
+
+    relevance = (
+        func.ts_rank_cd(Listing.search_vector, ts_query)
+        + SEARCH_TRIGRAM_WEIGHT * func.similarity(Listing.title, q)
+    )
+    score = relevance / (1 + distance / SEARCH_DISTANCE_HALF_SCORE_M)
+
+    results = (
+        _lapak_query(db, distance.label('distance'))
         .filter(Listing.status == 'available')
         .filter(func.ST_DWithin(Listing.location, user_location, radius))
-        .order_by(func.ST_Distance(Listing.location, user_location))
+        .filter(or_(
+            Listing.search_vector.op('@@')(ts_query),
+            Listing.title.op('%')(q)
+        ))
+        .order_by(score.desc(), Listing.id)
+        .offset((page - 1) * limit)
+        .limit(limit + 1)
+        .all()
     )
-    
-    total = base_query.count()
-    offset = (page - 1) * limit
-    results = base_query.offset(offset).limit(limit).all()
+    has_more = len(results) > limit
+    results = results[:limit]
 
-    # Process results to combine Listing object with derived fields
-    lapak_list = []
-    for listing, lon, lat, dist in results:
-        lapak_schema = LapakSchema.from_orm(listing)
-        lapak_schema.longitude = lon
-        lapak_schema.latitude = lat
-        lapak_schema.distance = dist
-        lapak_list.append(lapak_schema)
+    lapak_list = [_lapak_row_to_dict(row, distance=row.distance) for row in results]
 
     return {
         "lapak": lapak_list,
-        "total": total,
+        "has_more": has_more,
         "page": page,
         "limit": limit
     }
 
+@router.get("/batch", response_model=LapakBatchResponse)
+def get_lapak_batch(
+    ids: str = Query(..., description="Comma-separated listing IDs (max 100)"),
+    db: Session = Depends(get_db)
+):
+    """
+    Mendapatkan detail beberapa lapak sekaligus (mis. untuk layar "tersimpan"
+    dan "terakhir dilihat"). Semua id di-resolve dengan satu query beserta
+    data penjualnya. Hasil mengikuti urutan id pada request; id yang tidak
+    ditemukan dikembalikan di missing_ids.
+    """
+    requested_ids = []
+    seen = set()
+    for raw_id in ids.split(","):
+        raw_id = raw_id.strip()
+        if not raw_id:
+            continue
+        try:
+            listing_id = uuid.UUID(raw_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid listing id: {raw_id}")
+        if listing_id not in seen:
+            seen.add(listing_id)
+            requested_ids.append(listing_id)
+
+    if not requested_ids:
+        raise HTTPException(status_code=400, detail="ids must not be empty")
+    if len(requested_ids) > BATCH_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"A maximum of {BATCH_MAX_IDS} ids is allowed")
+
+    results = _lapak_query(db).filter(Listing.id.in_(requested_ids)).all()
+    rows_by_id = {row.id: row for row in results}
+
+    lapak_list = []
+    missing_ids = []
+    for listing_id in requested_ids:
+        row = rows_by_id.get(listing_id)
+        if row is None:
+            missing_ids.append(listing_id)
+            continue
+        lapak_list.append(_lapak_row_to_dict(row))
+
+    return {
+        "lapak": lapak_list,
+        "missing_ids": missing_ids
+    }
+
 @router.get("/my", response_model=LapakListResponse)
 def get_my_lapak(
     page: int = Query(1, description="Page number", gt=0),
     limit: int = Query(12, description="Items per page", gt=0, le=50),
     status: Optional[str] = Query(None, description="Filter by status: available, sold_out, inactive"),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from next_cursor of the previous page"),
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
     """
     Mendapatkan semua lapak milik user yang sedang login.
     Endpoint ini memungkinkan user melihat semua produk yang telah mereka buat.
+
+    Dengan `cursor`, halaman berikutnya diambil dengan keyset pagination
+    berdasarkan (created_at, id) dan total tidak dihitung ulang; gunakan
+    /lapak/my/summary untuk jumlah per status.
+
+    Lapak yang sudah dipindah ke listings_archive ikut ditampilkan agar
+    penjual tetap bisa menemukan dan mengaktifkannya kembali.
     """
     current_user_uuid = uuid.UUID(current_user.id) if isinstance(current_user.id, str) else current_user.id
+    after = _decode_my_cursor(cursor) if cursor else None
     
-    base_query = (
-        db.query(
-            Listing,
-            func.ST_X(Listing.location.cast(Geometry)).label('longitude'),
-            func.ST_Y(Listing.location.cast(Geometry)).label('latitude')
-        )
-        .options(selectinload(Listing.seller))
-        .filter(Listing.seller_id == current_user_uuid)
-    )
+    live_query = _lapak_query(db).filter(Listing.seller_id == current_user_uuid)
+    archived_query = _archived_lapak_query(db).filter(ListingArchive.seller_id == current_user_uuid)
     
     if status:
-        base_query = base_query.filter(Listing.status == status)
-    
-    base_query = base_query.order_by(Listing.created_at.desc())
-    
-    total = base_query.count()
-    offset = (page - 1) * limit
-    results = base_query.offset(offset).limit(limit).all()
+        live_query = live_query.filter(Listing.status == status)
+        archived_query = archived_query.filter(ListingArchive.status == status)
+
+    # Kolom Listing pada filter dan urutan di bawah diadaptasi ke kolom hasil UNION
+    base_query = live_query.union_all(archived_query)
+
+    total = None
+    if after:
+        last_created_at, last_id = after
+        page_query = base_query.filter(tuple_(Listing.created_at, Listing.id) < tuple_(last_created_at, last_id))
+    else:
+        total = base_query.count()
+        page_query = base_query.offset((page - 1) * limit)
+
+    # id sebagai tie-breaker agar urutan stabil untuk cursor
+    results = (
+        page_query
+        .order_by(Listing.created_at.desc(), Listing.id.desc())
+        .limit(limit + 1)
+        .all()
+    )
+    has_more = len(results) > limit
+    results = results[:limit]
     
-    lapak_list = []
-    for listing, lon, lat in results:
-        lapak_schema = LapakSchema.from_orm(listing)
-        lapak_schema.longitude = lon
-        lapak_schema.latitude = lat
-        lapak_list.append(lapak_schema)
-        
+    lapak_list = [_lapak_row_to_dict(row) for row in results]
+
+    next_cursor = None
+    if has_more and results:
+        next_cursor = encode_cursor([results[-1].created_at.isoformat(), str(results[-1].id)])
+
     return {
         "lapak": lapak_list,
         "total": total,
+        "has_more": has_more,
         "page": page,
-        "limit": limit
+        "limit": limit,
+        "next_cursor": next_cursor
     }
 
-@router.get("/{listing_id}", response_model=LapakSchema)
-def get_lapak_detail(listing_id: str, db: Session = Depends(get_db)):
+@router.get("/my/summary", response_model=LapakSellerSummary)
+def get_my_lapak_summary(
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
     """
-    Mendapatkan detail lapak berdasarkan ID.
+    Ringkasan dasbor penjual: jumlah lapak per status, nilai stok yang
+    tersedia, dan waktu perubahan terakhir, dihitung dalam satu query agregat
+    atas listings dan listings_archive.
     """
-    result = (
+    current_user_uuid = uuid.UUID(current_user.id) if isinstance(current_user.id, str) else current_user.id
+
+    owned = (
+        select(
+            Listing.status, Listing.price, Listing.stock_quantity,
+            func.coalesce(Listing.updated_at, Listing.created_at).label('changed_at')
+        )
+        .where(Listing.seller_id == current_user_uuid)
+        .union_all(
+            select(
+                ListingArchive.status, ListingArchive.price, ListingArchive.stock_quantity,
+                func.coalesce(ListingArchive.updated_at, ListingArchive.created_at).label('changed_at')
+            )
+            .where(ListingArchive.seller_id == current_user_uuid)
+        )
+        .subquery('owned')
+    )
+    rows = (
         db.query(
-            Listing,
-            func.ST_X(Listing.location.cast(Geometry)).label('longitude'),
-            func.ST_Y(Listing.location.cast(Geometry)).label('latitude')
+            owned.c.status,
+            func.count().label('count'),
+            func.sum(owned.c.price * owned.c.stock_quantity).label('stock_value'),
+            func.max(owned.c.changed_at).label('last_updated_at')
         )
-        .options(selectinload(Listing.seller))
-        .filter(Listing.id == listing_id)
-        .first()
+        .group_by(owned.c.status)
+        .all()
     )
-    
+
+    counts = {"available": 0, "sold_out": 0, "inactive": 0}
+    total_stock_value = Decimal("0")
+    last_updated_at = None
+    for row in rows:
+        counts[row.status] = row.count
+        if row.status == 'available':
+            total_stock_value = row.stock_value or Decimal("0")
+        if row.last_updated_at and (last_updated_at is None or row.last_updated_at > last_updated_at):
+            last_updated_at = row.last_updated_at
+
+    return {
+        "counts": counts,
+        "total": sum(counts.values()),
+        "total_stock_value": total_stock_value,
+        "last_updated_at": last_updated_at
+    }
+
+@router.get("/{listing_id}", response_model=LapakSchema)
+def get_lapak_detail(
+    listing_id: str,
+    request: Request,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+    current_user = Depends(get_optional_user)
+):
+    """
+    Mendapatkan detail lapak berdasarkan ID.
+
+    Respons menyertakan ETag dari updated_at. Jika klien mengirim
+    If-None-Match yang cocok, endpoint menjawab 304 hanya dengan query
+    versi, tanpa membangun ulang payload.
+
+    Setiap respons 200 dihitung sebagai satu view (buffer in-memory, lihat
+    app/services/view_counter.py). Revalidasi 304 dari klien yang polling
+    tidak dihitung.
+
+    Lapak yang tidak ada di tabel listings dicari di listings_archive
+    (lapak lama yang sudah habis/nonaktif), sehingga tautan lama tetap berfungsi.
+    """
+    if if_none_match:
+        version = (
+            db.query(Listing.updated_at, Listing.created_at)
+            .filter(Listing.id == listing_id)
+            .first()
+        ) or (
+            db.query(ListingArchive.updated_at, ListingArchive.created_at)
+            .filter(ListingArchive.id == listing_id)
+            .first()
+        )
+        if not version:
+            raise HTTPException(status_code=404, detail="Lapak not found")
+        etag = make_etag(version.updated_at or version.created_at)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+
+    result = _lapak_query(db).filter(Listing.id == listing_id).first()
+    archived = False
+    if not result:
+        result = _archived_lapak_query(db).filter(ListingArchive.id == listing_id).first()
+        archived = result is not None
+
     if not result:
         raise HTTPException(status_code=404, detail="Lapak not found")
-    
-    listing, lon, lat = result
-    lapak_schema = LapakSchema.from_orm(listing)
-    lapak_schema.longitude = lon
-    lapak_schema.latitude = lat
-    
-    return lapak_schema
+
+    response.headers["ETag"] = make_etag(result.updated_at or result.created_at)
+    response.headers["Cache-Control"] = "no-cache"
+
+    if settings.VIEW_COUNTER_ENABLED and not archived:
+        view_counter.start(SessionLocal)
+        view_counter.record(result.id, _viewer_key(request, current_user))
+
+    return _lapak_row_to_dict(result)
+
+def _viewer_key(request: Request, current_user) -> str:
+    """Identitas viewer untuk sketch viewer unik: user id jika login, selain itu IP + user agent."""
+    if current_user is not None:
+        return f"user:{current_user.id}"
+    client_host = request.client.host if request.client else ""
+    return f"anon:{client_host}|{request.headers.get('user-agent', '')}"
 
 @router.put("/{listing_id}", response_model=LapakSchema)
 def update_lapak(
@@ -278,19 +1360,35 @@ def update_lapak(
 ):
     """
     Memperbarui detail lapak. Hanya pemilik lapak yang bisa melakukan ini.
+
+    Lapak yang sudah diarsipkan dikembalikan dulu ke tabel listings dalam
+    transaksi yang sama, sehingga penjual bisa mengaktifkannya lagi.
     """
-    listing = (
+    listing_query = (
         db.query(Listing)
         .options(selectinload(Listing.seller))
         .filter(Listing.id == listing_id)
-        .first()
     )
-    
-    if not listing:
-        raise HTTPException(status_code=404, detail="Lapak not found")
-    
+    listing = listing_query.first()
+
     # Convert current_user.id string to UUID for comparison
     current_user_uuid = uuid.UUID(current_user.id) if isinstance(current_user.id, str) else current_user.id
+
+    if not listing:
+        archived_seller_id = (
+            db.query(ListingArchive.seller_id)
+            .filter(ListingArchive.id == listing_id)
+            .scalar()
+        )
+        if archived_seller_id is None:
+            raise HTTPException(status_code=404, detail="Lapak not found")
+        if archived_seller_id != current_user_uuid:
+            raise HTTPException(status_code=403, detail="Not authorized to update this lapak")
+        # Jika request lain sudah memulihkannya lebih dulu, lapak tetap ditemukan di listings
+        maintenance.restore_archived_listing(db, listing_id)
+        listing = listing_query.first()
+        if not listing:
+            raise HTTPException(status_code=404, detail="Lapak not found")
     
     if listing.seller_id != current_user_uuid:
         raise HTTPException(status_code=403, detail="Not authorized to update this lapak")
@@ -302,192 +1400,350 @@ def update_lapak(
     
     db.commit()
     db.refresh(listing)
+
+    # Perubahan status/harga/stok memengaruhi hasil nearby di sekitar lapak ini
+    if listing.latitude is not None and listing.longitude is not None:
+        nearby_cache.invalidate_point(listing.latitude, listing.longitude)
+        if listing.status == 'available':
+            spatial_index.upsert(listing.id, listing.latitude, listing.longitude, listing.price)
+        else:
+            spatial_index.remove(listing.id)
+
     return listing
 
+@router.post("/{listing_id}/reserve", response_model=LapakReserveResponse)
+def reserve_lapak(
+    listing_id: uuid.UUID,
+    reserve_data: LapakReserve,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """
+    Memesan sejumlah stok lapak secara atomik.
+
+    Pengurangan stok dilakukan dengan satu UPDATE bersyarat
+    (stock_quantity >= quantity) tanpa SELECT ... FOR UPDATE, sehingga
+    pesanan bersamaan saat flash sale tidak saling menunggu lock baris.
+    Status berubah menjadi 'sold_out' di statement yang sama saat stok habis.
+    """
+    quantity = reserve_data.quantity
+    remaining = Listing.stock_quantity - quantity
+
+    reserved = db.execute(
+        update(Listing)
+        .where(
+            Listing.id == listing_id,
+            Listing.status == 'available',
+            Listing.stock_quantity >= quantity
+        )
+        .values(
+            stock_quantity=remaining,
+            status=case((remaining == 0, 'sold_out'), else_=Listing.status),
+            updated_at=func.now()
+        )
+        .returning(Listing.stock_quantity, Listing.status, Listing.price, Listing.latitude, Listing.longitude)
+        .execution_options(synchronize_session=False)
+    ).first()
+
+    if reserved is None:
+        db.rollback()
+        # Cari tahu alasan gagal hanya di jalur gagal; jalur sukses tetap satu statement
+        current = (
+            db.query(Listing.status, Listing.stock_quantity)
+            .filter(Listing.id == listing_id)
+            .first()
+        )
+        if not current:
+            raise HTTPException(status_code=404, detail="Lapak not found")
+        if current.status != 'available':
+            raise HTTPException(status_code=409, detail="Lapak is not available")
+        raise HTTPException(
+            status_code=409,
+            detail=f"Insufficient stock. Only {current.stock_quantity} unit(s) left."
+        )
+
+    db.commit()
+    print(f"Reserved {quantity} unit(s) of lapak {listing_id}, remaining stock: {reserved.stock_quantity}")
+
+    # Stok dan status berubah; perbarui cache nearby dan index spasial
+    if reserved.latitude is not None and reserved.longitude is not None:
+        nearby_cache.invalidate_point(reserved.latitude, reserved.longitude)
+        if reserved.status == 'available':
+            spatial_index.upsert(listing_id, reserved.latitude, reserved.longitude, reserved.price)
+        else:
+            spatial_index.remove(listing_id)
+
+    return {
+        "listing_id": listing_id,
+        "reserved_quantity": quantity,
+        "remaining_stock": reserved.stock_quantity,
+        "status": reserved.status
+    }
+
+@router.get("/{listing_id}/stats", response_model=LapakViewStats)
+def get_lapak_view_stats(
+    listing_id: uuid.UUID,
+    days: int = Query(30, description="Number of days of unique viewer history", gt=0, le=VIEW_STATS_MAX_DAYS),
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """
+    Statistik view lapak untuk pemiliknya: total view dan perkiraan viewer
+    unik (HyperLogLog) per hari dan gabungan `days` hari terakhir.
+    View yang masih di buffer proses ini ikut dihitung.
+    """
+    listing = db.query(Listing.seller_id, Listing.view_count).filter(Listing.id == listing_id).first()
+    if not listing:
+        raise HTTPException(status_code=404, detail="Lapak not found")
+
+    current_user_uuid = uuid.UUID(current_user.id) if isinstance(current_user.id, str) else current_user.id
+    if listing.seller_id != current_user_uuid:
+        raise HTTPException(status_code=403, detail="Not authorized to view stats of this lapak")
+
+    since = datetime.now(timezone.utc).date() - timedelta(days=days - 1)
+    rows = db.execute(
+        text("""
+            SELECT day, registers FROM listing_view_sketches
+            WHERE listing_id = :listing_id AND day >= :since
+        """),
+        {"listing_id": listing_id, "since": since}
+    ).fetchall()
+
+    pending_count, pending_sketches = view_counter.pending(listing_id)
+    daily = {row.day: HyperLogLog.from_bytes(bytes(row.registers)) for row in rows}
+    for day, sketch in pending_sketches.items():
+        if day in daily:
+            daily[day].merge(sketch)
+        elif day >= since:
+            daily[day] = sketch
+
+    combined = HyperLogLog()
+    for sketch in daily.values():
+        combined.merge(sketch)
+
+    return {
+        "listing_id": listing_id,
+        "total_views": listing.view_count + pending_count,
+        "unique_viewers": combined.count(),
+        "days": days,
+        "daily": [
+            {"day": day, "unique_viewers": sketch.count()}
+            for day, sketch in sorted(daily.items())
+        ]
+    }
+
+@router.post("/internal/refresh-rank-scores", include_in_schema=False)
+def trigger_rank_score_refresh(
+    background_tasks: BackgroundTasks,
+    batch_size: int = Query(1000, description="Rows per batch", gt=0, le=10000),
+    db: Session = Depends(get_db)  # Hanya untuk respons 503 jika database tidak tersedia
+):
+    """
+    Endpoint internal untuk meluruhkan rank_score lapak secara berkala.
+    Dipanggil oleh cron job atau scheduler eksternal, sama seperti
+    /borongan/internal/trigger-deadline-check.
+    """
+    background_tasks.add_task(maintenance.refresh_rank_scores, SessionLocal, batch_size)
+    return {
+        "message": "Rank score refresh has been triggered in the background.",
+        "timestamp": datetime.now(timezone.utc).isoformat()
+    }
+
+@router.post("/internal/archive-stale", include_in_schema=False)
+def trigger_listing_archive(
+    background_tasks: BackgroundTasks,
+    batch_size: int = Query(1000, description="Rows per batch", gt=0, le=10000),
+    max_batches: Optional[int] = Query(None, description="Stop after this many batches", gt=0),
+    db: Session = Depends(get_db)  # Hanya untuk respons 503 jika database tidak tersedia
+):
+    """
+    Endpoint internal untuk memindahkan lapak inactive yang tidak berubah selama
+    LISTING_ARCHIVE_AFTER_DAYS ke listings_archive. Dipanggil berkala oleh cron
+    job atau scheduler eksternal. Batas umur sengaja tidak bisa diubah dari
+    request karena endpoint ini tidak memakai autentikasi.
+    """
+    stale_days = settings.LISTING_ARCHIVE_AFTER_DAYS
+    background_tasks.add_task(
+        maintenance.archive_stale_listings, SessionLocal, stale_days, batch_size, max_batches
+    )
+    return {
+        "message": "Listing archive job has been triggered in the background.",
+        "stale_days": stale_days,
+        "timestamp": datetime.now(timezone.utc).isoformat()
+    }
+
 @router.get("/debug/locations", tags=["Debug"])
 def debug_lapak_locations(
+    limit: int = Query(50, description="Items per page", gt=0, le=500),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from next_cursor of the previous page"),
     db: Session = Depends(get_db)
 ):
     """
     Debug endpoint to check location data of lapak items.
-    Shows coordinates for all lapak items.
-    """
-    # Query all lapak with their seller information and extract coordinates
-    query = """
-    SELECT 
-        l.id,
-        l.title,
-        l.status,
-        p.full_name as seller_name,
-        ST_X(l.location::geometry) as longitude,
-        ST_Y(l.location::geometry) as latitude,
-        ST_X(p.location::geometry) as seller_longitude,
-        ST_Y(p.location::geometry) as seller_latitude
-    FROM listings l
-    JOIN profiles p ON l.seller_id = p.id
-    ORDER BY l.created_at DESC
-    LIMIT 20
+    Laporan dipaginasi dengan keyset pada id lapak; ikuti `next_cursor`
+    untuk membaca seluruh tabel tanpa OFFSET.
     """
-    
-    result = db.execute(query)
-    rows = result.fetchall()
-    
+    last_id = _decode_debug_cursor(cursor) if cursor else DEBUG_NIL_UUID
+    rows = db.execute(
+        text("""
+            SELECT
+                l.id,
+                l.title,
+                l.status,
+                p.full_name AS seller_name,
+                l.longitude,
+                l.latitude,
+                p.longitude AS seller_longitude,
+                p.latitude AS seller_latitude
+            FROM listings l
+            JOIN profiles p ON l.seller_id = p.id
+            WHERE l.id > :last_id
+            ORDER BY l.id
+            LIMIT :limit
+        """),
+        {"last_id": last_id, "limit": limit + 1}
+    ).fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
     return {
         "total_lapak": len(rows),
+        "has_more": has_more,
+        "next_cursor": encode_cursor([str(rows[-1].id)]) if has_more else None,
         "lapak_locations": [
             {
-                "id": str(row[0]),
-                "title": row[1],
-                "status": row[2],
-                "seller_name": row[3],
+                "id": str(row.id),
+                "title": row.title,
+                "status": row.status,
+                "seller_name": row.seller_name,
                 "lapak_coordinates": {
-                    "longitude": float(row[4]) if row[4] else None,
-                    "latitude": float(row[5]) if row[5] else None
+                    "longitude": row.longitude,
+                    "latitude": row.latitude
                 },
                 "seller_coordinates": {
-                    "longitude": float(row[6]) if row[6] else None,
-                    "latitude": float(row[7]) if row[7] else None
+                    "longitude": row.seller_longitude,
+                    "latitude": row.seller_latitude
                 }
             }
             for row in rows
         ]
     }
 
+@router.get("/debug/cache-stats", tags=["Debug"])
+def debug_nearby_cache_stats():
+    """
+    Debug endpoint untuk melihat hit/miss counter cache /lapak/nearby.
+    """
+    return {
+        "enabled": settings.NEARBY_CACHE_ENABLED,
+        **nearby_cache.stats()
+    }
+
 @router.get("/debug/profiles", tags=["Debug"])
 def debug_seller_profiles(
+    limit: int = Query(50, description="Items per page", gt=0, le=500),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from next_cursor of the previous page"),
     db: Session = Depends(get_db)
 ):
     """
     Debug endpoint to check which sellers have location data set.
+    Laporan dipaginasi dengan keyset pada id profil; jumlah lapak dihitung
+    hanya untuk profil di halaman tersebut.
     """
-    # Query all profiles that have created lapak items
-    query = """
-    SELECT DISTINCT
-        p.id,
-        p.full_name,
-        ST_X(p.location::geometry) as longitude,
-        ST_Y(p.location::geometry) as latitude,
-        COUNT(l.id) as lapak_count
-    FROM profiles p
-    LEFT JOIN listings l ON p.id = l.seller_id
-    WHERE l.id IS NOT NULL
-    GROUP BY p.id, p.full_name, p.location
-    ORDER BY lapak_count DESC
-    """
-    
-    result = db.execute(query)
-    rows = result.fetchall()
-    
+    rows = db.execute(
+        text("""
+            SELECT
+                p.id,
+                p.full_name,
+                p.longitude,
+                p.latitude,
+                (SELECT count(*) FROM listings l WHERE l.seller_id = p.id) AS lapak_count
+            FROM profiles p
+            WHERE p.id > :last_id
+            AND EXISTS (SELECT 1 FROM listings l WHERE l.seller_id = p.id)
+            ORDER BY p.id
+            LIMIT :limit
+        """),
+        {"last_id": _decode_debug_cursor(cursor) if cursor else DEBUG_NIL_UUID, "limit": limit + 1}
+    ).fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
     profiles_with_location = []
     profiles_without_location = []
-    
+
     for row in rows:
         profile_data = {
-            "id": str(row[0]),
-            "full_name": row[1],
+            "id": str(row.id),
+            "full_name": row.full_name,
             "coordinates": {
-                "longitude": float(row[2]) if row[2] else None,
-                "latitude": float(row[3]) if row[3] else None
+                "longitude": row.longitude,
+                "latitude": row.latitude
             },
-            "lapak_count": row[4]
+            "lapak_count": row.lapak_count
         }
-        
-        if row[2] is not None and row[3] is not None:
+
+        if row.longitude is not None and row.latitude is not None:
             profiles_with_location.append(profile_data)
         else:
             profiles_without_location.append(profile_data)
-    
+
     return {
         "total_sellers": len(rows),
         "sellers_with_location": len(profiles_with_location),
         "sellers_without_location": len(profiles_without_location),
+        "has_more": has_more,
+        "next_cursor": encode_cursor([str(rows[-1].id)]) if has_more else None,
         "profiles_with_location": profiles_with_location,
         "profiles_without_location": profiles_without_location
     }
 
+def _decode_debug_cursor(cursor: str) -> uuid.UUID:
+    """Mengubah cursor laporan debug menjadi id terakhir yang sudah dibaca."""
+    (last_id,) = decode_cursor(cursor, 1)
+    try:
+        return uuid.UUID(str(last_id))
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 @router.post("/debug/fix-locations", tags=["Debug"])
 def fix_lapak_locations(
-    default_lat: float = Query(-6.200000, description="Default latitude (Jakarta center)"),
-    default_lon: float = Query(106.816666, description="Default longitude (Jakarta center)"),
-    db: Session = Depends(get_db)
+    default_lat: float = Query(-6.200000, description="Default latitude (Jakarta center)", ge=-90, le=90),
+    default_lon: float = Query(106.816666, description="Default longitude (Jakarta center)", ge=-180, le=180),
+    batch_size: int = Query(1000, description="Rows per batch", gt=0, le=10000),
+    max_batches: int = Query(50, description="Maximum batches to run in this request", gt=0),
+    restart: bool = Query(False, description="Ignore the checkpoint and start over"),
+    db: Session = Depends(get_db)  # Hanya untuk respons 503 jika database tidak tersedia
 ):
     """
-    Emergency migration: Set default location for lapak items that don't have location data.
-    This is a one-time fix for existing data.
-    """
-    from geoalchemy2.shape import from_shape
-    from shapely.geometry import Point
-    
-    # 1. Find all lapak items without location
-    query_find = """
-    SELECT l.id, l.title, p.full_name as seller_name
-    FROM listings l
-    JOIN profiles p ON l.seller_id = p.id
-    WHERE l.location IS NULL OR p.location IS NULL
+    Mengisi lokasi default untuk profil penjual dan lapak yang belum memiliki lokasi.
+
+    Dijalankan bertahap per batch primary key dengan checkpoint (lihat
+    app/services/maintenance.py). Setiap batch di-commit sendiri; jika
+    `status` belum `completed`, panggil lagi untuk melanjutkan dari checkpoint.
+    Koordinat default dari awal run tetap dipakai sampai run selesai.
+    Mengembalikan 409 jika run lain sedang berjalan.
     """
-    
-    result = db.execute(query_find)
-    rows = result.fetchall()
-    
-    if not rows:
-        return {
-            "message": "No lapak items need location fixes",
-            "fixed_count": 0
-        }
-    
-    # 2. Create default location point
-    default_location = from_shape(Point(default_lon, default_lat), srid=4326)
-    
-    # 3. Update profiles without location first
-    update_profiles_query = """
-    UPDATE profiles 
-    SET location = ST_SetSRID(ST_MakePoint(%s, %s), 4326)
-    WHERE id IN (
-        SELECT DISTINCT l.seller_id 
-        FROM listings l 
-        JOIN profiles p ON l.seller_id = p.id 
-        WHERE p.location IS NULL
+    progress = maintenance.run_location_backfill(
+        SessionLocal,
+        default_lat=default_lat,
+        default_lon=default_lon,
+        batch_size=batch_size,
+        max_batches=max_batches,
+        restart=restart
     )
+    if progress["status"] == "already_running":
+        raise HTTPException(status_code=409, detail="Location backfill is already running")
+    if progress["updated_this_run"]:
+        nearby_cache.clear()
+    return progress
+
+@router.get("/debug/fix-locations", tags=["Debug"])
+def fix_lapak_locations_status(db: Session = Depends(get_db)):
     """
-    
-    db.execute(update_profiles_query, (default_lon, default_lat))
-    
-    # 4. Update lapak items without location
-    update_lapak_query = """
-    UPDATE listings 
-    SET location = ST_SetSRID(ST_MakePoint(%s, %s), 4326)
-    WHERE location IS NULL
-    """
-    
-    db.execute(update_lapak_query, (default_lon, default_lat))
-    
-    # 5. Update lapak items where seller doesn't have location
-    update_lapak_from_profile_query = """
-    UPDATE listings l
-    SET location = p.location
-    FROM profiles p
-    WHERE l.seller_id = p.id 
-    AND l.location IS NULL 
-    AND p.location IS NOT NULL
+    Progres terakhir job fix-locations dari tabel checkpoint.
     """
-    
-    db.execute(update_lapak_from_profile_query)
-    
-    db.commit()
-    
-    return {
-        "message": f"Successfully fixed location data for {len(rows)} lapak items",
-        "fixed_count": len(rows),
-        "default_coordinates": {
-            "latitude": default_lat,
-            "longitude": default_lon
-        },
-        "fixed_items": [
-            {
-                "id": str(row[0]),
-                "title": row[1],
-                "seller_name": row[2]
-            }
-            for row in rows
-        ]
-    } 
\ No newline at end of file
+    checkpoint = maintenance.get_checkpoint(db, maintenance.LOCATION_BACKFILL_JOB)
+    if not checkpoint:
+        return {"job_name": maintenance.LOCATION_BACKFILL_JOB, "status": "not_started"}
+    return checkpoint
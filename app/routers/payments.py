@@ -9,9 +9,9 @@ from sqlalchemy.orm import Session
 from ..core.config import settings
 from ..core.database import get_db
 from ..models.group_buy_participant import GroupBuyParticipant
-from ..models.group_buy import GroupBuy
 from ..schemas.payment import PaymentStatusResponse
 from ..services import tripay as tripay_service
+from ..services.group_buy_totals import set_payment_status, GroupBuyQuotaExceeded
 
 router = APIRouter(
     prefix="/payments",
@@ -62,11 +62,11 @@ async def tripay_webhook(request: Request, db: Session = Depends(get_db)):
         if not merchant_ref:
             raise HTTPException(status_code=400, detail="Merchant reference not found in callback")
 
-        # 4. Ambil partisipan dengan row-level locking untuk mencegah race condition
+        # 4. Ambil partisipan; set_payment_status mengunci group_buy lalu partisipan
+        # dan membaca ulang statusnya, sehingga webhook ganda tidak dihitung dua kali
         participant = (
             db.query(GroupBuyParticipant)
             .filter(GroupBuyParticipant.id == merchant_ref)
-            .with_for_update()  # Kunci baris partisipan
             .first()
         )
 
@@ -81,9 +81,8 @@ async def tripay_webhook(request: Request, db: Session = Depends(get_db)):
         if payment_status == "PAID":
             # Jika status sudah 'paid', tidak perlu melakukan apa-apa lagi
             if participant.payment_status != "paid":
-                participant.payment_status = "paid"
+                set_payment_status(db, participant, "paid")
                 print(f"Payment for participant {participant.id} confirmed as PAID.")
-                db.add(participant)
                 db.commit()
             else:
                 print(f"Payment for participant {participant.id} already marked as PAID. Ignoring.")
@@ -93,41 +92,19 @@ async def tripay_webhook(request: Request, db: Session = Depends(get_db)):
             # untuk mencegah rollback ganda
             if participant.payment_status != "failed":
                 print(f"Payment for participant {participant.id} {payment_status}. Rolling back quantity...")
-                participant.payment_status = "failed"
-                
-                # Cari borongan terkait dengan row-level locking
-                group_buy = (
-                    db.query(GroupBuy)
-                    .filter(GroupBuy.id == participant.group_buy_id)
-                    .with_for_update()  # Kunci juga baris group_buy
-                    .first()
-                )
-
-                if group_buy:
-                    # Kembalikan kuantitas yang dipesan
-                    group_buy.current_quantity -= participant.quantity_ordered
-                    
-                    # Jika borongan sebelumnya 'successful' karena partisipan ini,
-                    # kembalikan statusnya ke 'active'
-                    if group_buy.status == 'successful' and group_buy.current_quantity < group_buy.target_quantity:
-                        group_buy.status = 'active'
-                        print(f"Group buy {group_buy.id} status reverted to 'active'.")
-
-                    db.add(group_buy)
-                    print(f"Rolled back {participant.quantity_ordered} units from group buy {group_buy.id}. New quantity: {group_buy.current_quantity}")
-                
-                # Simpan participant dengan status failed
-                db.add(participant)
-                
-                # Commit semua perubahan (participant status dan group_buy quantity) dalam satu transaksi
+
+                # Kembalikan kuantitas yang dipesan; borongan yang 'successful' karena
+                # partisipan ini kembali 'active' (lihat adjust_group_buy_totals)
+                set_payment_status(db, participant, "failed")
+
+                # Commit semua perubahan (participant status dan ringkasan group_buy) dalam satu transaksi
                 db.commit()
             else:
                 print(f"Payment for participant {participant.id} already marked as failed. Ignoring duplicate webhook.")
             
         elif payment_status == "UNPAID":
             if participant.payment_status != "pending":
-                participant.payment_status = "pending"
-                db.add(participant)
+                set_payment_status(db, participant, "pending")
                 db.commit()
                 print(f"Payment for participant {participant.id} is still UNPAID.")
             else:
@@ -145,6 +122,15 @@ async def tripay_webhook(request: Request, db: Session = Depends(get_db)):
     except HTTPException:
         # Re-raise HTTPException yang sudah dihandle
         raise
+    except GroupBuyQuotaExceeded as e:
+        # Pembayaran terlambat untuk partisipan failed setelah kuotanya terisi:
+        # status tetap failed dan pembayaran perlu di-refund manual
+        db.rollback()
+        print(f"Payment for participant {merchant_ref} not applied, manual refund needed: {e}")
+        return {
+            "success": True,
+            "message": "Group buy quota already filled; payment needs a manual refund"
+        }
     except Exception as e:
         # Log error dan return success agar Tripay tidak retry
         print(f"Error processing Tripay webhook: {e}")
@@ -226,14 +212,16 @@ def get_payment_status(participant_id: uuid.UUID, db: Session = Depends(get_db))
                 
                 # Update status lokal jika berbeda dengan Tripay
                 if tripay_status == "PAID" and participant.payment_status != "paid":
-                    participant.payment_status = "paid"
-                    db.add(participant)
+                    set_payment_status(db, participant, "paid")
                     db.commit()
                 elif tripay_status in ["EXPIRED", "FAILED", "CANCELED"] and participant.payment_status not in ["failed", "expired"]:
-                    participant.payment_status = "failed"
-                    db.add(participant)
+                    set_payment_status(db, participant, "failed")
                     db.commit()
                 
+        except GroupBuyQuotaExceeded as e:
+            # Status lokal dipertahankan; pembayaran terlambat perlu di-refund manual
+            db.rollback()
+            print(f"Payment for participant {participant_id} not applied, manual refund needed: {e}")
         except Exception as e:
             # Jika gagal mengambil dari Tripay, gunakan status lokal
             print(f"Failed to sync with Tripay for reference {tripay_reference}: {e}")
@@ -15,6 +15,9 @@ class BoronganCreate(BaseModel):
     target_quantity: int = Field(..., gt=1)
     deadline: datetime
     pickup_point_address: str
+    # Koordinat titik pengambilan (opsional); jika kosong memakai lokasi profil supplier
+    pickup_latitude: Optional[float] = Field(None, ge=-90, le=90)
+    pickup_longitude: Optional[float] = Field(None, ge=-180, le=180)
 
 # --- Skema untuk request body saat join ---
 class BoronganJoin(BaseModel):
@@ -46,6 +49,8 @@ class BoronganDetailSchema(BaseModel):
     unit: str
     target_quantity: int
     current_quantity: int
+    paid_quantity: int = 0
+    pending_quantity: int = 0
     participants_count: int
     participants: List[ParticipantSchema] = []  # Daftar partisipan
     deadline: datetime
@@ -66,6 +71,8 @@ class BoronganSummarySchema(BaseModel):
     unit: str
     target_quantity: int
     current_quantity: int
+    paid_quantity: int = 0
+    pending_quantity: int = 0
     participants_count: int
     deadline: datetime
     pickup_point_address: str
@@ -76,6 +83,17 @@ class BoronganSummarySchema(BaseModel):
     class Config:
         from_attributes = True
 
+# Skema borongan di /borongan/nearby, dengan jarak ke titik pengambilan
+class BoronganNearbySchema(BoronganSummarySchema):
+    distance: float  # Meter
+
 # Skema untuk respons daftar borongan
 class BoronganListResponse(BaseModel):
-    borongan: List[BoronganSummarySchema] 
\ No newline at end of file
+    borongan: List[BoronganSummarySchema]
+    has_more: bool = False
+    limit: Optional[int] = None  # None untuk /borongan/my (tanpa paginasi)
+    next_cursor: Optional[str] = None  # Cursor untuk keyset pagination halaman berikutnya 
+
+# Skema untuk respons /borongan/nearby
+class BoronganNearbyListResponse(BoronganListResponse):
+    borongan: List[BoronganNearbySchema]
@@ -2,8 +2,9 @@
 
 import uuid
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Dict, List, Optional
 from decimal import Decimal
+from datetime import date, datetime
 from .profile import ProfileInLapakSchema  # Impor skema baru
 
 # Skema untuk data yang diterima saat membuat lapak baru
@@ -23,6 +24,43 @@ class LapakUpdate(BaseModel):
     stock_quantity: Optional[int] = Field(None, gt=0)
     status: Optional[str] = Field(None, pattern="^(available|sold_out|inactive)$")
 
+# Skema untuk satu baris impor massal lapak (JSON atau CSV)
+class LapakImportRow(BaseModel):
+    title: str = Field(..., min_length=1, max_length=255)
+    description: Optional[str] = None
+    price: Decimal = Field(..., gt=0, decimal_places=2)
+    unit: str = Field(..., min_length=1, max_length=20)
+    stock_quantity: int = Field(..., gt=0)
+    latitude: Optional[float] = Field(None, ge=-90, le=90)  # Kosong = lokasi profil penjual
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
+    image_urls: Optional[List[str]] = None  # URL gambar yang sudah diunggah sebelumnya
+
+# Skema untuk request body impor massal JSON
+class LapakImportRequest(BaseModel):
+    rows: List[dict]  # Divalidasi per baris agar error dapat dilaporkan per baris
+
+# Skema error untuk satu baris impor yang ditolak
+class LapakImportError(BaseModel):
+    row: int  # Nomor baris data, dimulai dari 1
+    errors: List[str]
+
+# Skema untuk respons impor massal
+class LapakImportResponse(BaseModel):
+    created: int
+    created_ids: List[uuid.UUID]
+    errors: List[LapakImportError] = []
+
+# Skema untuk data yang diterima saat memesan stok lapak
+class LapakReserve(BaseModel):
+    quantity: int = Field(..., gt=0)
+
+# Skema untuk respons endpoint /lapak/{listing_id}/reserve
+class LapakReserveResponse(BaseModel):
+    listing_id: uuid.UUID
+    reserved_quantity: int
+    remaining_stock: int
+    status: str
+
 # Skema dasar untuk menampilkan informasi lapak
 class LapakSchema(BaseModel):
     id: uuid.UUID
@@ -36,16 +74,72 @@ class LapakSchema(BaseModel):
     status: str
     latitude: Optional[float] = None
     longitude: Optional[float] = None
-    created_at: str
-    updated_at: str
+    distance: Optional[float] = None  # Jarak dalam meter, hanya diisi oleh pencarian nearby
+    created_at: datetime
+    updated_at: Optional[datetime] = None
     seller: ProfileInLapakSchema
 
     class Config:
         from_attributes = True
 
+# Skema untuk satu bucket histogram harga pada facet
+class PriceBucketSchema(BaseModel):
+    lower: Decimal
+    upper: Decimal
+    count: int
+
+# Skema ringkasan facet hasil pencarian nearby
+class LapakFacetsSchema(BaseModel):
+    units: Dict[str, int] = {}
+    price_histogram: List[PriceBucketSchema] = []
+
 # Skema untuk respons endpoint /lapak/nearby
 class LapakListResponse(BaseModel):
     lapak: List[LapakSchema]
-    total: int
+    total: Optional[int] = None  # None jika count_mode=none
+    total_capped: bool = False  # True jika total dipotong di batas atas (tampilkan sebagai "N+")
+    has_more: bool = False
     page: int = 1
-    limit: int = 12 
\ No newline at end of file
+    limit: int = 12
+    next_cursor: Optional[str] = None  # Cursor untuk keyset pagination halaman berikutnya
+    facets: Optional[LapakFacetsSchema] = None  # Hanya diisi jika include_facets=true 
+
+# Skema untuk respons endpoint /lapak/batch
+class LapakBatchResponse(BaseModel):
+    lapak: List[LapakSchema]  # Sesuai urutan id pada request
+    missing_ids: List[uuid.UUID] = []  # Id yang tidak ditemukan
+
+# Skema untuk respons endpoint /lapak/my/summary
+class LapakSellerSummary(BaseModel):
+    counts: Dict[str, int]  # Jumlah lapak per status (available, sold_out, inactive)
+    total: int
+    total_stock_value: Decimal  # Jumlah price * stock_quantity untuk lapak 'available'
+    last_updated_at: Optional[datetime] = None
+
+# Skema jumlah viewer unik per hari pada statistik lapak
+class DailyViewStats(BaseModel):
+    day: date
+    unique_viewers: int  # Perkiraan HyperLogLog
+
+# Skema untuk respons endpoint /lapak/{listing_id}/stats
+class LapakViewStats(BaseModel):
+    listing_id: uuid.UUID
+    total_views: int
+    unique_viewers: int  # Perkiraan viewer unik selama `days` hari terakhir
+    days: int
+    daily: List[DailyViewStats]
+
+# Skema untuk satu cluster pada peta (/lapak/clusters)
+class LapakClusterSchema(BaseModel):
+    latitude: float  # Centroid cluster
+    longitude: float
+    count: int
+    min_price: Decimal
+    max_price: Decimal
+    listing_id: Optional[uuid.UUID] = None  # Hanya diisi jika cluster berisi satu lapak
+
+# Skema untuk respons endpoint /lapak/clusters
+class LapakClusterResponse(BaseModel):
+    clusters: List[LapakClusterSchema]
+    zoom: int
+    cell_size: float  # Ukuran sel grid dalam derajat
@@ -0,0 +1,161 @@
+# app/services/borongan_events.py
+
+import asyncio
+import json
+import select
+import threading
+import uuid
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy.engine import Engine
+
+# Channel NOTIFY dari trigger group_buys (lihat migrasi 0013 di app/core/migrations.py)
+BORONGAN_EVENTS_CHANNEL = "borongan_events"
+
+# Event lama dibuang jika klien lambat; setiap event adalah snapshot lengkap
+# sehingga hanya event terbaru yang penting
+SUBSCRIBER_QUEUE_SIZE = 16
+
+# Status akhir: stream ditutup setelah event dengan status ini
+TERMINAL_STATUSES = ("failed", "completed")
+
+# Batas waktu stream baru menunggu LISTEN aktif sebelum membaca snapshot
+LISTEN_READY_TIMEOUT_SECONDS = 5
+
+
+def format_sse(event: dict) -> str:
+    """Format satu event progress borongan sebagai pesan Server-Sent Events."""
+    return f"id: {event['version']}\nevent: progress\ndata: {json.dumps(event, default=str)}\n\n"
+
+
+class BoronganEventHub:
+    """
+    Pub/sub in-process untuk progress borongan.
+
+    Perubahan group_buys dikirim database lewat NOTIFY saat transaksi commit.
+    Satu thread per proses menjalankan LISTEN pada koneksi khusus (di luar pool)
+    dan meneruskan setiap event ke antrean asyncio milik stream SSE yang
+    berlangganan borongan tersebut. Dengan begitu semua instance menerima
+    event dari join, webhook pembayaran dan job mana pun.
+
+    NOTIFY yang terkirim saat LISTEN belum aktif (sebelum koneksi pertama
+    atau selama reconnect) tidak pernah diterima. Karena itu stream menunggu
+    `wait_until_listening` sebelum membaca snapshot, dan setiap kali LISTEN
+    aktif kembali snapshot terbaru semua borongan yang sedang diikuti
+    dikirim ulang lewat `fetch_snapshots`.
+    """
+
+    def __init__(self, channel: str = BORONGAN_EVENTS_CHANNEL):
+        self.channel = channel
+        self._lock = threading.Lock()
+        self._subscribers: Dict[uuid.UUID, Set[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+        self._listener: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._listening = threading.Event()
+
+    def subscribe(self, group_buy_id: uuid.UUID) -> asyncio.Queue:
+        """Mendaftarkan antrean baru untuk satu borongan. Dipanggil dari event loop."""
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.setdefault(group_buy_id, set()).add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, group_buy_id: uuid.UUID, queue: asyncio.Queue) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(group_buy_id, set())
+            subscribers.difference_update({entry for entry in subscribers if entry[1] is queue})
+            if not subscribers:
+                self._subscribers.pop(group_buy_id, None)
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def publish(self, event: dict) -> None:
+        """Meneruskan event ke semua pelanggan borongan di proses ini. Aman dipanggil dari thread mana pun."""
+        group_buy_id = uuid.UUID(str(event["id"]))
+        with self._lock:
+            subscribers = list(self._subscribers.get(group_buy_id, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(_put_latest, queue, event)
+            except RuntimeError:
+                # Event loop sudah ditutup; pelanggan akan dihapus saat stream selesai
+                pass
+
+    def start(self, engine: Engine, fetch_snapshots: Callable[[List[uuid.UUID]], Iterable[dict]]) -> None:
+        """
+        Menjalankan thread LISTEN (sekali per proses). `fetch_snapshots` mengembalikan
+        snapshot progress untuk daftar id borongan, dipakai setelah LISTEN aktif.
+        """
+        with self._lock:
+            if self._listener is not None:
+                return
+            self._listener = threading.Thread(
+                target=self._listen, args=(engine, fetch_snapshots), name="borongan-events-listener", daemon=True
+            )
+            self._listener.start()
+
+    def wait_until_listening(self, timeout: float = LISTEN_READY_TIMEOUT_SECONDS) -> bool:
+        """Menunggu sampai LISTEN aktif. Blocking; panggil dari threadpool."""
+        return self._listening.wait(timeout)
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _publish_snapshots(self, fetch_snapshots: Callable[[List[uuid.UUID]], Iterable[dict]]) -> None:
+        """Mengirim snapshot terbaru ke semua pelanggan; menutup celah event selama LISTEN tidak aktif."""
+        with self._lock:
+            group_buy_ids = list(self._subscribers)
+        if not group_buy_ids:
+            return
+        try:
+            for event in fetch_snapshots(group_buy_ids):
+                self.publish(event)
+        except Exception as e:
+            print(f"Failed to publish borongan snapshots after LISTEN: {e}")
+
+    def _listen(self, engine: Engine, fetch_snapshots: Callable[[List[uuid.UUID]], Iterable[dict]]) -> None:
+        while not self._stop.is_set():
+            connection = None
+            try:
+                # Koneksi khusus di luar pool: koneksi LISTEN tidak boleh dipakai ulang untuk query lain
+                cargs, cparams = engine.dialect.create_connect_args(engine.url)
+                connection = engine.dialect.connect(*cargs, **cparams)
+                connection.autocommit = True
+                with connection.cursor() as cursor:
+                    cursor.execute(f"LISTEN {self.channel}")
+                self._listening.set()
+                print(f"Listening for {self.channel} notifications")
+                self._publish_snapshots(fetch_snapshots)
+
+                while not self._stop.is_set():
+                    if select.select([connection], [], [], 5) == ([], [], []):
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        notify = connection.notifies.pop(0)
+                        try:
+                            self.publish(json.loads(notify.payload))
+                        except (ValueError, KeyError) as e:
+                            print(f"Ignoring invalid {self.channel} payload: {e}")
+            except Exception as e:
+                self._listening.clear()
+                print(f"Borongan events listener failed, reconnecting: {e}")
+                self._stop.wait(5)
+            finally:
+                if connection is not None:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
+
+
+def _put_latest(queue: asyncio.Queue, event: dict) -> None:
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(event)
+
+
+# Instance global yang dipakai oleh router borongan
+borongan_events = BoronganEventHub()
@@ -0,0 +1,96 @@
+# app/services/group_buy_totals.py
+
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from ..models.group_buy import GroupBuy
+from ..models.group_buy_participant import GroupBuyParticipant
+
+# Status pembayaran yang dihitung di ringkasan borongan, beserta kolom kuantitasnya
+ACTIVE_PAYMENT_QUANTITY_COLUMNS = {
+    "pending": "pending_quantity",
+    "paid": "paid_quantity",
+}
+ACTIVE_PAYMENT_STATUSES = tuple(ACTIVE_PAYMENT_QUANTITY_COLUMNS)
+
+
+class GroupBuyQuotaExceeded(ValueError):
+    """Partisipan failed/expired tidak bisa aktif lagi karena kuotanya sudah diisi partisipan lain."""
+
+
+def adjust_group_buy_totals(group_buy: GroupBuy, quantity: int, old_status: Optional[str], new_status: Optional[str]):
+    """
+    Memindahkan kuantitas satu partisipan antar ringkasan borongan saat status
+    pembayarannya berubah. Status None berarti partisipan baru/dihapus.
+    Partisipan failed/expired/refunded tidak dihitung.
+
+    Partisipan failed/expired yang kembali pending/paid (mis. pembayaran
+    terlambat) harus muat di sisa kuota; jika tidak, GroupBuyQuotaExceeded
+    dilempar sebelum ringkasan diubah. Sisa kuota untuk partisipan baru
+    dicek oleh join_borongan.
+    """
+    old_column = ACTIVE_PAYMENT_QUANTITY_COLUMNS.get(old_status)
+    new_column = ACTIVE_PAYMENT_QUANTITY_COLUMNS.get(new_status)
+    if old_column == new_column:
+        return
+
+    if new_column and not old_column and old_status is not None:
+        remaining_quantity = group_buy.target_quantity - group_buy.current_quantity
+        if quantity > remaining_quantity:
+            raise GroupBuyQuotaExceeded(
+                f"Group buy {group_buy.id} has {remaining_quantity} unit(s) left, "
+                f"cannot move {quantity} unit(s) from {old_status} to {new_status}"
+            )
+
+    if old_column:
+        setattr(group_buy, old_column, getattr(group_buy, old_column) - quantity)
+        group_buy.participants_count -= 1
+        group_buy.current_quantity -= quantity
+    if new_column:
+        setattr(group_buy, new_column, getattr(group_buy, new_column) + quantity)
+        group_buy.participants_count += 1
+        group_buy.current_quantity += quantity
+
+    # Target bisa tercapai atau batal tercapai karena perubahan ini
+    if group_buy.status == 'successful' and group_buy.current_quantity < group_buy.target_quantity:
+        group_buy.status = 'active'
+        print(f"Group buy {group_buy.id} status reverted to 'active'.")
+    elif group_buy.status == 'active' and group_buy.current_quantity >= group_buy.target_quantity:
+        group_buy.status = 'successful'
+
+
+def set_payment_status(db: Session, participant: GroupBuyParticipant, new_status: str) -> None:
+    """
+    Mengubah status pembayaran partisipan dan ringkasan borongannya dalam
+    transaksi yang sama. Pemanggil bertanggung jawab untuk commit.
+
+    Baris group_buy dikunci lebih dulu (urutan yang sama dengan join_borongan),
+    lalu baris partisipan dibaca ulang di bawah kunci: webhook dan polling
+    status bisa memproses partisipan yang sama bersamaan, jadi status lama
+    hanya valid setelah kedua kunci dipegang. Melempar GroupBuyQuotaExceeded
+    (tanpa mengubah apa pun) jika partisipan failed tidak lagi muat di kuota.
+    """
+    group_buy = (
+        db.query(GroupBuy)
+        .filter(GroupBuy.id == participant.group_buy_id)
+        .with_for_update()
+        .populate_existing()
+        .first()
+    )
+    participant = (
+        db.query(GroupBuyParticipant)
+        .filter(GroupBuyParticipant.id == participant.id)
+        .with_for_update()
+        .populate_existing()
+        .first()
+    )
+    old_status = participant.payment_status
+    if old_status == new_status:
+        return
+
+    if group_buy:
+        adjust_group_buy_totals(group_buy, participant.quantity_ordered, old_status, new_status)
+        db.add(group_buy)
+    participant.payment_status = new_status
+    db.add(participant)
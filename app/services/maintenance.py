@@ -0,0 +1,425 @@
+# app/services/maintenance.py
+
+import time
+import uuid
+from typing import Callable, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+LOCATION_BACKFILL_JOB = "location_backfill"
+
+# Urutan fase: profil penjual lebih dulu agar listing bisa mewarisi lokasi profil
+LOCATION_BACKFILL_PHASES = ("profiles", "listings")
+
+_NIL_UUID = uuid.UUID(int=0)
+
+# Batas atas batch berikutnya dan jumlah barisnya; UPDATE bekerja pada rentang
+# primary key (last_id, batch_end] sehingga setiap batch memakai index PK.
+# Postgres tidak punya max(uuid), jadi id terakhir diambil dengan ORDER BY ... DESC LIMIT 1.
+_BATCH_END_QUERY = """
+    WITH batch AS (SELECT id FROM {table} WHERE id > :last_id ORDER BY id LIMIT :batch_size)
+    SELECT (SELECT id FROM batch ORDER BY id DESC LIMIT 1) AS batch_end,
+           (SELECT count(*) FROM batch) AS scanned
+"""
+_BATCH_END_QUERIES = {
+    "profiles": _BATCH_END_QUERY.format(table="profiles"),
+    "listings": _BATCH_END_QUERY.format(table="listings"),
+    "group_buys": _BATCH_END_QUERY.format(table="group_buys"),
+}
+
+_BATCH_UPDATES = {
+    # Hanya profil penjual (punya listing) yang belum memiliki lokasi
+    "profiles": """
+        UPDATE profiles p
+        SET location = ST_SetSRID(ST_MakePoint(:default_lon, :default_lat), 4326)::geography
+        WHERE p.id > :last_id AND p.id <= :batch_end
+        AND p.location IS NULL
+        AND EXISTS (SELECT 1 FROM listings l WHERE l.seller_id = p.id)
+    """,
+    # Listing tanpa lokasi memakai lokasi penjual (sudah terisi di fase profiles)
+    "listings": """
+        UPDATE listings l
+        SET location = coalesce(
+            p.location,
+            ST_SetSRID(ST_MakePoint(:default_lon, :default_lat), 4326)::geography
+        )
+        FROM profiles p
+        WHERE l.seller_id = p.id
+        AND l.id > :last_id AND l.id <= :batch_end
+        AND l.location IS NULL
+    """,
+}
+
+
+def get_checkpoint(db: Session, job_name: str) -> Optional[dict]:
+    """Mengambil progres terakhir sebuah job maintenance dari tabel maintenance_checkpoints."""
+    row = db.execute(
+        text("SELECT * FROM maintenance_checkpoints WHERE job_name = :job_name"),
+        {"job_name": job_name}
+    ).mappings().first()
+    return dict(row) if row else None
+
+
+def _save_checkpoint(db: Session, job_name: str, **values) -> None:
+    db.execute(
+        text("""
+            INSERT INTO maintenance_checkpoints
+                (job_name, phase, last_id, scanned, updated, status,
+                 default_lat, default_lon, started_at, updated_at, finished_at)
+            VALUES
+                (:job_name, :phase, :last_id, :scanned, :updated, :status,
+                 :default_lat, :default_lon, :started_at, now(), :finished_at)
+            ON CONFLICT (job_name) DO UPDATE SET
+                phase = EXCLUDED.phase,
+                last_id = EXCLUDED.last_id,
+                scanned = EXCLUDED.scanned,
+                updated = EXCLUDED.updated,
+                status = EXCLUDED.status,
+                default_lat = EXCLUDED.default_lat,
+                default_lon = EXCLUDED.default_lon,
+                started_at = EXCLUDED.started_at,
+                updated_at = now(),
+                finished_at = EXCLUDED.finished_at
+        """),
+        {"job_name": job_name, **values}
+    )
+
+
+def run_location_backfill(
+    session_factory: Callable[[], Session],
+    default_lat: float,
+    default_lon: float,
+    batch_size: int = 1000,
+    max_batches: Optional[int] = None,
+    restart: bool = False
+) -> dict:
+    """
+    Mengisi lokasi default untuk profil penjual dan listing yang belum memiliki lokasi.
+
+    Baris ditelusuri per batch berdasarkan primary key. Setiap batch (UPDATE dan
+    checkpoint) di-commit dalam transaksi sendiri, sehingga lock hanya dipegang
+    sebentar dan job dapat dilanjutkan dari checkpoint setelah terputus
+    (mis. timeout function). `max_batches` membatasi jumlah batch per pemanggilan;
+    panggil lagi untuk melanjutkan.
+
+    Run yang bersamaan dicegah dengan advisory lock Postgres pada koneksi
+    terpisah; jika lock sedang dipegang, status `already_running` dikembalikan
+    tanpa menjalankan batch. `updated` adalah total sejak awal run (checkpoint),
+    sedangkan `updated_this_run` hanya dari pemanggilan ini.
+    """
+    # Lock level sesi dipegang koneksi AUTOCOMMIT ini sampai job selesai,
+    # tanpa membiarkan transaksi terbuka selama batch berjalan
+    lock_db = session_factory()
+    try:
+        lock_db.connection(execution_options={"isolation_level": "AUTOCOMMIT"})
+        acquired = lock_db.execute(
+            text("SELECT pg_try_advisory_lock(hashtext(:job_name))"),
+            {"job_name": LOCATION_BACKFILL_JOB}
+        ).scalar()
+        if not acquired:
+            print(f"[{LOCATION_BACKFILL_JOB}] another run holds the lock, skipping")
+            return {"job_name": LOCATION_BACKFILL_JOB, "status": "already_running"}
+        try:
+            return _run_location_backfill(
+                session_factory, default_lat, default_lon, batch_size, max_batches, restart
+            )
+        finally:
+            lock_db.execute(
+                text("SELECT pg_advisory_unlock(hashtext(:job_name))"),
+                {"job_name": LOCATION_BACKFILL_JOB}
+            )
+    finally:
+        lock_db.close()
+
+
+def _run_location_backfill(
+    session_factory: Callable[[], Session],
+    default_lat: float,
+    default_lon: float,
+    batch_size: int,
+    max_batches: Optional[int],
+    restart: bool
+) -> dict:
+    with session_factory() as db:
+        checkpoint = get_checkpoint(db, LOCATION_BACKFILL_JOB)
+
+    if checkpoint is None or restart or checkpoint["status"] == "completed":
+        checkpoint = {
+            "phase": LOCATION_BACKFILL_PHASES[0],
+            "last_id": _NIL_UUID,
+            "scanned": 0,
+            "updated": 0,
+            "status": "running",
+            "default_lat": default_lat,
+            "default_lon": default_lon,
+            "started_at": None,
+            "finished_at": None,
+        }
+    # Run yang dilanjutkan tetap memakai koordinat default dari awal run agar hasil konsisten
+    default_lat, default_lon = checkpoint["default_lat"], checkpoint["default_lon"]
+
+    checkpoint = {key: checkpoint[key] for key in (
+        "phase", "last_id", "scanned", "updated", "status",
+        "default_lat", "default_lon", "started_at", "finished_at"
+    )}
+    if checkpoint["started_at"] is None:
+        with session_factory() as db:
+            checkpoint["started_at"] = db.execute(text("SELECT now()")).scalar()
+
+    started = time.monotonic()
+    batches = 0
+    updated_this_run = 0
+    while max_batches is None or batches < max_batches:
+        phase = checkpoint["phase"]
+        with session_factory() as db:
+            params = {"last_id": checkpoint["last_id"], "batch_size": batch_size}
+            batch_end, scanned = db.execute(text(_BATCH_END_QUERIES[phase]), params).one()
+
+            if batch_end is None:
+                # Fase selesai: pindah ke fase berikutnya atau tandai job selesai
+                next_index = LOCATION_BACKFILL_PHASES.index(phase) + 1
+                if next_index < len(LOCATION_BACKFILL_PHASES):
+                    checkpoint.update(phase=LOCATION_BACKFILL_PHASES[next_index], last_id=_NIL_UUID)
+                else:
+                    checkpoint.update(status="completed", finished_at=db.execute(text("SELECT now()")).scalar())
+                _save_checkpoint(db, LOCATION_BACKFILL_JOB, **checkpoint)
+                db.commit()
+                if checkpoint["status"] == "completed":
+                    break
+                continue
+
+            updated = db.execute(
+                text(_BATCH_UPDATES[phase]),
+                {
+                    "last_id": checkpoint["last_id"],
+                    "batch_end": batch_end,
+                    "default_lat": default_lat,
+                    "default_lon": default_lon,
+                }
+            ).rowcount
+            updated_this_run += updated
+            checkpoint.update(
+                last_id=batch_end,
+                scanned=checkpoint["scanned"] + scanned,
+                updated=checkpoint["updated"] + updated,
+            )
+            _save_checkpoint(db, LOCATION_BACKFILL_JOB, **checkpoint)
+            db.commit()
+
+        batches += 1
+        print(
+            f"[{LOCATION_BACKFILL_JOB}] phase={phase} batch={batches} "
+            f"scanned={checkpoint['scanned']} updated={checkpoint['updated']} "
+            f"updated_this_run={updated_this_run}"
+        )
+
+    return {
+        "job_name": LOCATION_BACKFILL_JOB,
+        **checkpoint,
+        "updated_this_run": updated_this_run,
+        "batches_this_run": batches,
+        "elapsed_seconds": round(time.monotonic() - started, 3),
+    }
+
+
+def refresh_rank_scores(session_factory: Callable[[], Session], batch_size: int = 1000) -> dict:
+    """
+    Menghitung ulang rank_score lapak 'available' agar komponen kebaruan meluruh.
+
+    Trigger hanya menghitung skor saat lapak atau reputasi penjual berubah,
+    jadi job ini perlu dijalankan berkala (mis. setiap jam oleh scheduler).
+    Tabel ditelusuri per rentang primary key dengan commit per batch; job ini
+    idempotent sehingga aman dijalankan ulang dari awal jika terputus.
+    """
+    started = time.monotonic()
+    last_id = _NIL_UUID
+    updated = 0
+    batches = 0
+    while True:
+        with session_factory() as db:
+            batch_end = db.execute(
+                text(_BATCH_END_QUERIES["listings"]),
+                {"last_id": last_id, "batch_size": batch_size}
+            ).one()[0]
+            if batch_end is None:
+                break
+
+            updated += db.execute(
+                text("""
+                    UPDATE listings l
+                    SET rank_score = listing_rank_score(l.created_at, l.stock_quantity, p.reputation_score)
+                    FROM profiles p
+                    WHERE p.id = l.seller_id
+                    AND l.id > :last_id AND l.id <= :batch_end
+                    AND l.status = 'available'
+                """),
+                {"last_id": last_id, "batch_end": batch_end}
+            ).rowcount
+            db.commit()
+
+        last_id = batch_end
+        batches += 1
+
+    print(f"[rank_score_refresh] updated={updated} batches={batches}")
+    return {
+        "updated": updated,
+        "batches": batches,
+        "elapsed_seconds": round(time.monotonic() - started, 3),
+    }
+
+
+LISTING_ARCHIVE_JOB = "listing_archive"
+
+# Kolom yang dipindahkan dari listings ke listings_archive (lihat model ListingArchive).
+# search_vector dan rank_score tidak ikut karena arsip tidak dicari maupun diurutkan.
+ARCHIVE_COLUMNS = (
+    "id", "seller_id", "title", "description", "price", "unit", "stock_quantity",
+    "image_urls", "status", "location", "longitude", "latitude", "view_count",
+    "created_at", "updated_at",
+)
+
+_ARCHIVE_BATCH = f"""
+    WITH moved AS (
+        DELETE FROM listings
+        WHERE id IN (
+            SELECT id FROM listings
+            WHERE status = 'inactive'
+            AND coalesce(updated_at, created_at) < now() - make_interval(days => :stale_days)
+            ORDER BY coalesce(updated_at, created_at)
+            LIMIT :batch_size
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING {", ".join(ARCHIVE_COLUMNS)}
+    )
+    INSERT INTO listings_archive ({", ".join(ARCHIVE_COLUMNS)})
+    SELECT {", ".join(ARCHIVE_COLUMNS)} FROM moved
+"""
+
+
+def archive_stale_listings(
+    session_factory: Callable[[], Session],
+    stale_days: int,
+    batch_size: int = 1000,
+    max_batches: Optional[int] = None
+) -> dict:
+    """
+    Memindahkan lapak inactive yang tidak berubah selama `stale_days` hari dari
+    listings ke listings_archive. Lapak sold_out tidak diarsipkan karena
+    penjual masih bisa menambah stoknya kembali lewat PUT /lapak/{id}.
+
+    Setiap batch adalah satu statement (DELETE ... RETURNING di-INSERT ke arsip)
+    dalam transaksi sendiri, jadi baris tidak pernah hilang atau terduplikasi
+    jika job terputus. SKIP LOCKED membuat beberapa instance bisa berjalan
+    bersamaan. Tabel listings (dan index GiST-nya) tetap hanya berisi lapak
+    yang masih relevan untuk feed nearby.
+    """
+    started = time.monotonic()
+    archived = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        with session_factory() as db:
+            moved = db.execute(
+                text(_ARCHIVE_BATCH),
+                {"stale_days": stale_days, "batch_size": batch_size}
+            ).rowcount
+            db.commit()
+        if not moved:
+            break
+        archived += moved
+        batches += 1
+        print(f"[{LISTING_ARCHIVE_JOB}] batch={batches} archived={archived}")
+
+    return {
+        "job_name": LISTING_ARCHIVE_JOB,
+        "archived": archived,
+        "batches": batches,
+        "elapsed_seconds": round(time.monotonic() - started, 3),
+    }
+
+
+_RESTORE_ARCHIVED_LISTING = f"""
+    WITH moved AS (
+        DELETE FROM listings_archive
+        WHERE id = :listing_id
+        RETURNING {", ".join(ARCHIVE_COLUMNS)}
+    )
+    INSERT INTO listings ({", ".join(ARCHIVE_COLUMNS)})
+    SELECT {", ".join(ARCHIVE_COLUMNS)} FROM moved
+"""
+
+
+def restore_archived_listing(db: Session, listing_id: uuid.UUID) -> bool:
+    """
+    Memindahkan satu lapak dari listings_archive kembali ke listings dalam
+    transaksi pemanggil, mis. saat penjual mengubah lapak yang sudah diarsipkan.
+    rank_score dan search_vector diisi ulang oleh trigger dan kolom generated.
+    Mengembalikan False jika lapak tidak ada di arsip.
+    """
+    return db.execute(text(_RESTORE_ARCHIVED_LISTING), {"listing_id": listing_id}).rowcount > 0
+
+
+# Menghitung ulang ringkasan partisipan untuk satu rentang primary key group_buys.
+# LEFT JOIN agar borongan tanpa partisipan aktif ikut dikoreksi ke 0; hanya baris
+# yang nilainya berbeda yang ditulis (dan menaikkan version/ETag).
+_GROUP_BUY_TOTALS_UPDATE = """
+    UPDATE group_buys g SET
+        participants_count = t.participants_count,
+        paid_quantity = t.paid_quantity,
+        pending_quantity = t.pending_quantity,
+        current_quantity = t.paid_quantity + t.pending_quantity
+    FROM (
+        SELECT
+            g2.id,
+            count(p.id) FILTER (WHERE p.payment_status IN ('pending', 'paid')) AS participants_count,
+            coalesce(sum(p.quantity_ordered) FILTER (WHERE p.payment_status = 'paid'), 0) AS paid_quantity,
+            coalesce(sum(p.quantity_ordered) FILTER (WHERE p.payment_status = 'pending'), 0) AS pending_quantity
+        FROM group_buys g2
+        LEFT JOIN group_buy_participants p ON p.group_buy_id = g2.id
+        WHERE g2.id > :last_id AND g2.id <= :batch_end
+        GROUP BY g2.id
+    ) AS t
+    WHERE g.id = t.id
+    AND (g.participants_count, g.paid_quantity, g.pending_quantity, g.current_quantity)
+        IS DISTINCT FROM (t.participants_count, t.paid_quantity, t.pending_quantity,
+                          t.paid_quantity + t.pending_quantity)
+"""
+
+
+def repair_group_buy_totals(session_factory: Callable[[], Session], batch_size: int = 1000) -> dict:
+    """
+    Menghitung ulang participants_count, paid_quantity, pending_quantity dan
+    current_quantity semua borongan dari group_buy_participants.
+
+    Kolom-kolom ini dijaga oleh join_borongan dan webhook pembayaran; job ini
+    memperbaiki selisih (mis. perubahan data manual) secara set-based per
+    rentang primary key, dengan commit per batch.
+    """
+    started = time.monotonic()
+    last_id = _NIL_UUID
+    repaired = 0
+    batches = 0
+    while True:
+        with session_factory() as db:
+            batch_end = db.execute(
+                text(_BATCH_END_QUERIES["group_buys"]),
+                {"last_id": last_id, "batch_size": batch_size}
+            ).one()[0]
+            if batch_end is None:
+                break
+
+            repaired += db.execute(
+                text(_GROUP_BUY_TOTALS_UPDATE),
+                {"last_id": last_id, "batch_end": batch_end}
+            ).rowcount
+            db.commit()
+
+        last_id = batch_end
+        batches += 1
+
+    print(f"[group_buy_totals_repair] repaired={repaired} batches={batches}")
+    return {
+        "repaired": repaired,
+        "batches": batches,
+        "elapsed_seconds": round(time.monotonic() - started, 3),
+    }
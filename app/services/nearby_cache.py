@@ -0,0 +1,110 @@
+# app/services/nearby_cache.py
+
+import threading
+from typing import Any, Hashable, Optional, Tuple
+
+from cachetools import TTLCache
+
+from ..core.config import settings
+from ..core.geo import geohash_encode, geohash_bounds, geohash_center, haversine_m
+
+# Radius dibulatkan ke atas ke salah satu bucket ini agar variasi kecil
+# dari klien tetap jatuh ke entry cache yang sama
+RADIUS_BUCKETS = (500, 1000, 2000, 3000, 5000, 10000, 20000, 50000)
+
+
+def radius_bucket(radius: int) -> int:
+    for bucket in RADIUS_BUCKETS:
+        if radius <= bucket:
+            return bucket
+    return radius
+
+
+class NearbyCache:
+    """
+    Cache kandidat /lapak/nearby dengan eviction LRU + TTL.
+
+    Key selalu diawali (geohash tile, radius bucket); sisanya adalah filter.
+    Nilainya adalah kandidat lapak di area pencarian tile (lihat `search_area`),
+    yaitu superset hasil untuk semua titik di tile tersebut. Router menyaring
+    ulang kandidat terhadap titik dan radius asli pengguna, sehingga hasil dan
+    jarak tetap tepat meskipun entry cache dipakai bersama.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, precision: int, timer=None):
+        cache_kwargs = {"timer": timer} if timer else {}
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl, **cache_kwargs)
+        self._lock = threading.Lock()
+        self.precision = precision
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def tile_key(self, lat: float, lon: float, radius: int) -> Tuple[str, int]:
+        """Mengembalikan (geohash tile, radius bucket) untuk awalan key cache."""
+        return geohash_encode(lat, lon, self.precision), radius_bucket(radius)
+
+    @staticmethod
+    def search_area(tile: str, bucket: int) -> Tuple[float, float, float]:
+        """
+        Mengembalikan (lat tengah, lon tengah, radius) lingkaran yang mencakup
+        radius bucket dari titik mana pun di dalam tile.
+        """
+        min_lat, min_lon, max_lat, max_lon = geohash_bounds(tile)
+        center_lat, center_lon = geohash_center(tile)
+        # Setengah diagonal tile sebagai toleransi jarak dari titik tengah
+        half_diagonal = haversine_m(center_lat, center_lon, max_lat, max_lon)
+        return center_lat, center_lon, bucket + half_diagonal
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            value = self._cache.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._cache[key] = value
+
+    def invalidate_point(self, lat: float, lon: float) -> int:
+        """
+        Menghapus semua entry yang area pencariannya (tile + radius) mencakup
+        titik yang berubah. Entry di tile lain tetap dipertahankan.
+        """
+        removed = 0
+        with self._lock:
+            for key in list(self._cache.keys()):
+                center_lat, center_lon, search_radius = self.search_area(key[0], key[1])
+                if haversine_m(center_lat, center_lon, lat, lon) <= search_radius:
+                    self._cache.pop(key, None)
+                    removed += 1
+            self.invalidations += removed
+        return removed
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "size": len(self._cache),
+                "maxsize": self._cache.maxsize,
+                "ttl_seconds": self._cache.ttl,
+            }
+
+
+# Instance global yang dipakai oleh router lapak
+nearby_cache = NearbyCache(
+    maxsize=settings.NEARBY_CACHE_MAXSIZE,
+    ttl=settings.NEARBY_CACHE_TTL_SECONDS,
+    precision=settings.NEARBY_CACHE_GEOHASH_PRECISION,
+)
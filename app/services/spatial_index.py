@@ -0,0 +1,248 @@
+# app/services/spatial_index.py
+
+import math
+import threading
+import time
+import uuid
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..core.geo import EARTH_RADIUS_M
+from ..models.listing import Listing
+
+# Kira-kira jumlah meter per derajat lintang
+METERS_PER_DEGREE = 111320.0
+
+
+def haversine_m_vectorized(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Versi NumPy dari haversine: jarak dari satu titik ke banyak titik (meter)."""
+    phi1 = math.radians(lat)
+    phi2 = np.radians(lats)
+    dphi = phi2 - phi1
+    dlambda = np.radians(lons - lon)
+    a = np.sin(dphi / 2) ** 2 + math.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(1.0, a)))
+
+
+class ListingSpatialIndex:
+    """
+    Index in-memory untuk semua listing berstatus 'available'.
+
+    Data disimpan sebagai array ringkas (lat, lon, price) per slot dan
+    dikelompokkan dalam grid seragam berukuran `cell_degrees`. Pencarian
+    hanya menghitung jarak untuk slot di sel-sel yang bersinggungan dengan
+    bounding box radius, lalu memfilter dan mengurutkan secara vektor.
+    """
+
+    def __init__(self, cell_degrees: float = 0.01, initial_capacity: int = 1024):
+        self.cell_degrees = cell_degrees
+        self._initial_capacity = initial_capacity
+        self._lock = threading.RLock()
+        # Hanya satu sinkronisasi penuh yang berjalan pada satu waktu
+        self._sync_lock = threading.Lock()
+        self.loaded = False
+        self.last_sync: Optional[float] = None
+        self._reset()
+
+    def _reset(self) -> None:
+        capacity = self._initial_capacity
+        self._lat = np.zeros(capacity, dtype=np.float64)
+        self._lon = np.zeros(capacity, dtype=np.float64)
+        self._price = np.zeros(capacity, dtype=np.float64)
+        self._ids = np.empty(capacity, dtype=object)
+        self._keys = np.empty(capacity, dtype=object)  # str(id), untuk tie-breaker urutan
+        self._size = 0
+        self._slots: Dict[uuid.UUID, int] = {}
+        self._free: List[int] = []
+        self._grid: Dict[Tuple[int, int], Set[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return int(math.floor(lat / self.cell_degrees)), int(math.floor(lon / self.cell_degrees))
+
+    def _grow(self) -> None:
+        capacity = len(self._lat) * 2
+        for name in ("_lat", "_lon", "_price"):
+            grown = np.zeros(capacity, dtype=np.float64)
+            grown[:self._size] = getattr(self, name)[:self._size]
+            setattr(self, name, grown)
+        for name in ("_ids", "_keys"):
+            grown = np.empty(capacity, dtype=object)
+            grown[:self._size] = getattr(self, name)[:self._size]
+            setattr(self, name, grown)
+
+    def _insert(self, listing_id: uuid.UUID, lat: float, lon: float, price: float) -> None:
+        if self._free:
+            slot = self._free.pop()
+        else:
+            if self._size == len(self._lat):
+                self._grow()
+            slot = self._size
+            self._size += 1
+        self._lat[slot] = lat
+        self._lon[slot] = lon
+        self._price[slot] = price
+        self._ids[slot] = listing_id
+        self._keys[slot] = str(listing_id)
+        self._slots[listing_id] = slot
+        self._grid.setdefault(self._cell(lat, lon), set()).add(slot)
+
+    def _remove_slot(self, slot: int) -> None:
+        cell = self._cell(self._lat[slot], self._lon[slot])
+        bucket = self._grid.get(cell)
+        if bucket is not None:
+            bucket.discard(slot)
+            if not bucket:
+                del self._grid[cell]
+        self._ids[slot] = None
+        self._keys[slot] = None
+        self._free.append(slot)
+
+    def load(self, rows: Iterable[Tuple[uuid.UUID, float, float, float]]) -> int:
+        """Memuat ulang seluruh index dari (id, lat, lon, price)."""
+        # Baca semua baris di luar lock agar query lain tidak tertahan oleh I/O database
+        rows = [row for row in rows if row[1] is not None and row[2] is not None]
+        with self._lock:
+            self._reset()
+            for listing_id, lat, lon, price in rows:
+                self._insert(listing_id, float(lat), float(lon), float(price))
+            self.loaded = True
+            self.last_sync = time.monotonic()
+            return len(self._slots)
+
+    def upsert(self, listing_id: uuid.UUID, lat: float, lon: float, price: float) -> None:
+        """Menambah atau memperbarui satu listing. Diabaikan jika index belum dimuat."""
+        with self._lock:
+            if not self.loaded:
+                return
+            slot = self._slots.get(listing_id)
+            if slot is not None:
+                del self._slots[listing_id]
+                self._remove_slot(slot)
+            self._insert(listing_id, float(lat), float(lon), float(price))
+
+    def remove(self, listing_id: uuid.UUID) -> None:
+        """Menghapus listing (mis. status bukan lagi 'available')."""
+        with self._lock:
+            slot = self._slots.pop(listing_id, None)
+            if slot is not None:
+                self._remove_slot(slot)
+
+    def query(
+        self,
+        lat: float,
+        lon: float,
+        radius: float,
+        price_min: Optional[float] = None,
+        price_max: Optional[float] = None
+    ) -> Tuple[List[uuid.UUID], np.ndarray]:
+        """
+        Mengembalikan id dan jarak (meter) semua listing dalam radius
+        (dan rentang harga, jika diberikan), terurut berdasarkan (distance, id).
+        """
+        dlat = radius / METERS_PER_DEGREE
+        dlon = radius / (METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6))
+        min_cell = self._cell(lat - dlat, lon - dlon)
+        max_cell = self._cell(lat + dlat, lon + dlon)
+
+        with self._lock:
+            cell_count = (max_cell[0] - min_cell[0] + 1) * (max_cell[1] - min_cell[1] + 1)
+            slots: List[int] = []
+            if cell_count > len(self._grid):
+                # Radius besar: lebih murah memeriksa sel yang terisi saja
+                for (cy, cx), bucket in self._grid.items():
+                    if min_cell[0] <= cy <= max_cell[0] and min_cell[1] <= cx <= max_cell[1]:
+                        slots.extend(bucket)
+            else:
+                for cy in range(min_cell[0], max_cell[0] + 1):
+                    for cx in range(min_cell[1], max_cell[1] + 1):
+                        bucket = self._grid.get((cy, cx))
+                        if bucket:
+                            slots.extend(bucket)
+
+            if not slots:
+                return [], np.empty(0, dtype=np.float64)
+
+            candidates = np.fromiter(slots, dtype=np.int64, count=len(slots))
+            distances = haversine_m_vectorized(lat, lon, self._lat[candidates], self._lon[candidates])
+            within = distances <= radius
+            if price_min is not None:
+                within &= self._price[candidates] >= price_min
+            if price_max is not None:
+                within &= self._price[candidates] <= price_max
+            candidates = candidates[within]
+            distances = distances[within]
+            ids = self._ids[candidates]
+            keys = self._keys[candidates]
+
+        order = np.argsort(distances, kind="stable")
+        sorted_distances = distances[order]
+        if len(order) > 1 and np.any(sorted_distances[1:] == sorted_distances[:-1]):
+            # Ada jarak yang sama persis (mis. beberapa lapak di lokasi profil yang sama)
+            order = np.lexsort((keys, distances))
+            sorted_distances = distances[order]
+        return list(ids[order]), sorted_distances
+
+    def sync_from_db(self, db: Session) -> int:
+        """Memuat ulang index dari tabel listings untuk mengoreksi drift."""
+        rows = (
+            db.query(Listing.id, Listing.latitude, Listing.longitude, Listing.price)
+            .filter(Listing.status == 'available')
+            .execution_options(yield_per=5000)
+        )
+        return self.load(rows)
+
+    def is_stale(self) -> bool:
+        if not self.loaded or self.last_sync is None:
+            return True
+        return time.monotonic() - self.last_sync > settings.SPATIAL_INDEX_RESYNC_SECONDS
+
+    def sync_if_stale(self, db: Session, session_factory) -> None:
+        """
+        Memuat ulang index jika sudah melewati SPATIAL_INDEX_RESYNC_SECONDS.
+
+        Hanya pemuatan pertama yang ditunggu oleh request (request lain menunggu
+        lock yang sama, bukan memuat ulang sendiri). Setelah itu sinkronisasi
+        berjalan di thread latar dengan session dari `session_factory`, dan
+        query tetap dilayani dari snapshot lama sampai data baru siap.
+        """
+        if not self.is_stale():
+            return
+        if not self.loaded:
+            with self._sync_lock:
+                if not self.loaded:
+                    self.sync_from_db(db)
+            return
+        if not self._sync_lock.acquire(blocking=False):
+            return  # Sinkronisasi lain sedang berjalan
+        try:
+            threading.Thread(
+                target=self._resync_in_background, args=(session_factory,),
+                name="spatial-index-resync", daemon=True
+            ).start()
+        except Exception:
+            self._sync_lock.release()
+            raise
+
+    def _resync_in_background(self, session_factory) -> None:
+        try:
+            db = session_factory()
+            try:
+                loaded_count = self.sync_from_db(db)
+            finally:
+                db.close()
+            print(f"Spatial index resynced: {loaded_count} listing(s)")
+        except Exception as e:
+            # Snapshot lama tetap dipakai; dicoba lagi pada request berikutnya
+            print(f"Spatial index resync failed: {e}")
+        finally:
+            self._sync_lock.release()
+
+
+# Instance global yang dipakai oleh router lapak
+spatial_index = ListingSpatialIndex(cell_degrees=settings.SPATIAL_INDEX_CELL_DEGREES)
@@ -0,0 +1,194 @@
+# app/services/view_counter.py
+
+import atexit
+import hashlib
+import math
+import threading
+import uuid
+from datetime import date, datetime, timezone
+from typing import Callable, Dict, Optional, Tuple
+
+from sqlalchemy import Integer, column, text, update, values
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..models.listing import Listing
+
+# Presisi HyperLogLog: 2^10 register (1 KB per lapak per hari), galat standar ~3.25%.
+# Harus sama dengan sketch yang sudah tersimpan di listing_view_sketches.
+HLL_PRECISION = 10
+HLL_REGISTERS = 1 << HLL_PRECISION
+
+
+class HyperLogLog:
+    """
+    Sketch HyperLogLog sederhana untuk memperkirakan jumlah viewer unik.
+    Register disimpan sebagai bytearray (satu byte per register) sehingga
+    dapat disimpan langsung sebagai bytea dan digabung dengan max per register.
+    """
+
+    def __init__(self, registers: Optional[bytearray] = None):
+        if registers is None:
+            registers = bytearray(HLL_REGISTERS)
+        self.registers = registers
+
+    @classmethod
+    def from_bytes(cls, raw: bytes) -> "HyperLogLog":
+        if len(raw) != HLL_REGISTERS:
+            raise ValueError("Invalid HyperLogLog sketch size")
+        return cls(bytearray(raw))
+
+    def to_bytes(self) -> bytes:
+        return bytes(self.registers)
+
+    def add(self, value: str) -> None:
+        hashed = int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+        index = hashed >> (64 - HLL_PRECISION)
+        remainder = hashed & ((1 << (64 - HLL_PRECISION)) - 1)
+        # Posisi bit 1 pertama pada sisa hash (1-based)
+        rank = (64 - HLL_PRECISION) - remainder.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog") -> None:
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self) -> int:
+        alpha = 0.7213 / (1 + 1.079 / HLL_REGISTERS)
+        estimate = alpha * HLL_REGISTERS ** 2 / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * HLL_REGISTERS and zeros:
+            # Koreksi rentang kecil (linear counting)
+            estimate = HLL_REGISTERS * math.log(HLL_REGISTERS / zeros)
+        return int(round(estimate))
+
+
+class ViewCounterBuffer:
+    """
+    Buffer in-process untuk jumlah view lapak (write-behind).
+
+    `record` hanya menaikkan counter di memori. Thread latar belakang
+    menulis semua counter setiap `flush_interval` detik: total view dengan
+    satu UPDATE multi-baris, dan sketch viewer unik per lapak per hari dengan
+    satu upsert yang menggabungkan register di database (hll_merge).
+    Buffer juga di-flush saat shutdown (event FastAPI dan atexit).
+    """
+
+    def __init__(self, flush_interval: float = 10.0):
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._counts: Dict[uuid.UUID, int] = {}
+        self._sketches: Dict[Tuple[uuid.UUID, date], HyperLogLog] = {}
+        self._session_factory: Optional[Callable[[], Session]] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def record(self, listing_id: uuid.UUID, viewer_key: str) -> None:
+        """Mencatat satu view. Tidak menyentuh database."""
+        day = datetime.now(timezone.utc).date()
+        with self._lock:
+            self._counts[listing_id] = self._counts.get(listing_id, 0) + 1
+            sketch = self._sketches.get((listing_id, day))
+            if sketch is None:
+                sketch = self._sketches[(listing_id, day)] = HyperLogLog()
+            sketch.add(viewer_key)
+
+    def pending(self, listing_id: uuid.UUID) -> Tuple[int, Dict[date, HyperLogLog]]:
+        """View yang belum di-flush untuk satu lapak: (jumlah, sketch per hari)."""
+        with self._lock:
+            sketches = {
+                day: HyperLogLog(bytearray(sketch.registers))
+                for (sketch_listing_id, day), sketch in self._sketches.items()
+                if sketch_listing_id == listing_id
+            }
+            return self._counts.get(listing_id, 0), sketches
+
+    def start(self, session_factory: Callable[[], Session]) -> None:
+        """Menjalankan thread flush berkala (sekali per proses)."""
+        with self._lock:
+            self._session_factory = session_factory
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="view-counter-flush", daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def stop(self) -> None:
+        """Menghentikan thread flush dan menulis sisa buffer."""
+        self._stop.set()
+        if self._session_factory is not None:
+            try:
+                self.flush(self._session_factory)
+            except Exception as e:
+                print(f"View counter flush on shutdown failed, {e}")
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush(self._session_factory)
+            except Exception as e:
+                print(f"View counter flush failed, will retry: {e}")
+
+    def flush(self, session_factory: Callable[[], Session]) -> int:
+        """Menulis semua counter ke database. Mengembalikan jumlah view yang ditulis."""
+        with self._flush_lock:
+            with self._lock:
+                counts, self._counts = self._counts, {}
+                sketches, self._sketches = self._sketches, {}
+            if not counts:
+                return 0
+
+            try:
+                with session_factory() as db:
+                    _write_counts(db, counts)
+                    _write_sketches(db, sketches)
+                    db.commit()
+            except Exception:
+                # Kembalikan ke buffer agar tidak hilang; dicoba lagi pada flush berikutnya
+                with self._lock:
+                    for listing_id, count in counts.items():
+                        self._counts[listing_id] = self._counts.get(listing_id, 0) + count
+                    for key, sketch in sketches.items():
+                        if key in self._sketches:
+                            self._sketches[key].merge(sketch)
+                        else:
+                            self._sketches[key] = sketch
+                raise
+            return sum(counts.values())
+
+
+def _write_counts(db: Session, counts: Dict[uuid.UUID, int]) -> None:
+    deltas = values(
+        column("id", UUID(as_uuid=True)),
+        column("delta", Integer),
+        name="deltas"
+    ).data(list(counts.items()))
+    db.execute(
+        update(Listing)
+        .where(Listing.id == deltas.c.id)
+        # updated_at ditulis ulang dengan nilainya sendiri agar onupdate=now() tidak ikut;
+        # view bukan perubahan konten (ETag, last_updated_at dan umur arsip bergantung padanya)
+        .values(view_count=Listing.view_count + deltas.c.delta, updated_at=Listing.updated_at)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _write_sketches(db: Session, sketches: Dict[Tuple[uuid.UUID, date], HyperLogLog]) -> None:
+    db.execute(
+        text("""
+            INSERT INTO listing_view_sketches (listing_id, day, registers)
+            VALUES (:listing_id, :day, :registers)
+            ON CONFLICT (listing_id, day) DO UPDATE
+            SET registers = hll_merge(listing_view_sketches.registers, EXCLUDED.registers)
+        """),
+        [
+            {"listing_id": listing_id, "day": day, "registers": sketch.to_bytes()}
+            for (listing_id, day), sketch in sketches.items()
+        ]
+    )
+
+
+# Instance global yang dipakai oleh router lapak
+view_counter = ViewCounterBuffer(flush_interval=settings.VIEW_COUNTER_FLUSH_SECONDS)
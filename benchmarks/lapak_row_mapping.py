@@ -0,0 +1,122 @@
+"""
+Benchmark biaya CPU per baris untuk membangun respons daftar lapak.
+
+Membandingkan dua jalur pada halaman berisi 50 baris:
+  orm   objek Listing + Profile (instrumentasi ORM), LapakSchema.from_orm,
+        lalu longitude/latitude/distance di-patch satu per satu
+  lean  baris kolom hasil _lapak_query dipetakan langsung ke dict
+
+Keduanya diakhiri validasi LapakListResponse seperti yang dilakukan
+FastAPI untuk response_model. Benchmark ini tidak membutuhkan database;
+waktu query dan I/O jaringan tidak termasuk.
+
+Contoh:
+    python -m benchmarks.lapak_row_mapping
+    python -m benchmarks.lapak_row_mapping --rows 50 --repeat 200
+"""
+
+import argparse
+import sys
+import time
+import uuid
+from collections import namedtuple
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from app.models.listing import Listing
+from app.models.profile import Profile
+from app.routers.lapak import LAPAK_COLUMNS, _lapak_row_to_dict
+from app.schemas.lapak import LapakListResponse, LapakSchema
+
+LapakRow = namedtuple("LapakRow", [column.key for column in LAPAK_COLUMNS] + ["distance"])
+
+
+def make_rows(count: int):
+    """Membuat `count` baris sintetis dengan bentuk yang sama seperti hasil query."""
+    now = datetime.now(timezone.utc)
+    seller_id = uuid.uuid4()
+    return [
+        LapakRow(
+            id=uuid.uuid4(),
+            seller_id=seller_id,
+            title=f"Produk {i}",
+            description="Sayur segar dari kebun sendiri",
+            price=Decimal("12500.00"),
+            unit="ikat",
+            stock_quantity=10,
+            image_urls=["https://example.blob.core.windows.net/lapak-images/a.jpg"],
+            status="available",
+            created_at=now,
+            updated_at=now,
+            longitude=106.816666 + i * 1e-4,
+            latitude=-6.2 + i * 1e-4,
+            seller_full_name="Bu Sari",
+            distance=float(i * 10)
+        )
+        for i in range(count)
+    ]
+
+
+def orm_page(rows) -> dict:
+    lapak_list = []
+    for row in rows:
+        seller = Profile(id=row.seller_id, full_name=row.seller_full_name)
+        listing = Listing(
+            id=row.id,
+            seller_id=row.seller_id,
+            title=row.title,
+            description=row.description,
+            price=row.price,
+            unit=row.unit,
+            stock_quantity=row.stock_quantity,
+            image_urls=row.image_urls,
+            status=row.status,
+            created_at=row.created_at,
+            updated_at=row.updated_at,
+            seller=seller
+        )
+        lapak_schema = LapakSchema.from_orm(listing)
+        lapak_schema.longitude = row.longitude
+        lapak_schema.latitude = row.latitude
+        lapak_schema.distance = row.distance
+        lapak_list.append(lapak_schema)
+    return {"lapak": lapak_list, "has_more": False}
+
+
+def lean_page(rows) -> dict:
+    return {
+        "lapak": [_lapak_row_to_dict(row, distance=row.distance) for row in rows],
+        "has_more": False
+    }
+
+
+def measure(build_page, rows, repeat: int) -> float:
+    """Mengembalikan waktu terbaik per baris (mikrodetik) dari `repeat` percobaan."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        LapakListResponse.model_validate(build_page(rows)).model_dump(mode="json")
+        best = min(best, time.perf_counter() - started)
+    return best / len(rows) * 1e6
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50, help="Rows per page")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    # Pemanasan agar validator pydantic dan mapper ORM sudah terkonfigurasi
+    measure(orm_page, rows, 5)
+    measure(lean_page, rows, 5)
+
+    orm_us = measure(orm_page, rows, args.repeat)
+    lean_us = measure(lean_page, rows, args.repeat)
+    print(f"orm   {orm_us:8.2f} us/row")
+    print(f"lean  {lean_us:8.2f} us/row  ({orm_us / lean_us:.1f}x faster)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
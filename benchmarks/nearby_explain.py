@@ -0,0 +1,140 @@
+"""
+Benchmark EXPLAIN untuk query /lapak/nearby dengan berbagai kombinasi filter.
+
+Menjalankan EXPLAIN (ANALYZE, FORMAT JSON) terhadap database di DATABASE_URL
+dan gagal (exit code 1) jika ada Seq Scan pada tabel listings. Skenario
+terakhir memeriksa mode=knn (ORDER BY location <-> titik).
+
+Contoh:
+    python -m benchmarks.nearby_explain --seed 200000
+    python -m benchmarks.nearby_explain
+
+--seed membuat data sintetis di sekitar Jakarta. Jangan jalankan terhadap
+database produksi.
+"""
+
+import argparse
+import json
+import sys
+import time
+import uuid
+from decimal import Decimal
+
+from sqlalchemy import func, text
+from sqlalchemy.dialects import postgresql
+
+from app.core.database import SessionLocal
+from app.models.listing import Listing
+from app.routers.lapak import nearby_filters
+
+CENTER_LAT = -6.200000
+CENTER_LON = 106.816666
+
+SCENARIOS = [
+    ("radius only", {}),
+    ("price range", {"price_min": Decimal("5000"), "price_max": Decimal("20000")}),
+    ("unit", {"unit": "kg"}),
+    ("unit + price range", {"unit": "kg", "price_min": Decimal("5000"), "price_max": Decimal("20000")}),
+    ("sold_out", {"status": "sold_out"}),
+]
+
+
+def seed(db, count: int) -> None:
+    """Membuat satu profil penjual dan `count` listing acak di sekitar Jakarta."""
+    seller_id = uuid.uuid4()
+    db.execute(
+        text("INSERT INTO profiles (id, full_name) VALUES (:id, 'Benchmark Seller')"),
+        {"id": seller_id}
+    )
+    db.execute(
+        text("""
+            INSERT INTO listings (id, seller_id, title, price, unit, stock_quantity, status, location, created_at, updated_at)
+            SELECT
+                gen_random_uuid(),
+                :seller_id,
+                'Produk ' || g,
+                round((1000 + random() * 49000)::numeric, 2),
+                (ARRAY['kg', 'ikat', 'buah', 'porsi', 'botol'])[1 + floor(random() * 5)::int],
+                1 + floor(random() * 20)::int,
+                CASE WHEN random() < 0.8 THEN 'available' WHEN random() < 0.5 THEN 'sold_out' ELSE 'inactive' END,
+                ST_SetSRID(ST_MakePoint(:lon + (random() - 0.5) * 0.6, :lat + (random() - 0.5) * 0.6), 4326)::geography,
+                now(),
+                now()
+            FROM generate_series(1, :count) AS g
+        """),
+        {"seller_id": seller_id, "lat": CENTER_LAT, "lon": CENTER_LON, "count": count}
+    )
+    db.commit()
+    db.execute(text("ANALYZE listings"))
+    db.commit()
+
+
+def plan_nodes(plan: dict):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def explain(db, radius: int, limit: int, filters: dict, knn: bool = False) -> dict:
+    # Literal geography (bukan WKTElement) agar statement bisa dirender dengan literal_binds
+    user_location = func.ST_GeogFromText(f"SRID=4326;POINT({CENTER_LON} {CENTER_LAT})")
+    distance = func.ST_Distance(Listing.location, user_location)
+    if knn:
+        query = (
+            db.query(Listing.id, distance.label("distance"))
+            .filter(Listing.status == "available")
+            .order_by(Listing.location.op("<->")(user_location))
+            .limit(limit)
+        )
+    else:
+        query = (
+            db.query(Listing.id, distance.label("distance"))
+            .filter(*nearby_filters(user_location, radius, **filters))
+            .order_by(distance, Listing.id)
+            .limit(limit + 1)
+        )
+    compiled = query.statement.compile(
+        dialect=postgresql.dialect(),
+        compile_kwargs={"literal_binds": True}
+    )
+    row = db.execute(text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {compiled}")).scalar()
+    return (row if isinstance(row, list) else json.loads(row))[0]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", type=int, default=0, help="Insert N synthetic listings before running")
+    parser.add_argument("--radius", type=int, default=2000)
+    parser.add_argument("--limit", type=int, default=12)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.seed:
+            started = time.perf_counter()
+            seed(db, args.seed)
+            print(f"Seeded {args.seed} listings in {time.perf_counter() - started:.1f}s")
+
+        failures = 0
+        scenarios = [(name, filters, False) for name, filters in SCENARIOS] + [("knn", {}, True)]
+        for name, filters, knn in scenarios:
+            result = explain(db, args.radius, args.limit, filters, knn=knn)
+            nodes = list(plan_nodes(result["Plan"]))
+            seq_scans = [
+                node for node in nodes
+                if node["Node Type"] == "Seq Scan" and node.get("Relation Name") == "listings"
+            ]
+            scans = sorted({
+                f'{node["Node Type"]}({node.get("Index Name") or node.get("Relation Name")})'
+                for node in nodes if "Scan" in node["Node Type"]
+            })
+            status = "FAIL" if seq_scans else "ok"
+            failures += bool(seq_scans)
+            print(f"[{status}] {name:<20} {result['Execution Time']:>8.2f} ms  {', '.join(scans)}")
+        return 1 if failures else 0
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,6 +6,7 @@ from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 from fastapi.testclient import TestClient
 from unittest.mock import MagicMock
+import os
 import uuid
 from datetime import datetime
 from app.models.listing import Listing
@@ -52,6 +53,27 @@ class TestListing(TestBase):
     longitude = Column(Numeric(precision=10, scale=7))
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    rank_score = Column(Numeric)
+    view_count = Column(Integer, nullable=False, default=0)
+
+class TestListingArchive(TestBase):
+    __tablename__ = "listings_archive"
+
+    id = Column(String, primary_key=True)
+    seller_id = Column(String, ForeignKey("profiles.id"), nullable=False)
+    title = Column(String, nullable=False)
+    description = Column(Text)
+    price = Column(Numeric(precision=12, scale=2), nullable=False)
+    unit = Column(String, nullable=False)
+    stock_quantity = Column(Integer, nullable=False)
+    image_urls = Column(Text)
+    status = Column(String, nullable=False)
+    latitude = Column(Numeric(precision=10, scale=7))
+    longitude = Column(Numeric(precision=10, scale=7))
+    view_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime)
+    updated_at = Column(DateTime)
+    archived_at = Column(DateTime, default=datetime.utcnow)
 
 class TestGroupBuy(TestBase):
     __tablename__ = "group_buys"
@@ -67,12 +89,16 @@ class TestGroupBuy(TestBase):
     
     target_quantity = Column(Integer, nullable=False)
     current_quantity = Column(Integer, nullable=False, default=0)
+    participants_count = Column(Integer, nullable=False, default=0)
+    paid_quantity = Column(Integer, nullable=False, default=0)
+    pending_quantity = Column(Integer, nullable=False, default=0)
     
     deadline = Column(DateTime, nullable=False)
     status = Column(String(20), nullable=False, default='active')
     pickup_point_address = Column(Text, nullable=False)
     
     created_at = Column(DateTime, default=datetime.now)
+    version = Column(Integer, nullable=False, default=1)
 
 class TestGroupBuyParticipant(TestBase):
     __tablename__ = "group_buy_participants"
@@ -201,4 +227,177 @@ def authenticated_client(client: TestClient, test_user):
     finally:
         # Clean up the override
         if get_current_user in app.dependency_overrides:
-            del app.dependency_overrides[get_current_user] 
\ No newline at end of file
+            del app.dependency_overrides[get_current_user] 
+
+@pytest.fixture
+def postgres_connection():
+    """
+    Koneksi ke database Postgres sungguhan untuk query yang tidak bisa diuji di SQLite.
+    Dilewati jika TEST_POSTGRES_URL tidak diset; semua perubahan di-rollback.
+    """
+    url = os.environ.get("TEST_POSTGRES_URL")
+    if not url:
+        pytest.skip("TEST_POSTGRES_URL is not set")
+    pg_engine = create_engine(url)
+    try:
+        with pg_engine.connect() as connection:
+            transaction = connection.begin()
+            try:
+                yield connection
+            finally:
+                transaction.rollback()
+    finally:
+        pg_engine.dispose()
+
+
+class FakeResult:
+    """Hasil Session.execute palsu: `rows` untuk one()/first()/scalar(), `rowcount` untuk UPDATE."""
+
+    def __init__(self, rows=(), rowcount=0):
+        self.rows = list(rows)
+        self.rowcount = rowcount
+
+    def one(self):
+        return self.rows[0]
+
+    def first(self):
+        return self.rows[0] if self.rows else None
+
+    def scalar(self):
+        return self.rows[0][0] if self.rows else None
+
+
+class FakeQuery:
+    """
+    Query palsu untuk kode yang memakai fungsi PostGIS (tidak bisa dijalankan di SQLite):
+    setiap method berantai dan dicatat, `all()`/iterasi mengembalikan `rows`.
+    """
+
+    def __init__(self, session, entities):
+        self.session = session
+        self.entities = entities
+
+    def __getattr__(self, name):
+        def chain(*args, **kwargs):
+            self.session.calls.append((name, args))
+            return self
+        return chain
+
+    def cte(self, name):
+        from sqlalchemy import select
+        return select(*self.entities).cte(name)
+
+    def all(self):
+        return list(self.session.rows)
+
+    def __iter__(self):
+        return iter(self.session.rows)
+
+    def first(self):
+        if self.session.first_results:
+            return self.session.first_results.pop(0)
+        return self.session.rows[0] if self.session.rows else None
+
+    def scalar(self):
+        return self.session.scalar_value
+
+
+class FakeSession:
+    """
+    Session palsu bersama untuk test router dan job maintenance.
+
+    `query()` mengembalikan FakeQuery; `first()` mengembalikan `first_results`
+    secara berurutan lalu baris pertama `rows`; `execute()` mengembalikan hasil dari
+    `execute_results` secara berurutan (FakeResult kosong jika habis). Semua
+    pemanggilan dicatat di `calls` sebagai (method, args), objek baru di `added`
+    dan objek yang dihapus di `deleted`.
+    Dipakai juga sebagai session_factory: `FakeSession.factory()` selalu
+    mengembalikan session yang sama.
+    """
+
+    def __init__(self, scalar_value=0, rows=(), execute_results=()):
+        self.queries = []
+        self.calls = []
+        self.added = []
+        self.deleted = []
+        self.commits = 0
+        self.closed = False
+        self.scalar_value = scalar_value
+        self.rows = list(rows)
+        self.execute_results = list(execute_results)
+        self.first_results = []
+
+    def query(self, *entities):
+        self.queries.append(entities)
+        return FakeQuery(self, entities)
+
+    def execute(self, statement, params=None):
+        self.calls.append(("execute", (statement, params)))
+        return self.execute_results.pop(0) if self.execute_results else FakeResult()
+
+    def executed_params(self):
+        """Parameter setiap execute(), berurutan."""
+        return [args[1] for name, args in self.calls if name == "execute"]
+
+    def connection(self, **kwargs):
+        return None
+
+    def add(self, obj):
+        self.added.append(obj)
+
+    def delete(self, obj):
+        self.deleted.append(obj)
+
+    def refresh(self, obj):
+        # Nilai default dari database untuk objek yang baru di-INSERT
+        if getattr(obj, "id", None) is None:
+            obj.id = uuid.uuid4()
+        if getattr(obj, "created_at", None) is None:
+            obj.created_at = datetime.now()
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def factory(self):
+        return lambda: self
+
+
+@pytest.fixture
+def fake_session():
+    return FakeSession()
+
+
+@pytest.fixture
+def fake_db_client(fake_session):
+    """TestClient dengan get_db yang mengembalikan FakeSession (scalar() = 3)."""
+    from app.main import app
+    from app.core.database import get_db
+
+    fake_session.scalar_value = 3
+    app.dependency_overrides[get_db] = lambda: fake_session
+    try:
+        yield TestClient(app), fake_session
+    finally:
+        app.dependency_overrides.clear()
+
+
+@pytest.fixture
+def postgres_session_factory(postgres_connection):
+    """
+    Session factory untuk job maintenance di atas postgres_connection. commit()
+    di dalam job hanya melepas savepoint, jadi semuanya tetap di-rollback.
+    """
+    return sessionmaker(bind=postgres_connection, join_transaction_mode="create_savepoint")
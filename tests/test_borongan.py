@@ -8,6 +8,7 @@ from unittest.mock import patch, MagicMock
 from fastapi.testclient import TestClient
 
 from app.main import app
+from tests.conftest import FakeResult
 
 client = TestClient(app)
 
@@ -151,4 +152,468 @@ class TestBoronganAPI:
         assert 'T' in iso_string
         
         # Test that future dates are properly calculated
-        assert future > now 
\ No newline at end of file
+        assert future > now 
+
+def test_active_borongan_list_runs_single_query(client, db_session):
+    """Test that the borongan list reads stored totals in one query and never touches participants."""
+    from sqlalchemy import event
+    from tests.conftest import TestProfile, TestGroupBuy, TestGroupBuyParticipant
+
+    # Model asli menyimpan UUID di SQLite sebagai hex 32 karakter
+    supplier_id = uuid.uuid4().hex
+    db_session.add(TestProfile(id=supplier_id, full_name="Supplier"))
+    buyer_ids = [uuid.uuid4().hex for _ in range(3)]
+    for buyer_id in buyer_ids:
+        db_session.add(TestProfile(id=buyer_id, full_name="Buyer"))
+
+    group_buy_ids = [uuid.uuid4().hex for _ in range(5)]
+    for index, group_buy_id in enumerate(group_buy_ids):
+        db_session.add(TestGroupBuy(
+            id=group_buy_id,
+            supplier_id=supplier_id,
+            title=f"Borongan {index}",
+            price_per_unit=Decimal("10000.00"),
+            unit="kg",
+            target_quantity=50,
+            current_quantity=min(index, 3) * 2,
+            participants_count=min(index, 3),
+            paid_quantity=min(index, 3),
+            pending_quantity=min(index, 3),
+            deadline=datetime.utcnow() + timedelta(days=5),
+            status="active",
+            pickup_point_address="Balai RW"
+        ))
+        # Borongan ke-i memiliki i peserta (maks. 3), masing-masing memesan 2 unit
+        for buyer_id in buyer_ids[:index]:
+            db_session.add(TestGroupBuyParticipant(
+                id=uuid.uuid4().hex,
+                group_buy_id=group_buy_id,
+                user_id=buyer_id,
+                quantity_ordered=2,
+                total_price=Decimal("20000.00")
+            ))
+    db_session.commit()
+
+    statements = []
+    engine = db_session.get_bind()
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", count_statement)
+    try:
+        response = client.get("/borongan/")
+    finally:
+        event.remove(engine, "before_cursor_execute", count_statement)
+
+    assert response.status_code == 200
+    selects = [statement for statement in statements if statement.lstrip().upper().startswith("SELECT")]
+    assert len(selects) == 1
+    assert "group_buy_participants" not in selects[0]
+
+    borongan = {item["title"]: item for item in response.json()["borongan"]}
+    assert len(borongan) == 5
+    for index in range(5):
+        expected_participants = min(index, 3)
+        assert borongan[f"Borongan {index}"]["participants_count"] == expected_participants
+        assert borongan[f"Borongan {index}"]["current_quantity"] == expected_participants * 2
+        assert borongan[f"Borongan {index}"]["paid_quantity"] == expected_participants
+
+
+def test_adjust_group_buy_totals_payment_transitions():
+    """Test that participant totals follow join, payment and rollback transitions."""
+    from app.models.group_buy import GroupBuy
+    from app.services.group_buy_totals import adjust_group_buy_totals
+
+    group_buy = GroupBuy(
+        target_quantity=10, current_quantity=0, participants_count=0,
+        paid_quantity=0, pending_quantity=0, status="active"
+    )
+
+    adjust_group_buy_totals(group_buy, 6, None, "pending")  # join
+    adjust_group_buy_totals(group_buy, 4, None, "pending")  # join, target tercapai
+    assert (group_buy.participants_count, group_buy.pending_quantity, group_buy.current_quantity) == (2, 10, 10)
+    assert group_buy.status == "successful"
+
+    adjust_group_buy_totals(group_buy, 6, "pending", "paid")  # webhook PAID
+    assert (group_buy.paid_quantity, group_buy.pending_quantity, group_buy.current_quantity) == (6, 4, 10)
+
+    adjust_group_buy_totals(group_buy, 4, "pending", "failed")  # webhook EXPIRED
+    assert (group_buy.participants_count, group_buy.pending_quantity, group_buy.current_quantity) == (1, 0, 6)
+    assert group_buy.status == "active"
+
+    # Webhook duplikat tidak mengubah apa pun
+    adjust_group_buy_totals(group_buy, 4, "failed", "failed")
+    assert (group_buy.participants_count, group_buy.paid_quantity, group_buy.current_quantity) == (1, 6, 6)
+
+
+def test_adjust_group_buy_totals_rejects_revival_over_quota():
+    """Test that a failed participant only becomes pending/paid again while its quantity fits the quota."""
+    from app.models.group_buy import GroupBuy
+    from app.services.group_buy_totals import adjust_group_buy_totals, GroupBuyQuotaExceeded
+
+    group_buy = GroupBuy(
+        target_quantity=10, current_quantity=8, participants_count=2,
+        paid_quantity=8, pending_quantity=0, status="active"
+    )
+
+    with pytest.raises(GroupBuyQuotaExceeded):
+        adjust_group_buy_totals(group_buy, 4, "failed", "paid")  # pembayaran terlambat, kuota sudah terisi
+    assert (group_buy.participants_count, group_buy.paid_quantity, group_buy.current_quantity) == (2, 8, 8)
+
+    adjust_group_buy_totals(group_buy, 2, "expired", "paid")
+    assert (group_buy.participants_count, group_buy.paid_quantity, group_buy.current_quantity) == (3, 10, 10)
+    assert group_buy.status == "successful"
+
+
+def test_set_payment_status_uses_status_read_under_lock(fake_session):
+    """
+    Test that set_payment_status locks the group buy before re-reading the participant,
+    and moves totals from the status read under the lock rather than the caller's copy.
+    """
+    from types import SimpleNamespace
+    from app.models.group_buy import GroupBuy
+    from app.models.group_buy_participant import GroupBuyParticipant
+    from app.services.group_buy_totals import set_payment_status
+
+    group_buy = GroupBuy(
+        target_quantity=10, current_quantity=4, participants_count=1,
+        paid_quantity=4, pending_quantity=0, status="active"
+    )
+    participant_id, group_buy_id = uuid.uuid4(), uuid.uuid4()
+    stale = SimpleNamespace(id=participant_id, group_buy_id=group_buy_id, quantity_ordered=4, payment_status="pending")
+    # Webhook lain sudah menandai partisipan ini paid sebelum kunci didapat
+    locked = SimpleNamespace(id=participant_id, group_buy_id=group_buy_id, quantity_ordered=4, payment_status="paid")
+    fake_session.first_results = [group_buy, locked]
+
+    set_payment_status(fake_session, stale, "paid")
+
+    assert fake_session.queries == [(GroupBuy,), (GroupBuyParticipant,)]
+    assert (group_buy.paid_quantity, group_buy.pending_quantity, group_buy.current_quantity) == (4, 0, 4)
+
+    fake_session.first_results = [group_buy, locked]
+    set_payment_status(fake_session, stale, "failed")
+    assert locked.payment_status == "failed"
+    assert (group_buy.participants_count, group_buy.paid_quantity, group_buy.current_quantity) == (0, 0, 0)
+
+
+def test_undo_join_adjusts_group_buy_read_under_lock(fake_session):
+    """
+    Test that rolling back a join after a payment gateway failure re-locks the group buy
+    and subtracts from its current totals, not from the copy read before the commit.
+    """
+    from types import SimpleNamespace
+    from app.models.group_buy import GroupBuy
+    from app.routers.borongan import _undo_join
+
+    # Partisipan lain join (2 unit) setelah commit join ini (3 unit)
+    locked = GroupBuy(
+        target_quantity=10, current_quantity=5, participants_count=2,
+        paid_quantity=0, pending_quantity=5, status="active"
+    )
+    participant = SimpleNamespace(quantity_ordered=3, payment_status="pending")
+    fake_session.first_results = [locked]
+
+    _undo_join(fake_session, uuid.uuid4(), participant)
+
+    assert fake_session.queries == [(GroupBuy,)]
+    assert fake_session.deleted == [participant]
+    assert (locked.participants_count, locked.pending_quantity, locked.current_quantity) == (1, 2, 2)
+    assert fake_session.commits == 1
+
+
+def test_active_borongan_keyset_pagination(client, db_session):
+    """Test that GET /borongan/ pages through results with next_cursor and applies filters."""
+    from tests.conftest import TestProfile, TestGroupBuy
+
+    supplier_id = uuid.uuid4().hex
+    db_session.add(TestProfile(id=supplier_id, full_name="Supplier"))
+    now = datetime.utcnow()
+    for index in range(5):
+        db_session.add(TestGroupBuy(
+            id=uuid.uuid4().hex,
+            supplier_id=supplier_id,
+            title=f"Borongan {index}",
+            price_per_unit=Decimal("10000.00") * (index + 1),
+            unit="kg" if index % 2 == 0 else "ikat",
+            target_quantity=50,
+            current_quantity=index * 10,
+            deadline=now + timedelta(days=5 - index),
+            status="active",
+            pickup_point_address="Balai RW"
+        ))
+    db_session.commit()
+
+    titles = []
+    cursor = None
+    while True:
+        params = {"limit": 2, "sort": "deadline"}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/borongan/", params=params)
+        assert response.status_code == 200
+        body = response.json()
+        titles += [item["title"] for item in body["borongan"]]
+        cursor = body["next_cursor"]
+        if not body["has_more"]:
+            break
+    assert titles == [f"Borongan {index}" for index in (4, 3, 2, 1, 0)]
+
+    response = client.get("/borongan/", params={"sort": "closest", "unit": "kg", "price_max": "30000"})
+    assert [item["title"] for item in response.json()["borongan"]] == ["Borongan 2", "Borongan 0"]
+
+    # Cursor dari sort lain ditolak
+    first_page = client.get("/borongan/", params={"limit": 1, "sort": "newest"}).json()
+    response = client.get("/borongan/", params={"sort": "deadline", "cursor": first_page["next_cursor"]})
+    assert response.status_code == 400
+
+
+def test_borongan_nearby_rejects_invalid_input(client):
+    """Test that /borongan/nearby validates price range and cursor before querying."""
+    response = client.get("/borongan/nearby", params={"lat": -6.2, "lon": 106.8, "cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+    response = client.get(
+        "/borongan/nearby",
+        params={"lat": -6.2, "lon": 106.8, "price_min": "20000", "price_max": "10000"}
+    )
+    assert response.status_code == 400
+
+    response = client.get("/borongan/nearby", params={"lat": -6.2})
+    assert response.status_code == 422
+
+
+def test_borongan_event_hub_fans_out_to_subscribers():
+    """Test that published progress events reach only subscribers of that borongan."""
+    import asyncio
+    import json
+    from app.services.borongan_events import BoronganEventHub, format_sse
+
+    async def scenario():
+        hub = BoronganEventHub()
+        group_buy_id, other_id = uuid.uuid4(), uuid.uuid4()
+        queue = hub.subscribe(group_buy_id)
+        other_queue = hub.subscribe(other_id)
+
+        event = {"id": str(group_buy_id), "current_quantity": 5, "target_quantity": 10,
+                 "participants_count": 2, "status": "active", "version": 3}
+        # Dipanggil dari thread listener, bukan dari event loop
+        await asyncio.to_thread(hub.publish, event)
+        received = await asyncio.wait_for(queue.get(), timeout=1)
+        assert received == event
+        assert other_queue.empty()
+
+        hub.unsubscribe(group_buy_id, queue)
+        hub.unsubscribe(other_id, other_queue)
+        assert hub.subscriber_count() == 0
+        return received
+
+    event = asyncio.run(scenario())
+    message = format_sse(event)
+    assert message.startswith("id: 3\nevent: progress\ndata: ")
+    assert json.loads(message.split("data: ", 1)[1]) == event
+
+
+def test_borongan_events_unknown_borongan(client, monkeypatch):
+    """
+    Test that the events stream waits for LISTEN before subscribing, returns 404
+    for an unknown borongan and leaves no subscriber.
+    """
+    from app.services.borongan_events import borongan_events
+
+    calls = []
+    monkeypatch.setattr(borongan_events, "start", lambda engine, fetch_snapshots: calls.append("start"))
+    monkeypatch.setattr(borongan_events, "wait_until_listening", lambda: calls.append("wait") or True)
+    original_subscribe = borongan_events.subscribe
+    monkeypatch.setattr(borongan_events, "subscribe", lambda group_buy_id: calls.append("subscribe") or original_subscribe(group_buy_id))
+
+    response = client.get(f"/borongan/{uuid.uuid4()}/events")
+    assert response.status_code == 404
+    assert calls == ["start", "wait", "subscribe"]
+    assert borongan_events.subscriber_count() == 0
+
+
+def test_borongan_events_listener_publishes_snapshots_once_listening():
+    """
+    Test that the listener signals readiness after LISTEN and pushes fresh
+    snapshots to existing subscribers, covering events missed while disconnected.
+    """
+    import asyncio
+    import os
+    from app.services.borongan_events import BoronganEventHub
+
+    read_fd, write_fd = os.pipe()
+
+    class FakeConnection:
+        autocommit = False
+        notifies = []
+
+        def cursor(self):
+            connection = self
+
+            class Cursor:
+                def __enter__(self):
+                    return self
+
+                def __exit__(self, *exc):
+                    return False
+
+                def execute(self, sql):
+                    connection.listened = sql
+
+            return Cursor()
+
+        def fileno(self):
+            return read_fd  # Tidak pernah readable: tidak ada NOTIFY
+
+        def poll(self):
+            pass
+
+        def close(self):
+            pass
+
+    fake_engine = MagicMock()
+    fake_engine.dialect.create_connect_args.return_value = ([], {})
+    fake_engine.dialect.connect.return_value = FakeConnection()
+
+    hub = BoronganEventHub()
+    group_buy_id = uuid.uuid4()
+    snapshot = {"id": str(group_buy_id), "current_quantity": 7, "target_quantity": 10,
+                "participants_count": 3, "status": "active", "version": 9}
+    fetched = []
+
+    def fetch_snapshots(ids):
+        fetched.append(ids)
+        return [snapshot]
+
+    async def scenario():
+        # Pelanggan yang sudah ada sebelum (re)connect, seperti saat koneksi LISTEN terputus
+        queue = hub.subscribe(group_buy_id)
+        assert not hub.wait_until_listening(0)
+        hub.start(fake_engine, fetch_snapshots)
+        assert await asyncio.to_thread(hub.wait_until_listening, 2)
+        received = await asyncio.wait_for(queue.get(), timeout=2)
+        hub.unsubscribe(group_buy_id, queue)
+        return received
+
+    try:
+        assert asyncio.run(scenario()) == snapshot
+        assert fetched == [[group_buy_id]]
+        assert fake_engine.dialect.connect.return_value.listened == "LISTEN borongan_events"
+    finally:
+        hub.stop()
+        os.close(write_fd)
+
+
+def test_repair_group_buy_totals_walks_primary_key_batches(fake_session):
+    """Test that the totals repair walks uuid keyset batches until the batch-end query returns NULL."""
+    from app.services import maintenance
+
+    ids = sorted(uuid.uuid4() for _ in range(3))
+    # Bergantian: query batch_end lalu UPDATE batch tersebut
+    fake_session.execute_results = [
+        FakeResult(rows=[(ids[1], 2)]), FakeResult(rowcount=1),
+        FakeResult(rows=[(ids[2], 1)]), FakeResult(rowcount=1),
+        FakeResult(rows=[(None, 0)]),
+    ]
+
+    result = maintenance.repair_group_buy_totals(fake_session.factory(), batch_size=2)
+
+    assert (result["batches"], result["repaired"]) == (2, 2)
+    updates = [params for params in fake_session.executed_params() if "batch_end" in params]
+    assert [(params["last_id"], params["batch_end"]) for params in updates] == [
+        (maintenance._NIL_UUID, ids[1]), (ids[1], ids[2])
+    ]
+
+
+def _borongan_create_data(**overrides):
+    from app.schemas.borongan import BoronganCreate
+
+    data = {
+        "title": "Beras 5kg", "price_per_unit": "60000.00", "unit": "karung", "target_quantity": 10,
+        "deadline": datetime.now() + timedelta(days=3), "pickup_point_address": "Balai RW 05",
+    }
+    return BoronganCreate(**{**data, **overrides})
+
+
+@pytest.mark.parametrize("coordinates, expect_profile_lookup", [({}, True), ({"pickup_latitude": -6.2}, True),
+                                                                 ({"pickup_latitude": -6.2, "pickup_longitude": 106.8}, False)])
+def test_create_borongan_pickup_location(fake_session, coordinates, expect_profile_lookup):
+    """Test that pickup_location uses both given coordinates, otherwise the supplier profile location."""
+    from types import SimpleNamespace
+    from app.models.profile import Profile
+    from app.routers.borongan import create_borongan
+
+    profile_location = object()
+    fake_session.scalar_value = profile_location
+
+    create_borongan(
+        _borongan_create_data(**coordinates), current_user=SimpleNamespace(id=str(uuid.uuid4())), db=fake_session
+    )
+
+    (created,) = fake_session.added
+    if expect_profile_lookup:
+        assert fake_session.queries == [(Profile.location,)]
+        assert created.pickup_location is profile_location
+    else:
+        assert fake_session.queries == []
+        assert created.pickup_location.desc == "POINT(106.8 -6.2)"
+        assert created.pickup_location.srid == 4326
+
+
+def test_borongan_nearby_cursor_round_trip():
+    """Test that a /borongan/nearby cursor decodes back to (distance, id) and rejects garbage."""
+    from fastapi import HTTPException
+    from app.core.pagination import encode_cursor
+    from app.routers.borongan import _decode_borongan_nearby_cursor
+
+    group_buy_id = uuid.uuid4()
+    assert _decode_borongan_nearby_cursor(encode_cursor([1234.5, str(group_buy_id)])) == (1234.5, group_buy_id)
+
+    with pytest.raises(HTTPException) as exc_info:
+        _decode_borongan_nearby_cursor(encode_cursor(["far", str(group_buy_id)]))
+    assert exc_info.value.status_code == 400
+
+
+def test_borongan_distance_only_in_nearby_schema():
+    """Test that distance is part of the nearby response only, not every borongan list."""
+    from app.schemas.borongan import BoronganSummarySchema, BoronganNearbySchema
+
+    assert "distance" not in BoronganSummarySchema.model_fields
+    assert BoronganNearbySchema.model_fields["distance"].is_required()
+
+
+def test_pickup_location_backfill_on_postgres(postgres_connection):
+    """
+    Test on Postgres that backfill 0012 fills missing pickup locations from the supplier
+    profile in batches, and leaves existing pickup locations and suppliers without a location alone.
+    """
+    from sqlalchemy import text
+    from app.core.migrations import BACKFILLS
+
+    # Tabel temporary menutupi tabel asli karena pg_temp dicari lebih dulu
+    postgres_connection.execute(text("CREATE TEMP TABLE profiles (id uuid PRIMARY KEY, location text) ON COMMIT DROP"))
+    postgres_connection.execute(text(
+        "CREATE TEMP TABLE group_buys (id uuid PRIMARY KEY, supplier_id uuid, pickup_location text) ON COMMIT DROP"
+    ))
+    supplier, supplier_without_location = uuid.uuid4(), uuid.uuid4()
+    postgres_connection.execute(
+        text("INSERT INTO profiles (id, location) VALUES (:id, :location)"),
+        [{"id": supplier, "location": "POINT(106.8 -6.2)"}, {"id": supplier_without_location, "location": None}],
+    )
+    missing = [uuid.uuid4() for _ in range(3)]
+    kept, unresolved = uuid.uuid4(), uuid.uuid4()
+    postgres_connection.execute(
+        text("INSERT INTO group_buys (id, supplier_id, pickup_location) VALUES (:id, :supplier_id, :pickup)"),
+        [{"id": group_buy_id, "supplier_id": supplier, "pickup": None} for group_buy_id in missing]
+        + [{"id": kept, "supplier_id": supplier, "pickup": "POINT(110.4 -7.0)"},
+           {"id": unresolved, "supplier_id": supplier_without_location, "pickup": None}],
+    )
+
+    statement = text(dict(BACKFILLS)["0012_backfill_group_buy_pickup_locations"])
+    assert [postgres_connection.execute(statement, {"batch_size": 2}).rowcount for _ in range(3)] == [2, 1, 0]
+
+    pickups = dict(postgres_connection.execute(text("SELECT id, pickup_location FROM group_buys")).all())
+    assert all(pickups[group_buy_id] == "POINT(106.8 -6.2)" for group_buy_id in missing)
+    assert pickups[kept] == "POINT(110.4 -7.0)"
+    assert pickups[unresolved] is None
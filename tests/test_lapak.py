@@ -9,7 +9,7 @@ from decimal import Decimal
 import uuid
 import json
 
-from tests.conftest import TestProfile, TestListing
+from tests.conftest import TestProfile, TestListing, FakeResult, FakeSession
 
 
 def test_analyze_image_success(authenticated_client: TestClient):
@@ -439,4 +439,1084 @@ def test_gemini_analysis_error_fallback(authenticated_client: TestClient):
 
     # When client is None, the function should raise ValueError which gets caught by router
     assert response.status_code == 500
-    assert "Gemini client is not initialized" in response.json()["detail"] 
\ No newline at end of file
+    assert "Gemini client is not initialized" in response.json()["detail"] 
+
+def test_nearby_cursor_roundtrip():
+    """
+    Test encoding and decoding of the keyset cursor used by /lapak/nearby.
+    """
+    from app.core.pagination import encode_cursor, decode_cursor
+
+    listing_id = str(uuid.uuid4())
+    cursor = encode_cursor([1234.5678, listing_id])
+
+    assert "=" not in cursor
+    assert decode_cursor(cursor, 2) == [1234.5678, listing_id]
+
+
+def test_nearby_cursor_invalid():
+    """
+    Test that malformed cursors are rejected with 400.
+    """
+    from fastapi import HTTPException
+    from app.core.pagination import encode_cursor, decode_cursor
+
+    with pytest.raises(HTTPException) as exc_info:
+        decode_cursor("not-a-valid-cursor!!", 2)
+    assert exc_info.value.status_code == 400
+
+    # Jumlah nilai tidak sesuai
+    with pytest.raises(HTTPException):
+        decode_cursor(encode_cursor([1.0]), 2)
+
+
+def test_nearby_cache_hit_miss_and_ttl():
+    """
+    Test LRU+TTL behaviour and hit/miss counters of the nearby cache.
+    """
+    from app.services.nearby_cache import NearbyCache
+
+    now = [0.0]
+    cache = NearbyCache(maxsize=2, ttl=30, precision=7, timer=lambda: now[0])
+    tile, bucket = cache.tile_key(-6.2, 106.816666, 4000)
+    assert bucket == 5000
+
+    key = (tile, bucket, 1, 12, None, "capped")
+    assert cache.get(key) is None
+    cache.set(key, {"lapak": []})
+    assert cache.get(key) == {"lapak": []}
+
+    now[0] = 31.0
+    assert cache.get(key) is None
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+
+
+def test_nearby_cache_invalidates_only_touching_tiles():
+    """
+    Test that a listing change only evicts tiles whose search area covers it.
+    """
+    from app.services.nearby_cache import NearbyCache
+
+    cache = NearbyCache(maxsize=16, ttl=30, precision=7)
+    jakarta_tile, bucket = cache.tile_key(-6.2, 106.816666, 1000)
+    bandung_tile, _ = cache.tile_key(-6.914744, 107.609810, 1000)
+    cache.set((jakarta_tile, bucket, 1, 12, None, "capped"), {"lapak": []})
+    cache.set((bandung_tile, bucket, 1, 12, None, "capped"), {"lapak": []})
+
+    removed = cache.invalidate_point(-6.2005, 106.8170)
+
+    assert removed == 1
+    assert cache.get((jakarta_tile, bucket, 1, 12, None, "capped")) is None
+    assert cache.get((bandung_tile, bucket, 1, 12, None, "capped")) is not None
+
+
+def test_spatial_index_query_sorted_within_radius():
+    """
+    Test that the in-memory spatial index filters by radius and sorts by distance.
+    """
+    from app.services.spatial_index import ListingSpatialIndex
+
+    index = ListingSpatialIndex(cell_degrees=0.01, initial_capacity=2)
+    near_id, mid_id, far_id = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    index.load([
+        (far_id, -6.30, 106.90, 5000),
+        (near_id, -6.2001, 106.8167, 10000),
+        (mid_id, -6.2100, 106.8200, 7500),
+    ])
+
+    ids, distances = index.query(-6.2, 106.816666, 3000)
+
+    assert ids == [near_id, mid_id]
+    assert distances[0] < distances[1] <= 3000
+
+
+def test_spatial_index_incremental_updates():
+    """
+    Test upsert (including moving between grid cells) and removal.
+    """
+    from app.services.spatial_index import ListingSpatialIndex
+
+    index = ListingSpatialIndex(cell_degrees=0.01)
+    listing_id = uuid.uuid4()
+
+    # Upsert diabaikan sebelum index dimuat
+    index.upsert(listing_id, -6.2, 106.8, 1000)
+    assert len(index) == 0
+
+    index.load([])
+    index.upsert(listing_id, -6.2, 106.8, 1000)
+    assert index.query(-6.2, 106.8, 100)[0] == [listing_id]
+
+    index.upsert(listing_id, -6.9, 107.6, 1000)
+    assert index.query(-6.2, 106.8, 100)[0] == []
+    assert index.query(-6.9, 107.6, 100)[0] == [listing_id]
+
+    index.remove(listing_id)
+    assert len(index) == 0
+    assert index.query(-6.9, 107.6, 100)[0] == []
+
+
+def test_spatial_index_resyncs_in_background_once():
+    """
+    Test that a stale index keeps serving its snapshot while a single background resync runs.
+    """
+    import threading
+    from app.services.spatial_index import ListingSpatialIndex
+
+    index = ListingSpatialIndex(cell_degrees=0.01)
+    old_id, new_id = uuid.uuid4(), uuid.uuid4()
+    index.load([(old_id, -6.2, 106.8, 1000)])
+    index.last_sync -= 10 ** 6
+
+    started, release = threading.Event(), threading.Event()
+    sync_calls = []
+
+    def slow_sync(db):
+        sync_calls.append(db)
+        started.set()
+        release.wait(5)
+        return index.load([(new_id, -6.2, 106.8, 1000)])
+
+    index.sync_from_db = slow_sync
+    index.sync_if_stale(None, MagicMock)
+    assert started.wait(5)
+    index.sync_if_stale(None, MagicMock)
+
+    # Request tidak menunggu: snapshot lama tetap dipakai selama resync berjalan
+    assert index.query(-6.2, 106.8, 100)[0] == [old_id]
+    assert len(sync_calls) == 1
+
+    release.set()
+    assert index._sync_lock.acquire(timeout=5)
+    index._sync_lock.release()
+    assert index.query(-6.2, 106.8, 100)[0] == [new_id]
+
+
+def test_get_lapak_clusters_invalid_bbox(client: TestClient):
+    """
+    Test that the clusters endpoint rejects malformed or inverted viewports.
+    """
+    response = client.get("/lapak/clusters?bbox=106.7,-6.3,106.9&zoom=12")
+    assert response.status_code == 400
+
+    response = client.get("/lapak/clusters?bbox=106.9,-6.1,106.7,-6.3&zoom=12")
+    assert response.status_code == 400
+    assert "Invalid bbox" in response.json()["detail"]
+
+
+def test_search_lapak_requires_keyword(client: TestClient):
+    """
+    Test that /lapak/search validates the keyword before touching the database.
+    """
+    response = client.get("/lapak/search?q=a&lat=-6.2&lon=106.81")
+    assert response.status_code == 422
+
+
+def test_build_nearby_facets_histogram():
+    """
+    Test conversion of the facet JSON returned by Postgres into response buckets.
+    """
+    from app.routers.lapak import _build_nearby_facets
+
+    facets = _build_nearby_facets({
+        "units": {"kg": 3, "ikat": 1},
+        "low": 1000,
+        "high": 4999.99,
+        "histogram": [[5, 1], [1, 3]]
+    })
+
+    assert facets["units"] == {"kg": 3, "ikat": 1}
+    assert [bucket["count"] for bucket in facets["price_histogram"]] == [3, 1]
+    assert facets["price_histogram"][0]["lower"] == Decimal("1000.00")
+    assert facets["price_histogram"][0]["upper"] == Decimal("1800.00")
+    assert facets["price_histogram"][1]["upper"] == Decimal("5000.00")
+
+    assert _build_nearby_facets({"units": None, "low": None, "high": None, "histogram": None}) == {
+        "units": {},
+        "price_histogram": []
+    }
+
+
+def test_get_lapak_batch_invalid_ids(client: TestClient):
+    """
+    Test that the batch endpoint rejects malformed ids and oversized batches.
+    """
+    response = client.get("/lapak/batch?ids=not-a-uuid")
+    assert response.status_code == 400
+    assert "Invalid listing id" in response.json()["detail"]
+
+    too_many = ",".join(str(uuid.uuid4()) for _ in range(101))
+    response = client.get(f"/lapak/batch?ids={too_many}")
+    assert response.status_code == 400
+    assert "maximum of 100" in response.json()["detail"]
+
+
+def test_lapak_row_to_dict_matches_schema():
+    """
+    Test that a projected listing row maps to a valid LapakSchema payload.
+    """
+    from collections import namedtuple
+    from datetime import datetime, timezone
+    from app.routers.lapak import LAPAK_COLUMNS, _lapak_row_to_dict
+    from app.schemas.lapak import LapakSchema
+
+    Row = namedtuple("Row", [column.key for column in LAPAK_COLUMNS])
+    seller_id = uuid.uuid4()
+    row = Row(
+        id=uuid.uuid4(), seller_id=seller_id, title="Bayam", description=None,
+        price=Decimal("5000.00"), unit="ikat", stock_quantity=3, image_urls=None,
+        status="available", created_at=datetime.now(timezone.utc), updated_at=None,
+        longitude=106.81, latitude=-6.2, seller_full_name="Bu Sari"
+    )
+
+    lapak = LapakSchema.model_validate(_lapak_row_to_dict(row, distance=12.5))
+
+    assert lapak.seller.id == seller_id
+    assert lapak.seller.full_name == "Bu Sari"
+    assert lapak.latitude == -6.2
+    assert lapak.distance == 12.5
+
+
+def test_etag_matching():
+    """
+    Test ETag generation and If-None-Match comparison used by the detail endpoints.
+    """
+    from datetime import datetime, timezone
+    from app.core.etag import make_etag, etag_matches
+
+    etag = make_etag(datetime(2024, 1, 1, tzinfo=timezone.utc))
+    assert etag == '"1704067200000000"'
+    assert make_etag(3) == '"3"'
+
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"stale", W/{etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"1704067200000001"', etag)
+    assert not etag_matches(None, etag)
+
+
+def test_get_my_lapak_summary_empty(authenticated_client: TestClient):
+    """
+    Test that the seller summary returns zeroed counts for a seller without listings.
+    """
+    response = authenticated_client.get("/lapak/my/summary")
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["counts"] == {"available": 0, "sold_out": 0, "inactive": 0}
+    assert data["total"] == 0
+    assert data["last_updated_at"] is None
+
+
+def test_get_my_lapak_invalid_cursor(authenticated_client: TestClient):
+    """
+    Test that /lapak/my rejects a malformed keyset cursor.
+    """
+    from app.core.pagination import encode_cursor
+
+    response = authenticated_client.get(f"/lapak/my?cursor={encode_cursor(['yesterday', 'abc'])}")
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+def test_reserve_lapak_validation(authenticated_client: TestClient):
+    """
+    Test that reserving requires a positive quantity and an existing lapak.
+    """
+    response = authenticated_client.post(f"/lapak/{uuid.uuid4()}/reserve", json={"quantity": 0})
+    assert response.status_code == 422
+
+    response = authenticated_client.post(f"/lapak/{uuid.uuid4()}/reserve", json={"quantity": 1})
+    assert response.status_code == 404
+    assert "Lapak not found" in response.json()["detail"]
+
+
+def test_import_lapak_rejects_empty_and_oversized(authenticated_client: TestClient):
+    """
+    Test that bulk import validates the batch size before touching the database.
+    """
+    response = authenticated_client.post("/lapak/bulk", json={"rows": []})
+    assert response.status_code == 400
+    assert "No rows" in response.json()["detail"]
+
+    response = authenticated_client.post("/lapak/bulk", json={"rows": [{}] * 5001})
+    assert response.status_code == 400
+    assert "maximum of 5000" in response.json()["detail"]
+
+
+def test_import_rows_validation_errors_by_row():
+    """
+    Test that bulk import validation pinpoints the failing row index.
+    """
+    from app.routers.lapak import _import_rows_adapter
+    from pydantic import ValidationError
+
+    rows = [
+        {"title": "Bayam", "price": "5000", "unit": "ikat", "stock_quantity": 3},
+        {"title": "Kangkung", "price": "-1", "unit": "ikat", "stock_quantity": 3, "latitude": 91},
+    ]
+    with pytest.raises(ValidationError) as exc_info:
+        _import_rows_adapter.validate_python(rows)
+
+    errors = exc_info.value.errors()
+    assert {error["loc"][0] for error in errors} == {1}
+    assert {error["loc"][1] for error in errors} == {"price", "latitude"}
+
+
+def test_debug_locations_invalid_cursor(client: TestClient):
+    """
+    Test that the paginated location audit rejects a malformed cursor.
+    """
+    response = client.get("/lapak/debug/locations?cursor=not-a-cursor")
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+def test_hyperloglog_estimate_and_merge():
+    """
+    Test that the HyperLogLog sketch estimates unique viewers within a few percent.
+    """
+    from app.services.view_counter import HyperLogLog
+
+    first, second = HyperLogLog(), HyperLogLog()
+    for i in range(3000):
+        first.add(f"user:{i}")
+    for i in range(2000, 5000):
+        second.add(f"user:{i}")
+    # Viewer yang sama tidak menambah hitungan
+    for i in range(100):
+        first.add("user:0")
+
+    assert abs(first.count() - 3000) / 3000 < 0.1
+    restored = HyperLogLog.from_bytes(first.to_bytes())
+    restored.merge(second)
+    assert abs(restored.count() - 5000) / 5000 < 0.1
+
+    small = HyperLogLog()
+    for i in range(10):
+        small.add(f"anon:{i}")
+    assert small.count() == 10
+
+
+def test_view_counter_buffers_until_flush():
+    """
+    Test that views are buffered in memory and restored when a flush fails.
+    """
+    from app.services.view_counter import ViewCounterBuffer
+
+    buffer = ViewCounterBuffer(flush_interval=60)
+    listing_id = uuid.uuid4()
+    buffer.record(listing_id, "user:a")
+    buffer.record(listing_id, "user:a")
+    buffer.record(listing_id, "user:b")
+
+    count, sketches = buffer.pending(listing_id)
+    assert count == 3
+    assert [sketch.count() for sketch in sketches.values()] == [2]
+
+    def failing_session():
+        raise RuntimeError("database down")
+
+    with pytest.raises(RuntimeError):
+        buffer.flush(failing_session)
+    assert buffer.pending(listing_id)[0] == 3
+
+
+def test_view_counter_flush_writes_in_one_transaction(fake_session):
+    """
+    Test that a flush writes all buffered views in one committed session and empties the buffer.
+    """
+    from app.services.view_counter import ViewCounterBuffer
+
+    buffer = ViewCounterBuffer(flush_interval=60)
+    listing_id = uuid.uuid4()
+    buffer.record(listing_id, "user:a")
+    buffer.record(listing_id, "user:b")
+
+    assert buffer.flush(fake_session.factory()) == 2
+    assert fake_session.commits == 1
+    assert fake_session.closed
+    assert buffer.pending(listing_id)[0] == 0
+
+
+def test_view_counter_flush_keeps_etag_on_postgres(postgres_connection):
+    """
+    Test on Postgres that writing view counts leaves updated_at, and so the ETag, unchanged.
+    """
+    from sqlalchemy import text
+    from app.core.etag import make_etag
+    from app.services.view_counter import _write_counts
+
+    postgres_connection.execute(text(
+        "CREATE TEMP TABLE listings (id uuid PRIMARY KEY, view_count integer NOT NULL DEFAULT 0, "
+        "updated_at timestamptz) ON COMMIT DROP"
+    ))
+    listing_id = uuid.uuid4()
+    postgres_connection.execute(
+        text("INSERT INTO listings (id, updated_at) VALUES (:id, now() - interval '1 day')"), {"id": listing_id}
+    )
+    select_row = text("SELECT view_count, updated_at FROM listings WHERE id = :id")
+    before = postgres_connection.execute(select_row, {"id": listing_id}).one()
+
+    _write_counts(postgres_connection, {listing_id: 3})
+
+    after = postgres_connection.execute(select_row, {"id": listing_id}).one()
+    assert after.view_count == 3
+    assert make_etag(after.updated_at) == make_etag(before.updated_at)
+
+
+def test_archive_columns_match_models():
+    """
+    Test that every column moved by the archive job exists on both tables.
+    """
+    from app.models.listing import Listing, ListingArchive
+    from app.services.maintenance import ARCHIVE_COLUMNS
+
+    listing_columns = set(Listing.__table__.columns.keys())
+    archive_columns = set(ListingArchive.__table__.columns.keys())
+    assert set(ARCHIVE_COLUMNS) <= listing_columns
+    assert set(ARCHIVE_COLUMNS) <= archive_columns
+    # Selain kolom yang sengaja tidak diarsipkan, arsip memuat semua kolom listings
+    assert listing_columns - set(ARCHIVE_COLUMNS) == {"search_vector", "rank_score"}
+    assert archive_columns - set(ARCHIVE_COLUMNS) == {"archived_at"}
+
+
+def test_archive_endpoint_uses_configured_age(client: TestClient, monkeypatch):
+    """
+    Test that the unauthenticated archive trigger ignores a caller-supplied age.
+    """
+    from app.core.config import settings
+    from app.services import maintenance
+
+    archive_job = MagicMock(return_value={})
+    monkeypatch.setattr(maintenance, "archive_stale_listings", archive_job)
+
+    response = client.post("/lapak/internal/archive-stale?stale_days=1")
+
+    assert response.status_code == 200
+    assert response.json()["stale_days"] == settings.LISTING_ARCHIVE_AFTER_DAYS
+    assert archive_job.call_args.args[1] == settings.LISTING_ARCHIVE_AFTER_DAYS
+
+
+def _create_archive_tables(connection):
+    """Tabel temporary listings dan listings_archive dengan kolom ARCHIVE_COLUMNS (location sebagai text)."""
+    from sqlalchemy import text
+
+    columns = (
+        "id uuid PRIMARY KEY, seller_id uuid, title text, description text, price numeric, "
+        "unit text, stock_quantity integer, image_urls text[], status text, location text, "
+        "longitude double precision, latitude double precision, view_count integer DEFAULT 0, "
+        "created_at timestamptz, updated_at timestamptz"
+    )
+    for table in ("listings", "listings_archive"):
+        connection.execute(text(f"CREATE TEMP TABLE {table} ({columns}) ON COMMIT DROP"))
+
+
+def _insert_archive_listing(connection, table, status, age_days, seller_id=None):
+    from sqlalchemy import text
+
+    listing_id = uuid.uuid4()
+    connection.execute(
+        text(
+            f"INSERT INTO {table} (id, seller_id, title, price, unit, stock_quantity, status, created_at, updated_at) "
+            "VALUES (:id, :seller_id, 'Lapak', 1000, 'kg', 2, :status, "
+            "now() - make_interval(days => :age), now() - make_interval(days => :age))"
+        ),
+        {"id": listing_id, "seller_id": seller_id, "status": status, "age": age_days},
+    )
+    return listing_id
+
+
+def test_archive_stale_listings_moves_only_old_inactive_on_postgres(postgres_connection, postgres_session_factory):
+    """
+    Test on Postgres that only inactive listings older than stale_days are archived;
+    sold_out and recently updated listings stay in listings.
+    """
+    from sqlalchemy import text
+    from app.services.maintenance import archive_stale_listings
+
+    _create_archive_tables(postgres_connection)
+    old_inactive = [_insert_archive_listing(postgres_connection, "listings", "inactive", 200) for _ in range(3)]
+    old_sold_out = _insert_archive_listing(postgres_connection, "listings", "sold_out", 200)
+    new_inactive = _insert_archive_listing(postgres_connection, "listings", "inactive", 1)
+
+    result = archive_stale_listings(postgres_session_factory, stale_days=90, batch_size=2)
+
+    assert (result["archived"], result["batches"]) == (3, 2)
+    archived = set(postgres_connection.execute(text("SELECT id FROM listings_archive")).scalars())
+    remaining = set(postgres_connection.execute(text("SELECT id FROM listings")).scalars())
+    assert archived == set(old_inactive)
+    assert remaining == {old_sold_out, new_inactive}
+
+
+def test_restore_sold_out_backfill_on_postgres(postgres_connection):
+    """
+    Test on Postgres that the 0014 backfill moves archived sold_out listings back
+    into listings and leaves archived inactive listings alone.
+    """
+    from sqlalchemy import text
+    from app.core.migrations import BACKFILLS
+
+    _create_archive_tables(postgres_connection)
+    sold_out = _insert_archive_listing(postgres_connection, "listings_archive", "sold_out", 200)
+    inactive = _insert_archive_listing(postgres_connection, "listings_archive", "inactive", 200)
+
+    statement = text(dict(BACKFILLS)["0014_backfill_restore_sold_out_listings"])
+    assert postgres_connection.execute(statement, {"batch_size": 10}).rowcount == 1
+    assert postgres_connection.execute(statement, {"batch_size": 10}).rowcount == 0
+
+    assert list(postgres_connection.execute(text("SELECT id FROM listings")).scalars()) == [sold_out]
+    assert list(postgres_connection.execute(text("SELECT id FROM listings_archive")).scalars()) == [inactive]
+
+
+def test_restore_archived_listing_on_postgres(postgres_connection):
+    """
+    Test on Postgres that a single archived listing is moved back into listings.
+    """
+    from sqlalchemy import text
+    from sqlalchemy.orm import Session
+    from app.services.maintenance import restore_archived_listing
+
+    _create_archive_tables(postgres_connection)
+    restored = _insert_archive_listing(postgres_connection, "listings_archive", "inactive", 200)
+    other = _insert_archive_listing(postgres_connection, "listings_archive", "inactive", 200)
+
+    db = Session(bind=postgres_connection)
+    assert restore_archived_listing(db, restored)
+    assert not restore_archived_listing(db, restored)
+
+    assert list(postgres_connection.execute(text("SELECT id FROM listings")).scalars()) == [restored]
+    assert list(postgres_connection.execute(text("SELECT id FROM listings_archive")).scalars()) == [other]
+
+
+def test_my_lapak_and_summary_include_archived_on_postgres(postgres_connection):
+    """
+    Test on Postgres that /lapak/my pages through live and archived listings of the
+    seller, and that the seller summary counts archived listings too.
+    """
+    from types import SimpleNamespace
+    from sqlalchemy import text
+    from sqlalchemy.orm import Session
+    from app.routers.lapak import get_my_lapak, get_my_lapak_summary
+
+    _create_archive_tables(postgres_connection)
+    postgres_connection.execute(text(
+        "CREATE TEMP TABLE profiles (id uuid PRIMARY KEY, full_name text) ON COMMIT DROP"
+    ))
+    seller_id, other_seller_id = uuid.uuid4(), uuid.uuid4()
+    postgres_connection.execute(
+        text("INSERT INTO profiles (id, full_name) VALUES (:id, 'Penjual')"),
+        [{"id": seller_id}, {"id": other_seller_id}],
+    )
+    live = _insert_archive_listing(postgres_connection, "listings", "available", 1, seller_id)
+    archived = _insert_archive_listing(postgres_connection, "listings_archive", "inactive", 200, seller_id)
+    _insert_archive_listing(postgres_connection, "listings_archive", "inactive", 200, other_seller_id)
+
+    db = Session(bind=postgres_connection)
+    current_user = SimpleNamespace(id=str(seller_id))
+    first = get_my_lapak(page=1, limit=1, status=None, cursor=None, db=db, current_user=current_user)
+    second = get_my_lapak(
+        page=1, limit=1, status=None, cursor=first["next_cursor"], db=db, current_user=current_user
+    )
+    assert first["total"] == 2
+    assert [item["id"] for item in first["lapak"] + second["lapak"]] == [live, archived]
+    assert second["has_more"] is False
+
+    inactive = get_my_lapak(page=1, limit=12, status="inactive", cursor=None, db=db, current_user=current_user)
+    assert [item["id"] for item in inactive["lapak"]] == [archived]
+
+    summary = get_my_lapak_summary(db=db, current_user=current_user)
+    assert summary["counts"] == {"available": 1, "sold_out": 0, "inactive": 1}
+    assert summary["total"] == 2
+    assert summary["total_stock_value"] == Decimal("2000")
+
+
+def test_update_lapak_restores_archived_listing(fake_session):
+    """
+    Test that updating an archived listing restores it into listings before applying
+    the update, and that only its owner can do so.
+    """
+    from types import SimpleNamespace
+    from fastapi import HTTPException
+    from app.routers.lapak import update_lapak
+    from app.schemas.lapak import LapakUpdate
+
+    seller_id, listing_id = uuid.uuid4(), uuid.uuid4()
+    restored = SimpleNamespace(id=listing_id, seller_id=seller_id, status="inactive", latitude=None, longitude=None)
+    fake_session.scalar_value = seller_id  # seller_id di listings_archive
+
+    with pytest.raises(HTTPException) as exc_info:
+        update_lapak(
+            listing_id, LapakUpdate(status="available"), db=fake_session,
+            current_user=SimpleNamespace(id=str(uuid.uuid4()))
+        )
+    assert exc_info.value.status_code == 403
+    assert fake_session.executed_params() == []
+
+    # Belum ada di listings, lalu ditemukan setelah dipulihkan dari arsip
+    fake_session.first_results = [None, restored]
+    fake_session.execute_results = [FakeResult(rowcount=1)]
+    listing = update_lapak(
+        listing_id, LapakUpdate(status="available"), db=fake_session, current_user=SimpleNamespace(id=str(seller_id))
+    )
+
+    assert listing is restored
+    assert listing.status == "available"
+    assert fake_session.executed_params() == [{"listing_id": listing_id}]
+    assert fake_session.commits == 1
+
+
+@pytest.mark.parametrize("count_mode, expected_total", [("none", None), ("capped", 3), ("exact", 3)])
+def test_get_lapak_nearby_count_mode(fake_db_client, monkeypatch, count_mode, expected_total):
+    """
+    Test that count_mode=none skips counting while capped/exact return a number.
+    """
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "NEARBY_CACHE_ENABLED", False)
+    client, fake_db = fake_db_client
+
+    response = client.get("/lapak/nearby", params={"lat": -6.2, "lon": 106.8, "count_mode": count_mode})
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total"] == expected_total
+    assert data["has_more"] is False
+    # Query halaman selalu dijalankan; none tidak menambah query hitung
+    assert len(fake_db.queries) == (1 if count_mode == "none" else 2 if count_mode == "exact" else 3)
+
+
+def _listing_row(lat, lon, rank_score=1.0, distance=None):
+    """Baris palsu dengan kolom _lapak_query (dan kolom kandidat cache) untuk FakeSession."""
+    from types import SimpleNamespace
+    from datetime import datetime, timezone
+
+    listing_id = uuid.uuid4()
+    return SimpleNamespace(
+        id=listing_id, seller_id=listing_id, title="Tomat", description=None, price=Decimal("10000"),
+        unit="kg", stock_quantity=1, image_urls=[], status="available",
+        created_at=datetime.now(timezone.utc), updated_at=datetime.now(timezone.utc),
+        latitude=lat, longitude=lon, rank_score=rank_score, distance=distance, seller_full_name="Penjual"
+    )
+
+
+def test_get_lapak_nearby_cache_uses_real_point(fake_db_client, monkeypatch):
+    """
+    Test that two users in the same cache tile share cached candidates but each
+    get their own radius filter and distances.
+    """
+    from app.core.config import settings
+    from app.routers import lapak as lapak_router
+    from app.services.nearby_cache import NearbyCache
+
+    cache = NearbyCache(maxsize=16, ttl=30, precision=7)
+    monkeypatch.setattr(settings, "NEARBY_CACHE_ENABLED", True)
+    monkeypatch.setattr(lapak_router, "nearby_cache", cache)
+    client, fake_db = fake_db_client
+
+    # Dua titik di tepi atas dan bawah tile geohash yang sama; lapak ~990m di utara titik pertama
+    from app.core.geo import geohash_bounds, geohash_encode
+    min_lat, min_lon, max_lat, max_lon = geohash_bounds(geohash_encode(-6.2, 106.8166, 7))
+    center_lon = (min_lon + max_lon) / 2
+    first_point = (max_lat - 0.00005, center_lon)
+    second_point = (min_lat + 0.00005, center_lon)
+    assert cache.tile_key(*first_point, 1000) == cache.tile_key(*second_point, 1000)
+    listing = _listing_row(first_point[0] + 0.0089, center_lon)
+    fake_db.rows = [listing]
+
+    first = client.get("/lapak/nearby", params={"lat": first_point[0], "lon": first_point[1], "radius": 1000})
+    queries_after_first = len(fake_db.queries)
+    second = client.get("/lapak/nearby", params={"lat": second_point[0], "lon": second_point[1], "radius": 1000})
+
+    assert first.status_code == 200 and second.status_code == 200
+    assert [item["id"] for item in first.json()["lapak"]] == [str(listing.id)]
+    assert first.json()["lapak"][0]["distance"] == pytest.approx(991, abs=5)
+    # Titik kedua ~1130m dari lapak: di luar radius asli meski masih di dalam area kandidat tile
+    assert second.json()["lapak"] == []
+    assert second.json()["total"] == 0
+    # Permintaan kedua memakai kandidat dari cache: tidak ada query kandidat maupun hitung
+    assert len(fake_db.queries) == queries_after_first
+    assert cache.stats()["hits"] == 1
+
+
+def test_search_lapak_filters_by_full_text_and_radius(fake_db_client):
+    """
+    Test that /lapak/search filters on the search_vector full-text match and ST_DWithin radius.
+    """
+    from sqlalchemy.dialects import postgresql
+
+    client, fake_db = fake_db_client
+
+    response = client.get("/lapak/search", params={"q": "tomat", "lat": -6.2, "lon": 106.8, "radius": 2000})
+
+    assert response.status_code == 200
+    assert response.json()["lapak"] == []
+    filters = [
+        str(condition.compile(dialect=postgresql.dialect()))
+        for name, args in fake_db.calls if name == "filter"
+        for condition in args
+    ]
+    assert any("listings.search_vector @@ websearch_to_tsquery" in sql for sql in filters)
+    assert any("ST_DWithin(listings.location" in sql for sql in filters)
+
+
+@pytest.mark.parametrize("raw_facets, expected_units", [(None, {}), ({"units": {"kg": 2}, "low": 1000, "high": 2000, "histogram": [[1, 2]]}, {"kg": 2})])
+def test_get_lapak_nearby_facets_on_empty_later_page(fake_db_client, monkeypatch, raw_facets, expected_units):
+    """
+    Test that a page past the last result still returns facets of all matches instead of null.
+    """
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "NEARBY_CACHE_ENABLED", False)
+    client, fake_db = fake_db_client
+    fake_db.scalar_value = raw_facets
+
+    response = client.get("/lapak/nearby", params={"lat": -6.2, "lon": 106.8, "page": 3, "include_facets": True})
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["lapak"] == []
+    assert data["facets"]["units"] == expected_units
+    assert isinstance(data["facets"]["price_histogram"], list)
+    assert data["total"] == sum(expected_units.values())
+
+
+def test_import_lapak_rows_mixed_valid_and_invalid():
+    """
+    Test that valid rows are inserted (with the profile location as fallback)
+    while invalid rows are reported with their 1-based row number.
+    """
+    from types import SimpleNamespace
+    from app.routers.lapak import _import_lapak_rows
+
+    seller_id = uuid.uuid4()
+    fake_db = FakeSession(rows=[SimpleNamespace(id=seller_id, latitude=-6.2, longitude=106.8)])
+    rows = [
+        {"title": "Bayam", "price": "5000", "unit": "ikat", "stock_quantity": 3, "latitude": -6.3, "longitude": 106.9},
+        {"title": "Kangkung", "price": "-1", "unit": "ikat", "stock_quantity": 3},
+        {"price": "4000", "unit": "ikat", "stock_quantity": 1},
+        {"title": "Tomat", "price": "12000", "unit": "kg", "stock_quantity": 5},
+    ]
+
+    result = _import_lapak_rows(fake_db, SimpleNamespace(id=str(seller_id)), rows)
+
+    assert result["created"] == 2
+    assert [error["row"] for error in result["errors"]] == [2, 3]
+    assert result["errors"][0]["errors"][0].startswith("price:")
+    assert result["errors"][1]["errors"][0].startswith("title:")
+
+    inserted = [value for name, args in fake_db.calls if name == "execute" for value in args[1]]
+    assert [value["title"] for value in inserted] == ["Bayam", "Tomat"]
+    assert inserted[0]["location"] == "SRID=4326;POINT(106.9 -6.3)"
+    # Baris tanpa koordinat memakai lokasi profil penjual
+    assert inserted[1]["location"] == "SRID=4326;POINT(106.8 -6.2)"
+    assert all(value["seller_id"] == seller_id for value in inserted)
+
+
+def test_import_lapak_rows_rejects_when_nothing_valid():
+    """
+    Test that an import where every row is invalid fails with 422 instead of 201 created=0.
+    """
+    from types import SimpleNamespace
+    from fastapi import HTTPException
+    from app.routers.lapak import _import_lapak_rows
+
+    seller_id = uuid.uuid4()
+    # Profil tanpa lokasi: baris tanpa koordinat juga ditolak
+    fake_db = FakeSession(rows=[SimpleNamespace(id=seller_id, latitude=None, longitude=None)])
+    rows = [
+        {"title": "Kangkung", "price": "0", "unit": "ikat", "stock_quantity": 3},
+        {"title": "Tomat", "price": "12000", "unit": "kg", "stock_quantity": 5},
+    ]
+
+    with pytest.raises(HTTPException) as exc_info:
+        _import_lapak_rows(fake_db, SimpleNamespace(id=seller_id), rows)
+
+    assert exc_info.value.status_code == 422
+    assert [error["row"] for error in exc_info.value.detail["errors"]] == [1, 2]
+    assert exc_info.value.detail["errors"][1]["errors"][0].startswith("location:")
+    assert not [call for call in fake_db.calls if call[0] == "execute"]
+
+
+@pytest.mark.parametrize("table", ["profiles", "listings", "group_buys"])
+def test_maintenance_batch_end_query_on_postgres(postgres_connection, table):
+    """
+    Test that the batch-end query returns the last uuid of each primary key batch on Postgres.
+    """
+    from sqlalchemy import text
+    from app.services.maintenance import _BATCH_END_QUERIES, _NIL_UUID
+
+    # Tabel temporary menutupi tabel asli karena pg_temp dicari lebih dulu
+    postgres_connection.execute(text(f"CREATE TEMP TABLE {table} (id uuid PRIMARY KEY) ON COMMIT DROP"))
+    ids = sorted(uuid.uuid4() for _ in range(5))
+    postgres_connection.execute(text(f"INSERT INTO {table} (id) VALUES (:id)"), [{"id": i} for i in ids])
+
+    query = text(_BATCH_END_QUERIES[table])
+    assert tuple(postgres_connection.execute(query, {"last_id": _NIL_UUID, "batch_size": 3}).one()) == (ids[2], 3)
+    assert tuple(postgres_connection.execute(query, {"last_id": ids[2], "batch_size": 3}).one()) == (ids[4], 2)
+    assert tuple(postgres_connection.execute(query, {"last_id": ids[4], "batch_size": 3}).one()) == (None, 0)
+
+
+def test_location_backfill_skips_when_already_running(fake_session):
+    """
+    Test that a second location backfill returns already_running without touching any batch.
+    """
+    from app.services import maintenance
+
+    # pg_try_advisory_lock gagal karena lock dipegang run lain
+    fake_session.execute_results = [FakeResult(rows=[(False,)])]
+
+    result = maintenance.run_location_backfill(fake_session.factory(), default_lat=-6.2, default_lon=106.8)
+
+    assert result == {"job_name": maintenance.LOCATION_BACKFILL_JOB, "status": "already_running"}
+    assert len(fake_session.executed_params()) == 1
+    assert fake_session.commits == 0
+    assert fake_session.closed
+
+
+def test_location_backfill_advisory_lock_on_postgres(postgres_connection):
+    """
+    Test on Postgres that the backfill reports already_running while another
+    session holds the job's advisory lock.
+    """
+    from sqlalchemy import text
+    from sqlalchemy.orm import sessionmaker
+    from app.services import maintenance
+
+    lock = text("SELECT pg_advisory_lock(hashtext(:job_name))")
+    unlock = text("SELECT pg_advisory_unlock(hashtext(:job_name))")
+    params = {"job_name": maintenance.LOCATION_BACKFILL_JOB}
+    with postgres_connection.engine.connect() as holder:
+        holder.execute(lock, params)
+        try:
+            result = maintenance.run_location_backfill(
+                sessionmaker(bind=postgres_connection.engine), default_lat=-6.2, default_lon=106.8
+            )
+        finally:
+            holder.execute(unlock, params)
+            holder.commit()
+
+    assert result["status"] == "already_running"
+
+
+def test_refresh_rank_scores_walks_primary_key_batches(fake_session):
+    """
+    Test that the rank refresh walks keyset batches until the batch-end query returns NULL.
+    """
+    from app.services import maintenance
+
+    ids = sorted(uuid.uuid4() for _ in range(5))
+    # Bergantian: query batch_end lalu UPDATE batch tersebut
+    fake_session.execute_results = [
+        FakeResult(rows=[(ids[1], 2)]), FakeResult(rowcount=2),
+        FakeResult(rows=[(ids[3], 2)]), FakeResult(rowcount=2),
+        FakeResult(rows=[(ids[4], 1)]), FakeResult(rowcount=1),
+        FakeResult(rows=[(None, 0)]),
+    ]
+
+    result = maintenance.refresh_rank_scores(fake_session.factory(), batch_size=2)
+
+    assert (result["batches"], result["updated"]) == (3, 5)
+    updates = [params for params in fake_session.executed_params() if "batch_end" in params]
+    assert [(params["last_id"], params["batch_end"]) for params in updates] == [
+        (maintenance._NIL_UUID, ids[1]), (ids[1], ids[3]), (ids[3], ids[4])
+    ]
+    assert fake_session.commits == 3
+
+
+def test_get_lapak_nearby_cursor_stays_on_issuing_path(fake_db_client, monkeypatch):
+    """
+    Test that tile-cache pages chain through their cursor, and that a cursor is
+    never resumed on a path that measures distance differently.
+    """
+    from app.core.config import settings
+    from app.core.pagination import encode_cursor
+    from app.routers import lapak as lapak_router
+    from app.services.nearby_cache import NearbyCache
+
+    cache = NearbyCache(maxsize=16, ttl=30, precision=7)
+    monkeypatch.setattr(settings, "NEARBY_CACHE_ENABLED", True)
+    monkeypatch.setattr(lapak_router, "nearby_cache", cache)
+    client, fake_db = fake_db_client
+    near, far = _listing_row(-6.2010, 106.8), _listing_row(-6.2030, 106.8)
+    fake_db.rows = [far, near]
+    params = {"lat": -6.2, "lon": 106.8, "radius": 1000, "limit": 1}
+
+    first = client.get("/lapak/nearby", params=params).json()
+    second = client.get("/lapak/nearby", params={**params, "cursor": first["next_cursor"]}).json()
+    assert [item["id"] for item in first["lapak"] + second["lapak"]] == [str(near.id), str(far.id)]
+    assert second["has_more"] is False
+
+    # Cursor dari jalur tile tidak dilanjutkan oleh query SQL jika cache dimatikan
+    monkeypatch.setattr(settings, "NEARBY_CACHE_ENABLED", False)
+    response = client.get("/lapak/nearby", params={**params, "cursor": first["next_cursor"]})
+    assert response.status_code == 400
+
+    # Cursor dari jalur SQL tetap dilayani SQL walaupun cache aktif
+    monkeypatch.setattr(settings, "NEARBY_CACHE_ENABLED", True)
+    lookups = cache.stats()["hits"] + cache.stats()["misses"]
+    sql_cursor = encode_cursor([150.0, str(near.id), "sql"])
+    response = client.get("/lapak/nearby", params={**params, "cursor": sql_cursor, "count_mode": "none"})
+    assert response.status_code == 200
+    assert cache.stats()["hits"] + cache.stats()["misses"] == lookups
+
+    # Cursor lama tanpa jalur ditolak
+    response = client.get("/lapak/nearby", params={**params, "cursor": encode_cursor([150.0, str(near.id)])})
+    assert response.status_code == 400
+
+
+def test_get_lapak_nearby_ranked_pages_across_null_rank(fake_db_client, monkeypatch):
+    """
+    Test that ranked paging treats a listing without rank_score as rank 0 instead of
+    issuing a cursor that is rejected on the next page.
+    """
+    from app.core.config import settings
+    from app.core.pagination import decode_cursor
+    from app.routers import lapak as lapak_router
+    from app.services.nearby_cache import NearbyCache
+
+    client, fake_db = fake_db_client
+    unranked, low, high = (_listing_row(-6.2010, 106.8, rank_score=score) for score in (None, 0.5, 2.0))
+    params = {"lat": -6.2, "lon": 106.8, "radius": 1000, "limit": 1, "sort": "ranked"}
+
+    # Jalur SQL: baris terakhir halaman tanpa rank_score
+    monkeypatch.setattr(settings, "NEARBY_CACHE_ENABLED", False)
+    fake_db.rows = [unranked, low]
+    first = client.get("/lapak/nearby", params=params).json()
+    assert decode_cursor(first["next_cursor"], 3)[0] == 0
+    assert client.get("/lapak/nearby", params={**params, "cursor": first["next_cursor"]}).status_code == 200
+
+    # Jalur tile cache: NULL diurutkan sebagai 0, setelah semua skor positif
+    monkeypatch.setattr(settings, "NEARBY_CACHE_ENABLED", True)
+    monkeypatch.setattr(lapak_router, "nearby_cache", NearbyCache(maxsize=16, ttl=30, precision=7))
+    fake_db.rows = [unranked, low, high]
+    seen, cursor = [], None
+    while True:
+        response = client.get("/lapak/nearby", params={**params, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        data = response.json()
+        seen += [item["id"] for item in data["lapak"]]
+        cursor = data["next_cursor"]
+        if not cursor:
+            break
+    assert seen == [str(high.id), str(low.id), str(unranked.id)]
+
+
+def test_get_lapak_clusters_caps_cells_per_viewport(fake_db_client):
+    """
+    Test that a wide bbox at a deep zoom is rejected instead of returning an unbounded number of cells,
+    while a city-sized viewport at the same zoom is clustered.
+    """
+    client, fake_db = fake_db_client
+
+    # Seluruh Pulau Jawa pada zoom 16: ratusan ribu sel
+    response = client.get("/lapak/clusters", params={"bbox": "105.0,-8.8,114.6,-5.8", "zoom": 16})
+    assert response.status_code == 400
+    assert "too large for zoom 16" in response.json()["detail"]
+    assert fake_db.queries == []
+
+    response = client.get("/lapak/clusters", params={"bbox": "106.80,-6.21,106.82,-6.19", "zoom": 16})
+    assert response.status_code == 200
+    assert response.json()["clusters"] == []
+    assert len(fake_db.queries) == 1
+
+
+def test_coordinate_trigger_skips_unrelated_updates_on_postgres(postgres_connection):
+    """
+    Test on Postgres/PostGIS that the coordinate trigger fills longitude/latitude
+    when location changes but does not run for status-only updates.
+    """
+    from sqlalchemy import text
+    from app.core.migrations import MIGRATIONS
+
+    migrations = dict(MIGRATIONS)
+    for table in ("listings", "profiles"):
+        postgres_connection.execute(text(
+            f"CREATE TEMP TABLE {table} (id integer PRIMARY KEY, status text, location geography(POINT, 4326), "
+            "longitude double precision, latitude double precision) ON COMMIT DROP"
+        ))
+    # Fungsi trigger dari 0003, trigger dari 0015 (dibuat pada tabel temporary)
+    postgres_connection.execute(text(migrations["0003_coordinate_columns"][4]))
+    for statement in migrations["0015_coordinate_triggers_on_location_only"]:
+        postgres_connection.execute(text(statement))
+
+    select_row = text("SELECT longitude, latitude FROM listings WHERE id = 1")
+    postgres_connection.execute(text(
+        "INSERT INTO listings (id, status, location) VALUES (1, 'available', 'SRID=4326;POINT(106.8 -6.2)')"
+    ))
+    assert tuple(postgres_connection.execute(select_row).one()) == pytest.approx((106.8, -6.2))
+
+    # Kosongkan koordinat tanpa trigger; UPDATE status saja tidak boleh mengisinya lagi
+    postgres_connection.execute(text("ALTER TABLE listings DISABLE TRIGGER trg_listings_coordinates"))
+    postgres_connection.execute(text("UPDATE listings SET longitude = NULL, latitude = NULL"))
+    postgres_connection.execute(text("ALTER TABLE listings ENABLE TRIGGER trg_listings_coordinates"))
+    postgres_connection.execute(text("UPDATE listings SET status = 'sold_out'"))
+    assert tuple(postgres_connection.execute(select_row).one()) == (None, None)
+
+    postgres_connection.execute(text("UPDATE listings SET location = 'SRID=4326;POINT(107.6 -6.9)'"))
+    assert tuple(postgres_connection.execute(select_row).one()) == pytest.approx((107.6, -6.9))
+
+
+def test_stream_lapak_nearby_writes_one_json_object_per_line(fake_db_client, monkeypatch):
+    """
+    Test that /nearby/stream frames each listing as one NDJSON line, keeps the
+    order rows are read in, streams through execution options (yield_per) and closes its own session.
+    """
+    from app.routers import lapak as lapak_router
+
+    client, fake_db = fake_db_client
+    rows = [_listing_row(-6.2 - i * 0.001, 106.8, distance=100.0 * (i + 1)) for i in range(3)]
+    fake_db.rows = rows
+    closed = []
+    fake_db.close = lambda: closed.append(True)
+    monkeypatch.setattr(lapak_router, "SessionLocal", lambda: fake_db)
+
+    response = client.get("/lapak/nearby/stream", params={"lat": -6.2, "lon": 106.8, "radius": 10000})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert response.text.endswith("\n")
+    lines = response.text.split("\n")[:-1]
+    items = [json.loads(line) for line in lines]
+    assert [item["id"] for item in items] == [str(row.id) for row in rows]
+    assert [item["distance"] for item in items] == [100.0, 200.0, 300.0]
+    assert "execution_options" in [name for name, args in fake_db.calls]
+    assert closed
+
+
+@pytest.mark.parametrize("max_distance", [None, 3000])
+def test_get_lapak_nearby_knn_orders_by_distance_operator(fake_db_client, monkeypatch, max_distance):
+    """
+    Test that mode=knn returns a single page of k listings in index (<->) order,
+    only bounded by ST_DWithin when max_distance is given.
+    """
+    from sqlalchemy.dialects import postgresql
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "NEARBY_CACHE_ENABLED", False)
+    client, fake_db = fake_db_client
+    rows = [_listing_row(-6.2, 106.8 + i * 0.01, distance=1100.0 * i) for i in range(3)]
+    fake_db.rows = rows
+    params = {"lat": -6.2, "lon": 106.8, "mode": "knn", "k": 3}
+    if max_distance:
+        params["max_distance"] = max_distance
+
+    data = client.get("/lapak/nearby", params=params).json()
+
+    assert [item["id"] for item in data["lapak"]] == [str(row.id) for row in rows]
+    assert [item["distance"] for item in data["lapak"]] == [0.0, 1100.0, 2200.0]
+    assert data["limit"] == 3 and data["page"] == 1
+    assert data["has_more"] is False and data["next_cursor"] is None and data["total"] is None
+
+    def compiled(name):
+        return [str(arg.compile(dialect=postgresql.dialect())) for call, args in fake_db.calls if call == name for arg in args]
+
+    (order_by,) = compiled("order_by")
+    assert order_by.startswith("listings.location <-> ")
+    assert [args for call, args in fake_db.calls if call == "limit"] == [(3,)]
+    assert any("ST_DWithin" in condition for condition in compiled("filter")) == bool(max_distance)
+    # Satu query: tidak ada query hitung maupun halaman berikutnya
+    assert len(fake_db.queries) == 1